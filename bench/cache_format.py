@@ -0,0 +1,190 @@
+"""
+Сравнение форматов хранения кэша на синтетических записях — без сети.
+
+    python -m bench.cache_format --entries 100000
+
+Форматы:
+  json-old — common/cache.json как раньше: indent=2, готовый текст отчёта и полные ответы провайдеров;
+  json     — те же компактные записи, что хранятся сейчас, но в JSON с indent=2;
+  sqlite   — SQLiteCacheBackend;
+  log      — LogCacheBackend: кадры msgpack + zstd с дозаписью.
+Для каждого выводятся размер файла, время записи, время загрузки (открытие + индекс)
+и среднее время чтения случайной записи.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from utils.cache_backends import LogCacheBackend, SQLiteCacheBackend
+from utils.report import CheckRecord
+
+SAMPLE_READS = 2000
+VT_ENGINES = ("harmless", "malicious", "suspicious", "undetected", "timeout")
+
+
+# =========================
+#   ДАННЫЕ
+# =========================
+
+def _raw_results(i: int, rng: random.Random) -> dict:
+    """Ответы провайдеров примерно того вида, что возвращают сервисы"""
+    danger = rng.random() < 0.1
+    host = f"site{i}.example.com"
+    age_days = rng.randint(1, 5000)
+    return {
+        "google": {
+            "status": "danger" if danger else "clean",
+            "details": [
+                {"threatType": "SOCIAL_ENGINEERING", "platformType": "ANY_PLATFORM",
+                 "threat": {"url": f"https://{host}/"}, "cacheDuration": "300s", "threatEntryType": "URL"}
+            ] if danger else None,
+        },
+        "vt": {
+            "status": "danger" if danger else "clean",
+            "details": {name: rng.randint(0, 70) for name in VT_ENGINES},
+        },
+        "blacklist": {"status": "clean", "details": []},
+        "infra": {
+            # Тот же вид, что возвращает check_infrastructure
+            "hostname": host,
+            "is_https": True,
+            "ssl_info": {
+                "valid": True, "issued_to": host, "issued_by": "Let's Encrypt",
+                "valid_from": "2026-08-01 00:00:00", "valid_to": "2026-10-30 00:00:00",
+                "tls_version": "TLSv1.3", "cipher": "TLS_AES_256_GCM_SHA384", "days_left": rng.randint(1, 90),
+                "chain": {"issuer_cn": "R11", "ca_issuers": ["http://r11.i.lencr.org/"], "san_count": 2},
+            },
+            "ip_info": {
+                "ip": f"203.0.{i % 256}.{rng.randint(1, 254)}", "ips": [f"203.0.{i % 256}.1"], "cname": None,
+                "country": "Netherlands", "country_code": "NL", "org": "Example Hosting B.V.",
+                "asn": f"AS{rng.randint(1000, 65000)}", "source": "local",
+            },
+            "cdn": "Не используется или неизвестен",
+            "proxy_suspect": False,
+            "whois": {
+                "domain": "example.com", "registrar": "Example Registrar, Inc.",
+                "created": "2012-03-04 00:00:00+00:00", "expires": "2030-03-04 00:00:00+00:00",
+                "age_days": age_days, "age_years": age_days // 365,
+                "freshness": "✅ Старый (более года)", "risk": "Низкий", "days_left": rng.randint(100, 2000),
+            },
+        },
+        "link_analysis": {
+            "masked_domain": None, "is_punycode": False, "redirect_count": rng.randint(0, 3),
+            "tracking_params": [], "risk_flags": [], "internal_links": rng.randint(0, 200),
+            "external_links": rng.randint(0, 50), "iframe_count": rng.randint(0, 3), "truncated": False,
+        },
+    }
+
+
+def generate(count: int, seed: int = 1) -> tuple[dict, dict]:
+    """{url: запись} в старом формате cache.json и в нынешнем (CheckRecord)"""
+    rng = random.Random(seed)
+    now = time.time()
+    old, new = {}, {}
+    for i in range(count):
+        url = f"https://site{i}.example.com/path/{i}"
+        results = _raw_results(i, rng)
+        # Старый формат держал рядом готовый текст отчёта
+        report = f"🔗 Проверка ссылки: {url}\n\n" + "\n".join(
+            f"{key}: {res.get('status', 'готово')}" for key, res in results.items()
+        ) + "\n\n⚠️ Уровень риска: *НИЗКИЙ* (10 баллов)\n\n📋 Причины начисления:\n• Домен старше года"
+        old[url] = {"timestamp": now, "data": {"report": report, "results": results}}
+
+        record = CheckRecord.create(url, results)
+        new[url] = {"timestamp": now, "soft_expires_at": now + 1800, "expires_at": now + 7200, "data": record.to_dict()}
+    return old, new
+
+
+# =========================
+#   ЗАМЕРЫ
+# =========================
+
+def _timed(func):
+    started = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - started
+
+
+def bench_json(path: str, entries: dict, sample: list[str]) -> dict:
+    def write():
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False, indent=2)
+
+    def load():
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    _, write_s = _timed(write)
+    loaded, load_s = _timed(load)
+    _, read_s = _timed(lambda: [loaded[url] for url in sample])
+    return {"size": os.path.getsize(path), "write": write_s, "load": load_s, "read": read_s / len(sample)}
+
+
+def bench_backend(factory, path: str, entries: dict, sample: list[str]) -> dict:
+    backend = factory(path)
+    _, write_s = _timed(lambda: backend.set_many(entries.items()))
+    backend.close()
+
+    backend, load_s = _timed(lambda: factory(path))
+    _, read_s = _timed(lambda: [backend.get(url) for url in sample])
+    backend.close()
+
+    size = sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+    return {"size": size, "write": write_s, "load": load_s, "read": read_s / len(sample)}
+
+
+def bench_compaction(path: str, entries: dict) -> dict:
+    """Перезаписываем половину записей и меряем сжатие файла"""
+    backend = LogCacheBackend(path)
+    urls = list(entries)
+    backend.set_many((url, entries[url]) for url in urls[::2])
+    before = os.path.getsize(path)
+    ratio = backend.garbage_ratio()
+    _, compact_s = _timed(backend.compact)
+    after = os.path.getsize(path)
+    backend.close()
+    return {"before": before, "after": after, "ratio": ratio, "seconds": compact_s}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение форматов хранения кэша")
+    parser.add_argument("--entries", type=int, default=100_000, help="число записей")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    old, new = generate(args.entries, args.seed)
+    sample = random.Random(args.seed).sample(list(new), min(SAMPLE_READS, len(new)))
+    workdir = tempfile.mkdtemp(prefix="link_checker_cache_bench_")
+
+    try:
+        results = {
+            "json-old": bench_json(os.path.join(workdir, "cache_old.json"), old, sample),
+            "json": bench_json(os.path.join(workdir, "cache.json"), new, sample),
+            "sqlite": bench_backend(SQLiteCacheBackend, os.path.join(workdir, "cache.sqlite3"), new, sample),
+            "log": bench_backend(LogCacheBackend, os.path.join(workdir, "cache.log"), new, sample),
+        }
+        compaction = bench_compaction(os.path.join(workdir, "cache.log"), new)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.entries} записей", file=sys.stderr)
+    print(f"{'format':<10}{'size MB':>10}{'write s':>10}{'load s':>10}{'get µs':>10}", file=sys.stderr)
+    for name, r in results.items():
+        print(
+            f"{name:<10}{r['size'] / 2 ** 20:>10.1f}{r['write']:>10.2f}{r['load']:>10.2f}{r['read'] * 1e6:>10.1f}",
+            file=sys.stderr,
+        )
+    print(
+        f"\ncompact: {compaction['before'] / 2 ** 20:.1f} MB -> {compaction['after'] / 2 ** 20:.1f} MB "
+        f"(мусора {compaction['ratio']:.0%}) за {compaction['seconds']:.2f} с",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+Нагрузочный тест на локальных заглушках — без сети и без Telegram.
+
+    python -m bench.run --concurrency 1,8,32 --requests 200
+    python -m bench.run --scenario handler,link_analysis --latency 0.2 --error-rate 0.05
+    python -m bench.run --save-baseline bench/baseline.json
+    python -m bench.run --baseline bench/baseline.json   # код выхода 1 при регрессии
+    python -m bench.run --error-rate 0.05 --max-errors 0.1
+    python -m bench.run --scenario google --gsb-mode update   # локальная база Update API
+
+Любая неудачная проверка (выше --max-errors) — тоже код выхода 1, даже без эталона.
+
+Сценарии: handler — handle_link_check с поддельным сообщением aiogram,
+остальные — отдельные функции сервисов. По каждому уровню параллельности
+выводятся пропускная способность, перцентили задержки, пик памяти (tracemalloc)
+и задержка event loop.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from bench.stubs import StubConfig, start_stubs
+
+from services import blacklist_check, dns_resolver, google_safe_browsing, infrastructure_check
+from services import public_suffix, safebrowsing_local, virustotal, whois_check
+from services.blacklist_check import check_blacklists, refresh_blacklists
+from services.google_safe_browsing import check_google_safebrowsing
+from services.infrastructure_check import check_infrastructure
+from services.link_analyzer import analyze_link
+from services.virustotal import check_virustotal
+from handlers.user_private import handle_link_check
+
+from utils import cache
+from utils.http_client import start_http_client, close_http_client
+from utils.rate_limit import TokenBucket
+
+BENCH_HOSTS = 50  # сколько разных доменов у проверяемых страниц
+LAG_INTERVAL = 0.01
+# Допуск сравнения с эталоном: хуже на 20 % — регрессия
+REGRESSION_TOLERANCE = 0.2
+
+
+# =========================
+#   ОКРУЖЕНИЕ
+# =========================
+
+class FakeMessage:
+    """Минимум aiogram.types.Message, который использует handle_link_check"""
+
+    def __init__(self, text: str = ""):
+        self.text = text
+        self.entities = None
+        self.chat = SimpleNamespace(id=0)
+        self.replies = []
+
+    async def answer(self, text: str, **kwargs):
+        reply = FakeMessage(text)
+        self.replies.append(reply)
+        return reply
+
+    async def edit_text(self, text: str, **kwargs):
+        self.text = text
+        return self
+
+
+def _seed_dns(host: str):
+    """Домены заглушек резолвятся в 127.0.0.1 без обращения к DNS"""
+    record = {"hostname": host, "a": ["127.0.0.1"], "aaaa": [], "cname": None, "error": None}
+    dns_resolver._cache[host] = (float("inf"), record)
+
+
+def gsb_blocked_expressions() -> tuple:
+    """Выражения для списка Update API: каждый двадцатый домен заглушек «опасен»"""
+    return tuple(f"site{i}.bench.test/" for i in range(0, BENCH_HOSTS, 20))
+
+
+def patch_upstreams(base_url: str, workdir: str, gsb_mode: str = "lookup"):
+    """Направляет все внешние адреса на заглушки, а файлы кэшей — во временный каталог"""
+    google_safe_browsing.GSB_MODE = gsb_mode
+    google_safe_browsing.API_URL = f"{base_url}/gsb/threatMatches:find"
+    safebrowsing_local.API_KEY = "bench-key"
+    safebrowsing_local.GSB_API_BASE = f"{base_url}/gsb"
+    safebrowsing_local.GSB_STATE_FILE = os.path.join(workdir, "gsb_update.json")
+
+    # Без ключа aiohttp не отправит заголовок x-apikey и все вызовы уйдут в ветку ошибки
+    virustotal.VT_KEY = "bench-key"
+    virustotal.VT_API = f"{base_url}/vt"
+    virustotal.VT_URL = f"{base_url}/vt/urls"
+    # Меряем свой конвейер, а не квоту VirusTotal
+    virustotal._bucket = TokenBucket(rate=1e6, capacity=1e6)
+
+    blacklist_check.BLACKLISTS = [f"{base_url}/feeds/openphish.txt", f"{base_url}/feeds/phishunt.txt"]
+    infrastructure_check.IPAPI_URL = f"{base_url}/ipapi/{{ip}}/json/"
+
+    whois_check.RDAP_BOOTSTRAP_URL = f"{base_url}/rdap-bootstrap.json"
+    whois_check.RDAP_BOOTSTRAP_FILE = os.path.join(workdir, "rdap_dns.json")
+    whois_check.RDAP_FALLBACK_URL = f"{base_url}/rdap/"
+    whois_check.WHOIS_CACHE_DB = os.path.join(workdir, "cache.sqlite3")
+
+    public_suffix.PSL_URL = f"{base_url}/psl"
+    public_suffix.PSL_FILE = os.path.join(workdir, "public_suffix_list.dat")
+
+    cache.CACHE_DB = os.path.join(workdir, "cache.sqlite3")
+    cache.CACHE_FILE = os.path.join(workdir, "cache.json")
+
+    for i in range(BENCH_HOSTS):
+        _seed_dns(f"site{i}.bench.test")
+
+
+def target_urls(base_url: str, count: int, run_id: str) -> list[str]:
+    """Уникальные адреса страниц — иначе все запросы после первого попадут в кэш"""
+    port = base_url.rsplit(":", 1)[1]
+    return [f"http://site{i % BENCH_HOSTS}.bench.test:{port}/page/{run_id}-{i}" for i in range(count)]
+
+
+# =========================
+#   СЦЕНАРИИ
+# =========================
+
+async def _handler(url: str):
+    message = FakeMessage(url)
+    await handle_link_check(message)
+    if not message.replies:
+        raise RuntimeError("handle_link_check не ответил")
+
+
+SCENARIOS = {
+    "handler": _handler,
+    "google": check_google_safebrowsing,
+    "vt": check_virustotal,
+    "blacklist": check_blacklists,
+    "infra": check_infrastructure,
+    "link_analysis": analyze_link,
+}
+
+
+async def _measure_loop_lag(samples: list, stop: asyncio.Event):
+    """Насколько позже запланированного просыпается цикл — признак блокирующего кода"""
+    while not stop.is_set():
+        started = time.monotonic()
+        await asyncio.sleep(LAG_INTERVAL)
+        samples.append(max(0.0, time.monotonic() - started - LAG_INTERVAL))
+
+
+def _percentile(samples: list, q: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+async def run_level(scenario: str, urls: list[str], concurrency: int) -> dict:
+    """Прогоняет список адресов через сценарий с заданной параллельностью"""
+    func = SCENARIOS[scenario]
+    queue = asyncio.Queue()
+    for url in urls:
+        queue.put_nowait(url)
+
+    latencies, errors, lag = [], 0, []
+    stop = asyncio.Event()
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            url = queue.get_nowait()
+            started = time.monotonic()
+            try:
+                await func(url)
+            except Exception:
+                errors += 1
+            latencies.append(time.monotonic() - started)
+
+    lag_task = asyncio.create_task(_measure_loop_lag(lag, stop))
+    tracemalloc.start()
+    started = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.monotonic() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stop.set()
+    await lag_task
+
+    return {
+        "requests": len(urls),
+        "errors": errors,
+        "throughput": round(len(urls) / max(elapsed, 1e-6), 2),
+        "p50": round(_percentile(latencies, 0.5), 4),
+        "p95": round(_percentile(latencies, 0.95), 4),
+        "p99": round(_percentile(latencies, 0.99), 4),
+        "max": round(max(latencies, default=0.0), 4),
+        "mem_peak_mb": round(peak / 2 ** 20, 2),
+        "loop_lag_p99": round(_percentile(lag, 0.99), 4),
+        "loop_lag_max": round(max(lag, default=0.0), 4),
+    }
+
+
+# =========================
+#   ЭТАЛОН
+# =========================
+
+def compare_with_baseline(results: dict, baseline: dict, max_errors: float = 0.0) -> list[str]:
+    """
+    Регрессии относительно эталона: пропускная способность ниже или p95 выше допуска.
+    Доля ошибок выше max_errors — регрессия и без эталона: быстрый отказ не должен выглядеть как ускорение.
+    """
+    regressions = []
+    for key, current in results.items():
+        error_rate = current["errors"] / max(current["requests"], 1)
+        if error_rate > max_errors:
+            regressions.append(f"{key}: ошибок {current['errors']} из {current['requests']} ({error_rate:.0%})")
+        base = baseline.get(key)
+        if not base:
+            continue
+        if current["throughput"] < base["throughput"] * (1 - REGRESSION_TOLERANCE):
+            regressions.append(f"{key}: throughput {current['throughput']} < {base['throughput']}")
+        if current["p95"] > base["p95"] * (1 + REGRESSION_TOLERANCE):
+            regressions.append(f"{key}: p95 {current['p95']}s > {base['p95']}s")
+    return regressions
+
+
+def print_results(results: dict, baseline: dict):
+    header = f"{'scenario@conc':<22}{'req/s':>9}{'p50':>8}{'p95':>8}{'p99':>8}{'err':>6}{'memMB':>8}{'lag99':>8}"
+    print(header, file=sys.stderr)
+    for key, r in results.items():
+        line = (
+            f"{key:<22}{r['throughput']:>9.2f}{r['p50']:>8.3f}{r['p95']:>8.3f}{r['p99']:>8.3f}"
+            f"{r['errors']:>6}{r['mem_peak_mb']:>8.1f}{r['loop_lag_p99']:>8.3f}"
+        )
+        base = baseline.get(key)
+        if base:
+            delta = (r["throughput"] - base["throughput"]) / max(base["throughput"], 1e-6) * 100
+            line += f"  ({delta:+.0f}% к эталону)"
+        print(line, file=sys.stderr)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест на локальных заглушках")
+    parser.add_argument("--scenario", default="handler", help=f"через запятую: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="1,8,32", help="уровни параллельности через запятую")
+    parser.add_argument("--requests", type=int, default=200, help="запросов на каждый уровень")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка заглушек, с")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument("--max-errors", type=float, default=0.0, help="допустимая доля неудачных запросов")
+    parser.add_argument("--page-size", type=int, default=64 * 1024, help="размер страниц, байт")
+    parser.add_argument("--gsb-mode", choices=("lookup", "update"), default="lookup",
+                        help="Safe Browsing: Lookup API или локальная база Update API")
+    parser.add_argument("--baseline", help="сравнить с эталоном (json)")
+    parser.add_argument("--save-baseline", help="сохранить результаты как эталон (json)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="не скрывать логи бота")
+    args = parser.parse_args()
+
+    scenarios = args.scenario.split(",")
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(unknown)}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    config = StubConfig(
+        latency=args.latency, error_rate=args.error_rate, page_size=args.page_size,
+        gsb_blocked=gsb_blocked_expressions(),
+    )
+    runner, base_url = await start_stubs(config)
+    workdir = tempfile.mkdtemp(prefix="link_checker_bench_")
+    patch_upstreams(base_url, workdir, args.gsb_mode)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = {}
+    quiet = open(os.devnull, "w") if not args.verbose else None
+    try:
+        with contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext():
+            await start_http_client()
+            cache.load_cache()
+            await refresh_blacklists()
+            if args.gsb_mode == "update":
+                await safebrowsing_local.sync_threat_lists()
+
+            for scenario in scenarios:
+                for concurrency in levels:
+                    key = f"{scenario}@{concurrency}"
+                    urls = target_urls(base_url, args.requests, key)
+                    results[key] = await run_level(scenario, urls, concurrency)
+                    print(f"[BENCH] ✅ {key}: {results[key]['throughput']} req/s", file=sys.stderr)
+    finally:
+        await close_http_client()
+        await runner.cleanup()
+        if quiet:
+            quiet.close()
+
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"[BENCH] 💾 Эталон сохранён в {args.save_baseline}", file=sys.stderr)
+
+    regressions = compare_with_baseline(results, baseline, args.max_errors)
+    if regressions:
+        print("\n[BENCH] ❌ Регрессии:", file=sys.stderr)
+        for r in regressions:
+            print(f"  • {r}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
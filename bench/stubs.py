@@ -0,0 +1,211 @@
+"""
+Локальные заглушки внешних сервисов для нагрузочного теста.
+
+Один aiohttp-сервер отвечает за всех: Google Safe Browsing (Lookup и Update API), VirusTotal,
+фиды чёрных списков, ipapi, RDAP, Public Suffix List и сами проверяемые страницы.
+Задержка, доля ошибок и размер страниц настраиваются через StubConfig.
+"""
+import asyncio
+import base64
+import hashlib
+import random
+from dataclasses import dataclass
+
+from aiohttp import web
+
+
+@dataclass
+class StubConfig:
+    latency: float = 0.05        # средняя задержка ответа, с
+    jitter: float = 0.5          # разброс задержки: ±50 %
+    error_rate: float = 0.0      # доля ответов HTTP 500
+    danger_rate: float = 0.05    # доля "опасных" вердиктов
+    page_size: int = 64 * 1024   # размер HTML-страницы, байт
+    feed_size: int = 10000       # строк в каждом фиде чёрного списка
+    gsb_blocked: tuple = ()      # выражения (host/path) в списке SOCIAL_ENGINEERING для Update API
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+class GsbListStub:
+    """
+    Сервер списков Update API: каждый вызов set_expressions — новая версия состояния.
+    Клиент со знакомым состоянием получает PARTIAL_UPDATE с удалениями по индексам,
+    с незнакомым — FULL_UPDATE. Префиксы 4-байтовые, контрольная сумма — как у Google.
+    """
+
+    THREAT_TYPE = "SOCIAL_ENGINEERING"
+
+    def __init__(self, expressions=()):
+        self.versions: list[list[bytes]] = []
+        self.full_hashes: set[bytes] = set()
+        self.set_expressions(expressions)
+
+    def set_expressions(self, expressions):
+        self.full_hashes = {hashlib.sha256(e.encode()).digest() for e in expressions}
+        self.versions.append(sorted({h[:4] for h in self.full_hashes}))
+
+    def list_update(self, request: dict) -> dict:
+        current = self.versions[-1]
+        response = {
+            "threatType": request["threatType"],
+            "platformType": request["platformType"],
+            "threatEntryType": request["threatEntryType"],
+            "newClientState": str(len(self.versions) - 1),
+        }
+        if request["threatType"] != self.THREAT_TYPE:
+            current = []
+        state = request.get("state", "")
+        old = self.versions[int(state)] if state.isdigit() and int(state) < len(self.versions) else None
+        if old is None or request["threatType"] != self.THREAT_TYPE:
+            response["responseType"] = "FULL_UPDATE"
+            additions = current
+        else:
+            response["responseType"] = "PARTIAL_UPDATE"
+            kept = set(current)
+            removals = [i for i, prefix in enumerate(old) if prefix not in kept]
+            if removals:
+                response["removals"] = [{"compressionType": "RAW", "rawIndices": {"indices": removals}}]
+            additions = sorted(set(current) - set(old))
+        if additions:
+            response["additions"] = [
+                {"compressionType": "RAW", "rawHashes": {"prefixSize": 4, "rawHashes": _b64(b"".join(additions))}}
+            ]
+        response["checksum"] = {"sha256": _b64(hashlib.sha256(b"".join(current)).digest())}
+        return response
+
+    def find(self, prefixes: list[bytes]) -> list[dict]:
+        return [
+            {"threatType": self.THREAT_TYPE, "platformType": "ANY_PLATFORM", "threatEntryType": "URL",
+             "threat": {"hash": _b64(full_hash)}, "cacheDuration": "300s"}
+            for full_hash in sorted(self.full_hashes)
+            if full_hash[:4] in prefixes
+        ]
+
+
+def _page(size: int, n: str) -> bytes:
+    """HTML нужного размера: абзацы текста, внутренние и внешние ссылки, iframe"""
+    head = f"<html><head><title>Страница {n}</title></head><body>"
+    block = (
+        "<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit. Войдите, чтобы продолжить.</p>"
+        f'<a href="/page/{n}/next">далее</a> <a href="https://example.org/out">наружу</a>\n'
+    )
+    tail = '<iframe src="https://ads.example.net/frame"></iframe></body></html>'
+    repeat = max(1, (size - len(head) - len(tail)) // len(block.encode()))
+    return (head + block * repeat + tail).encode()
+
+
+GSB_LISTS = web.AppKey("gsb_lists", GsbListStub)  # тесты меняют списки между синхронизациями
+
+
+def build_app(config: StubConfig) -> web.Application:
+    page_cache = {}
+
+    @web.middleware
+    async def chaos(request: web.Request, handler):
+        delay = config.latency * random.uniform(1 - config.jitter, 1 + config.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if request.path.startswith("/page/") or request.path.startswith("/psl"):
+            return await handler(request)
+        if random.random() < config.error_rate:
+            return web.Response(status=500, text="stub error")
+        return await handler(request)
+
+    # --- Google Safe Browsing ---
+    async def gsb_find(request: web.Request):
+        payload = await request.json()
+        entries = payload.get("threatInfo", {}).get("threatEntries", [])
+        matches = [
+            {"threatType": "SOCIAL_ENGINEERING", "platformType": "ANY_PLATFORM", "threat": {"url": e["url"]}}
+            for e in entries
+            if random.random() < config.danger_rate
+        ]
+        return web.json_response({"matches": matches} if matches else {})
+
+    gsb_lists = GsbListStub(config.gsb_blocked)
+
+    async def gsb_update(request: web.Request):
+        payload = await request.json()
+        updates = [gsb_lists.list_update(r) for r in payload.get("listUpdateRequests", [])]
+        return web.json_response({"listUpdateResponses": updates, "minimumWaitDuration": "1800s"})
+
+    async def gsb_full_hashes(request: web.Request):
+        payload = await request.json()
+        entries = payload.get("threatInfo", {}).get("threatEntries", [])
+        matches = gsb_lists.find({base64.b64decode(e["hash"]) for e in entries})
+        return web.json_response({"matches": matches, "negativeCacheDuration": "300s"})
+
+    # --- VirusTotal ---
+    async def vt_url(request: web.Request):
+        malicious = 3 if random.random() < config.danger_rate else 0
+        stats = {"malicious": malicious, "suspicious": 0, "harmless": 70, "undetected": 20}
+        return web.json_response({"data": {"attributes": {"last_analysis_stats": stats}}})
+
+    async def vt_submit(request: web.Request):
+        return web.json_response({"data": {"type": "analysis", "id": "stub-analysis"}})
+
+    async def vt_analysis(request: web.Request):
+        stats = {"malicious": 0, "suspicious": 0, "harmless": 70, "undetected": 20}
+        return web.json_response({"data": {"attributes": {"status": "completed", "stats": stats}}})
+
+    # --- Чёрные списки ---
+    async def feed(request: web.Request):
+        name = request.match_info["name"]
+        lines = (f"http://phish-{name}-{i}.bench.test/login" for i in range(config.feed_size))
+        return web.Response(text="\n".join(lines), headers={"ETag": f'"{name}-{config.feed_size}"'})
+
+    # --- ipapi ---
+    async def ipapi(request: web.Request):
+        return web.json_response({"country_name": "Nowhere", "org": "Bench Hosting", "asn": "AS64500"})
+
+    # --- RDAP ---
+    async def rdap_bootstrap(request: web.Request):
+        return web.json_response({"services": [[["test"], [f"{request.scheme}://{request.host}/rdap/"]]]})
+
+    async def rdap_domain(request: web.Request):
+        return web.json_response({
+            "registrar": {"name": "Bench Registrar"},
+            "events": [
+                {"eventAction": "registration", "eventDate": "2015-01-01T00:00:00Z"},
+                {"eventAction": "expiration", "eventDate": "2035-01-01T00:00:00Z"},
+            ],
+        })
+
+    async def psl(request: web.Request):
+        return web.Response(text="// bench\ncom\norg\nnet\ntest\n")
+
+    # --- Проверяемые страницы ---
+    async def page(request: web.Request):
+        n = request.match_info["n"]
+        body = page_cache.get(config.page_size)
+        if body is None:
+            body = page_cache[config.page_size] = _page(config.page_size, n)
+        return web.Response(body=body, content_type="text/html", charset="utf-8")
+
+    app = web.Application(middlewares=[chaos])
+    app[GSB_LISTS] = gsb_lists
+    app.router.add_post("/gsb/threatMatches:find", gsb_find)
+    app.router.add_post("/gsb/threatListUpdates:fetch", gsb_update)
+    app.router.add_post("/gsb/fullHashes:find", gsb_full_hashes)
+    app.router.add_get("/vt/urls/{id}", vt_url)
+    app.router.add_post("/vt/urls", vt_submit)
+    app.router.add_get("/vt/analyses/{id}", vt_analysis)
+    app.router.add_get("/feeds/{name}.txt", feed)
+    app.router.add_get("/ipapi/{ip}/json/", ipapi)
+    app.router.add_get("/rdap-bootstrap.json", rdap_bootstrap)
+    app.router.add_get("/rdap/domain/{domain}", rdap_domain)
+    app.router.add_get("/psl", psl)
+    app.router.add_get("/page/{n}", page)
+    return app
+
+
+async def start_stubs(config: StubConfig, host: str = "127.0.0.1", port: int = 0) -> tuple[web.AppRunner, str]:
+    """Запускает заглушки, возвращает (runner, базовый URL). port=0 — любой свободный."""
+    runner = web.AppRunner(build_app(config), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    actual_port = runner.addresses[0][1]
+    return runner, f"http://{host}:{actual_port}"
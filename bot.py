@@ -12,7 +12,14 @@ load_dotenv(find_dotenv())
 from handlers.user_private import user_private_router
 
 from utils.cache import load_cache
-from utils.tasks import schedule_cache_refresh
+from utils.cpu_pool import shutdown_cpu_pool
+from utils.http_client import start_http_client, close_http_client
+from utils.metrics import start_metrics_server, stop_metrics_server
+from utils.tasks import schedule_cache_compaction, schedule_cache_refresh, follow_file
+from services.blacklist_check import schedule_blacklist_refresh
+from services.ip_database import IP_DB_FILE, load_ip_database, schedule_ip_database_refresh
+from services.google_safe_browsing import GSB_MODE
+from services.safebrowsing_local import GSB_STATE_FILE, load_state, schedule_gsb_sync
 
 
 bot = Bot(token=os.getenv('TOKEN'), default=DefaultBotProperties(parse_mode=ParseMode.HTML)) # если создать файл .env
@@ -23,24 +30,45 @@ dp = Dispatcher()
 dp.include_router(user_private_router)
 
 
+async def on_startup(bot, worker_id: int = 0):
+    """
+    worker_id задаёт webhook.py при запуске нескольких воркеров.
+    Общие файлы (кэш, база IP, база GSB) обновляет только воркер 0, остальные их перечитывают.
+    """
+    print(f"Бот запущен (воркер {worker_id})")
 
-async def on_startup(bot):
-    print("Бот запущен")
-
+    await start_http_client()
+    await start_metrics_server(port_offset=worker_id)
     load_cache()
-    asyncio.create_task(schedule_cache_refresh())
+    load_ip_database()
+    asyncio.create_task(schedule_blacklist_refresh())
+
+    if worker_id == 0:
+        asyncio.create_task(schedule_cache_refresh())
+        asyncio.create_task(schedule_cache_compaction())
+        asyncio.create_task(schedule_ip_database_refresh())
+        if GSB_MODE == "update":
+            asyncio.create_task(schedule_gsb_sync())
+    else:
+        asyncio.create_task(follow_file(IP_DB_FILE, load_ip_database))
+        if GSB_MODE == "update":
+            load_state()
+            asyncio.create_task(follow_file(GSB_STATE_FILE, load_state))
 
 
 async def on_shutdown(bot):
+    await close_http_client()
+    await stop_metrics_server()
+    shutdown_cpu_pool()
     print('бот лег')
 
 
-async def main():
-
+dp.startup.register(on_startup)
+dp.shutdown.register(on_shutdown)
 
 
-    dp.startup.register(on_startup)
-    dp.shutdown.register(on_shutdown)
+async def main():
+    # Режим long polling — для разработки. Для продакшена есть webhook.py.
 
     # dp.update.middleware(DataBaseSession(session_pool=session_maker))
 
@@ -49,4 +77,5 @@ async def main():
     # await bot.set_my_commands(commands=private, scope=types.BotCommandScopeAllPrivateChats())
     await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
 
-asyncio.run(main())
\ No newline at end of file
+if __name__ == "__main__":
+    asyncio.run(main())
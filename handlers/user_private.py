@@ -1,36 +1,33 @@
 import html
+import re
 
 import asyncio
+import time
 
 from aiogram import types, F
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.filters import CommandStart, Command
 from aiogram import Router
 
 from filters.chat_types import ChatTypeFilter
 
-from services.link_analyzer import analyze_link
 from services.validator import is_working_url
-from services.google_safe_browsing import check_google_safebrowsing
-from services.virustotal import check_virustotal
-from services.blacklist_check import check_blacklists
-from services.infrastructure_check import check_infrastructure
+from services.google_safe_browsing import check_google_safebrowsing_many
+from services.checker import PROVIDER_BUDGETS, check_once, get_cached_result, safe_result
 
-from utils.cache import get_cache, set_cache
-from utils.calculate_risk import calculate_risk_score
+from utils.metrics import REQUEST_LATENCY, REQUESTS_IN_PROGRESS
+from utils.report import PROVIDER_NAMES, CheckRecord, build_progress, render
+from utils.tracing import start_trace
 
 
 user_private_router = Router()
 user_private_router.message.filter(ChatTypeFilter(["private"]))
 
-def safe_result(res, name):
-    """Обрабатывает исключения и возвращает нейтральный ответ (без логов и деталей ошибок)."""
-    if isinstance(res, Exception):
-        # Возвращаем результат
-        return {"status": "error", "details": None}
-    if res is None:
-        return {"status": "unknown", "details": None}
-    return res
-
+MAX_BATCH_URLS = 20
+BATCH_CONCURRENCY = 4
+URL_PATTERN = re.compile(r"(?:https?://|www\.)[^\s<>\"']+", re.IGNORECASE)
+# Telegram ограничивает частоту правок одного сообщения — промежуточные обновления реже этого не шлём
+PROGRESS_EDIT_INTERVAL = 1.5
 
 
 @user_private_router.message(CommandStart())
@@ -51,153 +48,137 @@ async def help_cmd(message: types.Message):
     )
 
 
+def extract_urls(message: types.Message) -> list[str]:
+    """Достаёт все ссылки из сущностей и текста сообщения без повторов"""
+    text = message.text or ""
+    urls = []
+    for entity in message.entities or []:
+        if entity.type == "url":
+            urls.append(entity.extract_from(text))
+        elif entity.type == "text_link" and entity.url:
+            urls.append(entity.url)
+    urls += URL_PATTERN.findall(text)
+    return list(dict.fromkeys(u.strip().rstrip(".,;:!?)") for u in urls))
+
+
+async def check_batch(urls: list[str]) -> list[CheckRecord]:
+    """Проверяет несколько ссылок: кэш, один запрос к Google на всё, остальное — с ограничением параллельности"""
+    found = {url: get_cached_result(url) for url in urls}
+    missing = [url for url, record in found.items() if record is None]
+
+    google = {}
+    if missing:
+        try:
+            # Тот же бюджет, что у Google в run_link_check: медленный ответ не задерживает всю пачку
+            google = await asyncio.wait_for(check_google_safebrowsing_many(missing), PROVIDER_BUDGETS["google"])
+        except Exception as e:
+            google = {url: safe_result(e, "google") for url in missing}
+
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def check_one(url: str):
+        async with semaphore:
+            found[url] = await check_once(url, google_res=google[url])
+
+    await asyncio.gather(*(check_one(url) for url in missing))
+    return [found[url] for url in urls]
+
+
+def build_batch_summary(checked: list[CheckRecord]) -> str:
+    """Компактная таблица: уровень риска и баллы по каждой ссылке"""
+    rows = []
+    for i, record in enumerate(checked, 1):
+        summary = render(record, "summary")
+        if len(summary) > 52:
+            summary = f"{summary[:49]}..."
+        rows.append(f"{i:>2}. {html.escape(summary)}")
+
+    return (
+        f"🔗 <b>Проверено ссылок:</b> {len(checked)}\n\n"
+        f"<pre>{chr(10).join(rows)}</pre>\n\n"
+        "ℹ️ Отправьте одну ссылку отдельно, чтобы получить подробный отчёт."
+    )
+
+
+def make_progress_editor(status_message: types.Message, url: str):
+    """Колбэк для run_link_check: правит сообщение о проверке не чаще PROGRESS_EDIT_INTERVAL"""
+    last_edit = 0.0
+
+    async def on_progress(done: dict):
+        nonlocal last_edit
+        # Когда готово всё, сообщение заменит полный отчёт
+        if len(done) == len(PROVIDER_NAMES):
+            return
+        now = time.monotonic()
+        if now - last_edit < PROGRESS_EDIT_INTERVAL:
+            return
+        last_edit = now
+        try:
+            await status_message.edit_text(build_progress(url, done), parse_mode="HTML")
+        except (TelegramBadRequest, TelegramRetryAfter):
+            # Пропущенный промежуточный шаг не страшен — важна только финальная правка
+            pass
+
+    return on_progress
+
+
+async def deliver_report(message: types.Message, status_message: types.Message, report: str):
+    """Финальная правка: полный отчёт на месте сообщения о проверке"""
+    for _ in range(2):
+        try:
+            await status_message.edit_text(report, parse_mode="HTML")
+            return
+        except TelegramRetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+        except TelegramBadRequest:
+            # Сообщение удалено или его нельзя изменить — отправляем отчёт отдельно
+            break
+    await message.answer(report, parse_mode="HTML")
+
+
 @user_private_router.message(F.text)
 async def handle_link_check(message: types.Message):
-    url = message.text.strip()
+    # 📈 Метрики и трассировка всего сообщения: путь обработки — метка гистограммы
+    REQUESTS_IN_PROGRESS.inc()
+    started = time.monotonic()
+    with start_trace("handle_link_check", chat_id=message.chat.id) as span:
+        try:
+            span["path"] = await check_message(message)
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            REQUEST_LATENCY.observe(time.monotonic() - started, path=span.get("path", "error"))
+
 
-    safe_url = html.escape(url)
+async def check_message(message: types.Message) -> str:
+    """Проверяет ссылки из сообщения и отвечает. Возвращает путь обработки для метрик."""
+    urls = [u for u in extract_urls(message) if await is_working_url(u)]
 
     # 🔎 Проверяем валидность
-    if not await is_working_url(url):
+    if not urls:
         await message.answer("🚫 Невалидная или недоступная ссылка.")
-        return
+        return "invalid"
 
+    # 📦 Несколько ссылок — одна пакетная проверка и сводная таблица
+    if len(urls) > 1:
+        urls = urls[:MAX_BATCH_URLS]
+        await message.answer(f"🔍 Проверяю ссылок: {len(urls)}...")
+        checked = await check_batch(urls)
+        await message.answer(build_batch_summary(checked), parse_mode="HTML")
+        return "batch"
+
+    url = urls[0]
     # ⚡ Проверяем кэш
-    cached = get_cache(safe_url)
+    cached = get_cached_result(url)
     if cached:
-        await message.answer(f"⚡ Результат из кэша:\n{cached['report']}", parse_mode="HTML")
-        return
-
-    await message.answer("🔍 Выполняю расширенную проверку сайта...")
-
-    # 🧠 Параллельный запуск с защитой от ошибок
-    results_raw = await asyncio.gather(
-        check_google_safebrowsing(url),
-        check_virustotal(url),
-        check_blacklists(url),
-        check_infrastructure(url),
-        analyze_link(url),
-        return_exceptions=True, 
-    )
+        await message.answer(f"⚡ Результат из кэша:\n{render(cached)}", parse_mode="HTML")
+        return "cached"
 
-    # Безопасно извлекаем результаты
-    google_res, vt_res, bl_res, infra, link_info = [
-        safe_result(r, name)
-        for r, name in zip(
-            results_raw,
-            ["Google Safe Browsing", "VirusTotal", "Blacklists", "Infrastructure", "Link Analysis"]
-        )
-    ]
-
-    # Если хоть один сервис не сработал — помечаем пользователю
-    unavailable = [name for res, name in zip(
-        [google_res, vt_res, bl_res, infra, link_info],
-        ["Google Safe Browsing", "VirusTotal", "Blacklists", "Infrastructure", "Link Analysis"]
-    ) if res.get("status") == "error"]
-
-    # Собираем все результаты
-    results = {
-        "google": google_res,
-        "vt": vt_res,
-        "blacklist": bl_res,
-        "infra": infra,
-        "link_analysis": link_info,
-    }
-
-    # 🔎 Подсчёт риска
-    level, score, reasons = calculate_risk_score(results)
-
-    # 🌈 Прогресс-бар риска
-    filled = int(score / 10)
-    bar = (
-        "🟩" * min(filled, 3)
-        + "🟨" * max(0, filled - 3 if filled <= 7 else 4)
-        + "🟥" * max(0, filled - 7)
-    ).ljust(10, "⬜")
-
-    # 🧾 Формируем отчёт
-    ssl_info = infra.get("ssl_info", {})
-    ip_info = infra.get("ip_info", {})
-    whois = infra.get("whois", {})
-
-
-
-    text = (
-        f"🔗 <b>Проверка ссылки:</b> <code>{safe_url}</code>\n\n"
-        f"🧭 Google Safe Browsing: {google_res['status']}\n"
-        f"🧪 VirusTotal: {vt_res['status']}\n"
-        f"🚨 Blacklists: {bl_res['status']}\n\n"
-        f"⚠️ <b>Уровень риска:</b> <b>{level.upper()}</b>\n"
-        f"📊 <b>Баллы:</b> {score}/100\n"
-        f"{bar}\n\n"
-    )
-
-    if unavailable:
-        text += f"⚠️ <b>Недоступны сервисы:</b> {', '.join(unavailable)}\n\n"
-
-    if reasons:
-        text += "💡 <b>Причины начисления баллов:</b>\n"
-        for r in reasons:
-            text += f"• {r}\n"
-        text += "\n"
-
-    text += (
-        f"🌐 <b>Инфраструктура сайта:</b>\n"
-        f"🏠 Домен: <code>{infra.get('hostname', 'N/A')}</code>\n"
-        f"🔒 HTTPS: {'Да' if infra.get('is_https') else 'Нет'}\n"
-    )
-
-    # SSL
-    if ssl_info.get("valid"):
-        text += (
-            f"📜 Сертификат выдан: <b>{ssl_info.get('issued_by', 'N/A')}</b>\n"
-            f"📅 Действителен до: <code>{ssl_info.get('valid_to', 'N/A')}</code>\n"
-            f"🕐 Осталось дней: <code>{ssl_info.get('days_left', 'N/A')}</code>\n"
-        )
-    else:
-        text += f"⚠️ SSL: {ssl_info.get('error', 'Нет данных')}\n"
-
-    # IP и хостинг
-    text += (
-        f"\n🌍 <b>Хостинг:</b>\n"
-        f"🧩 IP: <code>{ip_info.get('ip', 'неизвестен')}</code>\n"
-        f"🏳️ Страна: {ip_info.get('country', 'Unknown')}\n"
-        f"🏢 Организация: {ip_info.get('org', 'Unknown')}\n"
-        f"🛰 ASN: {ip_info.get('asn', 'Unknown')}\n"
-        f"📦 CDN: {infra.get('cdn', 'Не определён')}\n"
-    )
-
-    if infra.get("proxy_suspect"):
-        text += "\n🚨 <b>Обнаружены признаки прокси или подозрительного хостинга</b>\n"
-    else:
-        text += "\n✅ Признаков прокси или подозрительного хостинга не найдено\n"
-
-    # WHOIS
-    text += (
-        f"\n📖 <b>Данные о домене:</b>\n"
-        f"🗓 Дата регистрации: {whois.get('created', 'Unknown')}\n"
-        f"🏢 Регистратор: {whois.get('registrar', 'Unknown')}\n"
-        f"📆 Возраст домена: {whois.get('age_days', 'N/A')} дней (~{whois.get('age_years', 0)} лет)\n"
-        f"🕐 Срок действия до: {whois.get('expires', 'Unknown')}\n"
-        f"🧭 Риск: {whois.get('freshness', 'N/A')} (риск: {whois.get('risk', 'N/A')})\n"
-    )
+    status_message = await message.answer("🔍 Выполняю расширенную проверку сайта...")
 
-    # Аналитика
-    text += "\n🔍 <b>Аналитика ссылки:</b>\n"
-    if link_info.get("masked_domain"):
-        text += f"{link_info['masked_domain']}\n"
-    if link_info.get("is_punycode"):
-        text += "⚠️ Домен использует <b>Punycode</b> (возможная подмена символов)\n"
-    text += f"🔁 Редиректов: {link_info.get('redirect_count', 0)}\n"
-    text += f"🪟 Iframe: {link_info.get('iframe_count', 0)}\n"
-    text += f"🔗 Внутренние ссылки: {link_info.get('internal_links', 0)}, внешние: {link_info.get('external_links', 0)}\n"
-    if link_info.get("tracking_params"):
-        text += f"📊 Трекинговые параметры: {', '.join(link_info['tracking_params'])}\n"
-    if link_info.get("risk_flags"):
-        text += f"⚠️ Подозрительные признаки: {', '.join(link_info['risk_flags'])}\n"
-
-    # 💾 Кэшируем результат
-    set_cache(url, {"report": text, "results": results})
-
-    await message.answer(text, parse_mode="HTML")
+    # 🔗 Одинаковые ссылки, пришедшие одновременно, проверяются один раз.
+    # Прогресс видит тот, кто запустил проверку, остальные получают сразу итоговый отчёт.
+    on_progress = make_progress_editor(status_message, url)
+    record = await check_once(url, on_progress=on_progress)
 
+    await deliver_report(message, status_message, render(record))
+    return "checked"
@@ -0,0 +1,185 @@
+"""
+Пакетная проверка ссылок без Telegram.
+
+    python scan.py urls.txt -o results.jsonl
+    cat urls.txt | python scan.py - -o results.jsonl --resume
+
+Каждая строка входа — одна ссылка. Результат по каждой ссылке пишется в JSONL,
+как только проверка завершилась.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+from dotenv import find_dotenv, load_dotenv
+
+load_dotenv(find_dotenv())
+
+from services.blacklist_check import refresh_blacklists
+from services.checker import check_once, get_cached_result
+from services.google_safe_browsing import GSB_MODE
+from services.ip_database import load_ip_database
+from services.safebrowsing_local import is_loaded, load_state, sync_threat_lists
+from services.validator import is_working_url
+
+from utils.cache import load_cache
+from utils.cpu_pool import shutdown_cpu_pool
+from utils.calculate_risk import calculate_risk_score
+from utils.http_client import start_http_client, close_http_client
+
+
+def load_done_urls(path: str) -> set:
+    """Читает уже записанные результаты и обрезает недописанную последнюю строку"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+
+    valid_size = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                done.add(json.loads(line)["url"])
+            except (ValueError, KeyError):
+                break
+            valid_size += len(line)
+
+    with open(path, "r+b") as f:
+        f.truncate(valid_size)
+    return done
+
+
+async def read_urls(source, queue: asyncio.Queue, done: set, workers: int):
+    """Построчно читает ссылки (в потоке, чтобы не блокировать цикл) и кладёт в очередь"""
+    loop = asyncio.get_running_loop()
+    seen = set()
+    while True:
+        line = await loop.run_in_executor(None, source.readline)
+        if not line:
+            break
+        url = line.strip()
+        if not url or url.startswith("#") or url in done or url in seen:
+            continue
+        seen.add(url)
+        await queue.put(url)
+
+    for _ in range(workers):
+        await queue.put(None)
+
+
+async def scan_url(url: str, timings: dict) -> dict:
+    """Проверяет одну ссылку тем же конвейером, что и бот, с использованием кэша"""
+    started = time.monotonic()
+    if not await is_working_url(url):
+        return {"url": url, "error": "invalid url"}
+
+    record = get_cached_result(url)
+    cached = record is not None
+    if not cached:
+        record = await check_once(url, timings=timings)
+
+    level, score, reasons = calculate_risk_score(record.results)
+    return {
+        "url": url,
+        "level": level,
+        "score": score,
+        "reasons": reasons,
+        "results": record.results,
+        "cached": cached,
+        "elapsed": round(time.monotonic() - started, 3),
+    }
+
+
+def print_stats(total: int, elapsed: float, latencies: dict):
+    print(f"\n[SCAN] ✅ Проверено {total} ссылок за {elapsed:.1f} с ({total / max(elapsed, 1e-6):.2f} URL/с)", file=sys.stderr)
+    for provider, samples in sorted(latencies.items()):
+        if not samples:
+            continue
+        samples = sorted(samples)
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        print(
+            f"[SCAN] {provider:<14} n={len(samples):<6} "
+            f"avg={statistics.mean(samples):.3f}s p50={statistics.median(samples):.3f}s "
+            f"p95={p95:.3f}s max={samples[-1]:.3f}s",
+            file=sys.stderr,
+        )
+
+
+async def prepare_gsb():
+    """Локальная база Google Safe Browsing: из файла, а если его нет — первая синхронизация"""
+    load_state()
+    if is_loaded():
+        return
+    print("[SCAN] 🔄 База GSB не загружена, синхронизирую...", file=sys.stderr)
+    try:
+        await sync_threat_lists()
+    except Exception as e:
+        # Без базы Google даёт "unknown" по каждой ссылке, а не ложный "clean"
+        print(f"[SCAN] ⚠️ Не удалось загрузить базу GSB: {e}", file=sys.stderr)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Пакетная проверка ссылок с выводом в JSONL")
+    parser.add_argument("input", help="файл со ссылками или - для stdin")
+    parser.add_argument("-o", "--output", required=True, help="файл результатов JSONL")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="число параллельных проверок")
+    parser.add_argument("--resume", action="store_true", help="пропустить ссылки, уже записанные в output")
+    args = parser.parse_args()
+
+    done = load_done_urls(args.output) if args.resume else set()
+    if done:
+        print(f"[SCAN] ⏯ Уже проверено: {len(done)}", file=sys.stderr)
+
+    await start_http_client()
+    load_cache()
+    load_ip_database()
+    await refresh_blacklists()
+    if GSB_MODE == "update":
+        await prepare_gsb()
+
+    source = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    out = open(args.output, "a" if args.resume else "w", encoding="utf-8")
+    queue: asyncio.Queue = asyncio.Queue(maxsize=args.concurrency * 2)
+    latencies = {}
+    total = 0
+    started = time.monotonic()
+
+    async def worker():
+        nonlocal total
+        while True:
+            url = await queue.get()
+            if url is None:
+                return
+            timings = {}
+            try:
+                record = await scan_url(url, timings)
+            except Exception as e:
+                record = {"url": url, "error": str(e)}
+            for provider, seconds in timings.items():
+                latencies.setdefault(provider, []).append(seconds)
+            out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            out.flush()
+            total += 1
+
+    try:
+        await asyncio.gather(
+            read_urls(source, queue, done, args.concurrency),
+            *(worker() for _ in range(args.concurrency)),
+        )
+    finally:
+        out.close()
+        if source is not sys.stdin:
+            source.close()
+        await close_http_client()
+        shutdown_cpu_pool()
+
+    print_stats(total, time.monotonic() - started, latencies)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
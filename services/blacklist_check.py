@@ -1,4 +1,11 @@
+import time
+import asyncio
 import aiohttp
+from urllib.parse import urlsplit
+
+from utils.canonical_url import canonicalize_url
+from utils.http_client import get_session, PAGE_TIMEOUT
+from utils.metrics import instrument
 
 BLACKLISTS = [
     "https://openphish.com/feed.txt",
@@ -6,13 +13,148 @@ BLACKLISTS = [
     # можно добавить другие
 ]
 
-async def check_blacklists(url: str) -> dict:
+REFRESH_INTERVAL = 60 * 15  # 15 минут
+
+# Режимы сопоставления: точный URL, только хост, префикс пути
+MATCH_EXACT = "exact"
+MATCH_HOST = "host"
+MATCH_PREFIX = "prefix"
+DEFAULT_MATCH_MODE = MATCH_PREFIX
+
+# Снимок индекса: {feed_url: {"urls": set, "paths": set, "hosts": set, "loaded_at": float}}
+# Заменяется целиком, поэтому читатели никогда не видят частично собранный индекс
+_index = {}
+# Заголовки для условных запросов: {feed_url: {"etag": str, "last_modified": str}}
+_feed_meta = {}
+
+
+def _normalize_url(url: str) -> tuple[str, str, str]:
+    """Возвращает (хост, хост+путь, хост+путь+query) канонического URL без схемы"""
+    parts = urlsplit(canonicalize_url(url))
+    host = parts.hostname or ""
+    path = parts.path.rstrip("/")
+    full = f"{host}{path}"
+    if parts.query:
+        full += f"?{parts.query}"
+    return host, f"{host}{path}", full
+
+
+def _parse_feed(text: str) -> dict:
+    """Разбирает фид (один URL на строку) в хэш-множества"""
+    urls, paths, hosts = set(), set(), set()
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        host, path, full = _normalize_url(line)
+        if not host:
+            continue
+        urls.add(full)
+        paths.add(path)
+        hosts.add(host)
+    return {"urls": urls, "paths": paths, "hosts": hosts, "loaded_at": time.time()}
+
+
+async def _fetch_feed(session: aiohttp.ClientSession, bl_url: str):
+    """Скачивает фид с учётом ETag/Last-Modified. None — фид не изменился или недоступен."""
+    headers = {}
+    meta = _feed_meta.get(bl_url, {})
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    async with session.get(bl_url, headers=headers, timeout=PAGE_TIMEOUT) as resp:
+        if resp.status == 304:
+            return None
+        if resp.status != 200:
+            print(f"[BLACKLIST] ⚠️ {bl_url} — HTTP {resp.status}")
+            return None
+        text = await resp.text(errors="ignore")
+        _feed_meta[bl_url] = {
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+        }
+        return text
+
+
+async def refresh_blacklists():
+    """Обновляет все фиды из BLACKLISTS и атомарно подменяет индекс"""
+    global _index
+    new_index = dict(_index)
+
+    session = get_session()
     for bl_url in BLACKLISTS:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(bl_url) as resp:
-                if resp.status == 200:
-                    text = await resp.text()
-                    if url in text:
-                        return {"status": "danger", "details": {"blacklist": bl_url}}
-    return {"status": "clean", "details": None}
-    
+        try:
+            text = await _fetch_feed(session, bl_url)
+        except Exception as e:
+            print(f"[BLACKLIST] ⚠️ Ошибка загрузки {bl_url}: {e}")
+            continue
+
+        if text is None:
+            # Не изменился — просто продлеваем снимок
+            if bl_url in new_index:
+                new_index[bl_url] = {**new_index[bl_url], "loaded_at": time.time()}
+            continue
+
+        new_index[bl_url] = _parse_feed(text)
+        print(f"[BLACKLIST] 📥 {bl_url} — {len(new_index[bl_url]['urls'])} записей")
+
+    # Удалённые из конфигурации фиды не должны участвовать в проверке
+    _index = {k: v for k, v in new_index.items() if k in BLACKLISTS}
+
+
+async def schedule_blacklist_refresh():
+    """Фоновая задача: периодически обновляет фиды чёрных списков"""
+    while True:
+        await refresh_blacklists()
+        await asyncio.sleep(REFRESH_INTERVAL)
+
+
+def lookup(url: str, mode: str = DEFAULT_MATCH_MODE):
+    """Ищет URL в индексе. Возвращает (feed_url, snapshot) или None."""
+    host, path, full = _normalize_url(url)
+
+    # Префиксы пути: host, host/a, host/a/b, ...
+    prefixes = []
+    if mode == MATCH_PREFIX:
+        prefix = host
+        prefixes.append(prefix)
+        for segment in path[len(host):].split("/"):
+            if segment:
+                prefix = f"{prefix}/{segment}"
+                prefixes.append(prefix)
+
+    index = _index
+    for bl_url, feed in index.items():
+        if mode == MATCH_EXACT:
+            hit = full in feed["urls"]
+        elif mode == MATCH_HOST:
+            hit = host in feed["hosts"]
+        else:
+            hit = full in feed["urls"] or any(p in feed["paths"] for p in prefixes)
+        if hit:
+            return bl_url, feed
+    return None
+
+
+@instrument("blacklist")
+async def check_blacklists(url: str, mode: str = DEFAULT_MATCH_MODE) -> dict:
+    """
+    snapshot_age — возраст снимка в секундах, всегда на верхнем уровне:
+    для совпадения — фида, где оно найдено, иначе — самого старого фида.
+    """
+    if not _index:
+        return {"status": "unknown", "details": {"error": "Blacklist feeds are not loaded yet"}}
+
+    match = lookup(url, mode)
+    if match:
+        bl_url, feed = match
+        return {
+            "status": "danger",
+            "details": {"blacklist": bl_url, "match": mode},
+            "snapshot_age": int(time.time() - feed["loaded_at"]),
+        }
+
+    oldest = min(feed["loaded_at"] for feed in _index.values())
+    return {"status": "clean", "details": None, "snapshot_age": int(time.time() - oldest)}
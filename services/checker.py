@@ -0,0 +1,214 @@
+import asyncio
+import os
+import time
+from dataclasses import replace
+from typing import Awaitable, Callable, Optional
+
+from services.link_analyzer import analyze_link, find_tracking_params
+from services.google_safe_browsing import check_google_safebrowsing
+from services.virustotal import check_virustotal, add_analysis_listener
+from services.blacklist_check import check_blacklists
+from services.infrastructure_check import check_infrastructure
+
+from utils.cache import get_cache, get_cache_entry, is_stale, set_cache
+from utils.canonical_url import canonicalize_url
+from utils.circuit_breaker import CircuitOpenError
+from utils.metrics import PROVIDER_DEADLINE_MISSES
+from utils.report import PROVIDER_NAMES, CheckRecord
+from utils.singleflight import is_running, run_once
+
+# Дольше этого пользователь ждать не будет — медленные провайдеры отсекаются
+CHECK_DEADLINE = float(os.getenv("CHECK_DEADLINE", 20))
+
+# Собственный бюджет каждого провайдера внутри общего дедлайна, с.
+# Переопределяется переменными BUDGET_GOOGLE, BUDGET_VT и т.д.
+PROVIDER_BUDGETS = {
+    key: min(float(os.getenv(f"BUDGET_{key.upper()}", default)), CHECK_DEADLINE)
+    for key, default in {
+        "google": 5,
+        "vt": 10,
+        "blacklist": 2,
+        "infra": 15,
+        "link_analysis": 12,
+    }.items()
+}
+
+# Не успевшие провайдеры досчитываются в фоне, но не дольше этого, с
+BACKGROUND_FINISH_LIMIT = 60
+
+ProgressCallback = Callable[[dict], Awaitable[None]]
+
+
+def safe_result(res, name):
+    """Обрабатывает исключения и возвращает нейтральный ответ (без логов и деталей ошибок)."""
+    if isinstance(res, CircuitOpenError):
+        # Сервис отключён выключателем после серии сбоев — вызов не выполнялся
+        return {"status": "error", "details": {"circuit": "open", "retry_in": round(res.retry_in)}}
+    if isinstance(res, asyncio.TimeoutError):
+        # Провайдер не уложился в бюджет — отличаем от ошибки, ответ может прийти позже
+        return {"status": "timeout", "details": None}
+    if isinstance(res, Exception):
+        # Возвращаем результат
+        return {"status": "error", "details": None}
+    if res is None:
+        return {"status": "unknown", "details": None}
+    return res
+
+
+async def _resolved(value):
+    return value
+
+
+async def _timed(key: str, coro, timings: Optional[dict]):
+    """Замеряет время ответа провайдера, если передан словарь timings"""
+    started = time.monotonic()
+    try:
+        return await coro
+    finally:
+        if timings is not None:
+            timings[key] = time.monotonic() - started
+
+
+async def _keyed(key: str, task: asyncio.Future):
+    """
+    Ждёт провайдера в пределах его бюджета и возвращает (провайдер, результат или исключение).
+    Сама задача при тайм-ауте не отменяется — её можно досчитать в фоне.
+    """
+    try:
+        return key, await asyncio.wait_for(asyncio.shield(task), PROVIDER_BUDGETS[key])
+    except Exception as e:
+        return key, e
+
+
+def _update_cached_result(url: str, key: str, res: dict):
+    """Подменяет результат одного провайдера в закэшированной проверке"""
+    cache_key = canonicalize_url(url)
+    data = get_cache(cache_key)
+    if not data:
+        return
+    record = CheckRecord.from_dict(data, url=url).with_result(key, res)
+    set_cache(cache_key, record.to_dict())
+
+
+async def _finish_in_background(url: str, late: dict):
+    """Дожидается опоздавших провайдеров и дописывает их ответы в кэш"""
+    for key, task in late.items():
+        try:
+            res = await asyncio.wait_for(task, BACKGROUND_FINISH_LIMIT)
+        except Exception:
+            # Так и не ответил — в кэше остаётся "timeout"
+            continue
+        _update_cached_result(url, key, safe_result(res, PROVIDER_NAMES[key]))
+        print(f"[CHECK] ✅ {url}: {PROVIDER_NAMES[key]} ответил после дедлайна")
+
+
+async def run_link_check(
+    url: str,
+    google_res: Optional[dict] = None,
+    timings: Optional[dict] = None,
+    on_progress: Optional[ProgressCallback] = None,
+) -> CheckRecord:
+    """
+    Запускает все проверки, кэширует и возвращает запись результата.
+    google_res — уже полученный пакетным запросом ответ Google Safe Browsing.
+    timings — словарь, в который записывается время ответа каждого провайдера.
+    on_progress — вызывается с уже готовыми результатами после каждого завершившегося провайдера.
+    Провайдеры, не уложившиеся в свой бюджет или в CHECK_DEADLINE, получают статус "timeout"
+    и досчитываются в фоне — их ответы попадают в кэш позже.
+    """
+    checks = {
+        "google": check_google_safebrowsing(url) if google_res is None else _resolved(google_res),
+        "vt": check_virustotal(url),
+        "blacklist": check_blacklists(url),
+        "infra": check_infrastructure(url),
+        "link_analysis": analyze_link(url),
+    }
+
+    # 🧠 Параллельный запуск, результаты забираем по мере готовности
+    tasks = {key: asyncio.ensure_future(_timed(key, coro, timings)) for key, coro in checks.items()}
+    waiters = [asyncio.ensure_future(_keyed(key, task)) for key, task in tasks.items()]
+    done = {}
+    timed_out = set()
+    try:
+        for next_done in asyncio.as_completed(waiters, timeout=CHECK_DEADLINE):
+            key, res = await next_done
+            if isinstance(res, asyncio.TimeoutError):
+                timed_out.add(key)
+            done[key] = safe_result(res, PROVIDER_NAMES[key])
+            if on_progress is not None:
+                try:
+                    await on_progress(dict(done))
+                except Exception as e:
+                    print(f"[CHECK] ⚠️ Ошибка обновления прогресса: {e}")
+    except asyncio.TimeoutError:
+        for waiter in waiters:
+            waiter.cancel()
+
+    # Собираем все результаты в постоянном порядке; не ответившие к дедлайну — тоже "timeout"
+    timed_out.update(key for key in checks if key not in done)
+    results = {key: done.get(key, safe_result(asyncio.TimeoutError(), PROVIDER_NAMES[key])) for key in checks}
+
+    record = CheckRecord.create(url, results)
+
+    # 💾 Кэшируем только запись — отчёт строится из неё при выдаче
+    set_cache(canonicalize_url(url), record.to_dict())
+
+    # У infra и link_analysis нет общего "status" — опоздавших берём из timed_out, а не из результатов
+    late = {key: tasks[key] for key in checks if key in timed_out}
+    for key in late:
+        PROVIDER_DEADLINE_MISSES.inc(provider=key)
+    if late:
+        print(f"[CHECK] ⏱ {url}: не уложились в бюджет: {', '.join(late)}")
+        asyncio.create_task(_finish_in_background(url, late))
+
+    return record
+
+
+def as_requested(record: CheckRecord, url: str) -> CheckRecord:
+    """
+    Запись из общего кэша или чужой проверки той же (после канонизации) ссылки —
+    в виде для того, кто спросил: в отчёте его адрес, а трекинговые параметры
+    и баллы за них считаются по его ссылке, а не по чужой.
+    """
+    if record.url == url:
+        return record
+    link = record.results.get("link_analysis") or {}
+    # Без ответа анализатора (ошибка, тайм-аут) трекинг не оценивался — не оцениваем и здесь
+    if "risk_flags" in link and not link.get("error"):
+        tracking = find_tracking_params(url)
+        flags = [flag for flag in link["risk_flags"] if flag != "tracking"] + (["tracking"] if tracking else [])
+        link = {**link, "tracking_params": tracking, "risk_flags": flags}
+    return replace(record, url=url, results={**record.results, "link_analysis": link})
+
+
+async def check_once(url: str, **kwargs) -> CheckRecord:
+    """
+    run_link_check через run_once: одинаковые после канонизации ссылки, пришедшие одновременно,
+    проверяются один раз. Каждый получает запись для своего адреса (см. as_requested).
+    """
+    record = await run_once(canonicalize_url(url), lambda: run_link_check(url, **kwargs))
+    return as_requested(record, url)
+
+
+def get_cached_result(url: str) -> Optional[CheckRecord]:
+    """
+    Результат из кэша по принципу stale-while-revalidate:
+    запись с истёкшим мягким сроком отдаётся сразу, а проверка перезапускается в фоне.
+    """
+    cache_key = canonicalize_url(url)
+    entry = get_cache_entry(cache_key)
+    if entry is None:
+        return None
+
+    if is_stale(entry) and not is_running(cache_key):
+        print(f"[CHECK] 🔄 {url} — отдаю из кэша и перепроверяю в фоне")
+        asyncio.ensure_future(run_once(cache_key, lambda: run_link_check(url)))
+    return as_requested(CheckRecord.from_dict(entry["data"], url=url, timestamp=entry["timestamp"]), url)
+
+
+def _on_vt_analysis(url: str, vt_res: dict):
+    """Когда VirusTotal досчитал отправленный анализ — обновляем запись в кэше"""
+    _update_cached_result(url, "vt", vt_res)
+
+
+add_analysis_listener(_on_vt_analysis)
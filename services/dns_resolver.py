@@ -0,0 +1,173 @@
+import asyncio
+import ipaddress
+import socket
+import time
+from typing import Optional
+
+import aiodns
+from aiohttp.abc import AbstractResolver
+
+from utils.metrics import instrument
+
+# Границы TTL для кэша: слишком короткие TTL не должны превращаться в запрос на каждую проверку
+DNS_MIN_TTL = 30
+DNS_MAX_TTL = 60 * 60
+DNS_NEGATIVE_TTL = 60  # сколько помнить NXDOMAIN
+DNS_CACHE_MAX_SIZE = 10000
+
+# Кэш: {hostname: (expires_at, record)}
+_cache = {}
+# Незавершённые запросы — одновременные обращения к одному хосту ждут один запрос
+_pending: dict[str, asyncio.Task] = {}
+_resolver: Optional[aiodns.DNSResolver] = None
+
+
+def _get_resolver() -> aiodns.DNSResolver:
+    global _resolver
+    if _resolver is None:
+        _resolver = aiodns.DNSResolver()
+    return _resolver
+
+
+def _empty_record(hostname: str) -> dict:
+    return {"hostname": hostname, "a": [], "aaaa": [], "cname": None, "error": None}
+
+
+async def _query(hostname: str) -> tuple[dict, int]:
+    """Запрашивает A/AAAA/CNAME. Возвращает (запись, ttl)."""
+    resolver = _get_resolver()
+    record = _empty_record(hostname)
+
+    a_res, aaaa_res, cname_res = await asyncio.gather(
+        resolver.query(hostname, "A"),
+        resolver.query(hostname, "AAAA"),
+        resolver.query(hostname, "CNAME"),
+        return_exceptions=True,
+    )
+
+    ttls = []
+    if not isinstance(a_res, Exception):
+        record["a"] = [r.host for r in a_res]
+        ttls += [r.ttl for r in a_res]
+    if not isinstance(aaaa_res, Exception):
+        record["aaaa"] = [r.host for r in aaaa_res]
+        ttls += [r.ttl for r in aaaa_res]
+    if not isinstance(cname_res, Exception):
+        record["cname"] = cname_res.cname
+        ttls.append(cname_res.ttl)
+
+    if not record["a"] and not record["aaaa"]:
+        # c-ares не читает /etc/hosts: localhost, стабы и записи hosts ищем через системный резолвер
+        system = await _system_lookup(hostname)
+        if system["a"] or system["aaaa"]:
+            record.update(system)
+            return record, DNS_MIN_TTL
+
+        not_found = any(
+            isinstance(r, aiodns.error.DNSError) and r.args and r.args[0] == aiodns.error.ARES_ENOTFOUND
+            for r in (a_res, aaaa_res)
+        )
+        record["error"] = "NXDOMAIN" if not_found else "No address records"
+        return record, DNS_NEGATIVE_TTL
+
+    ttl = min(ttls) if ttls else DNS_MIN_TTL
+    return record, max(DNS_MIN_TTL, min(ttl, DNS_MAX_TTL))
+
+
+async def _system_lookup(hostname: str) -> dict:
+    """Адреса через getaddrinfo (учитывает /etc/hosts и nsswitch), как ThreadedResolver в aiohttp"""
+    found = {"a": [], "aaaa": []}
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(hostname, None, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError):
+        return found
+    for family, _, _, _, sockaddr in infos:
+        key = "a" if family == socket.AF_INET else "aaaa" if family == socket.AF_INET6 else None
+        if key and sockaddr[0] not in found[key]:
+            found[key].append(sockaddr[0])
+    return found
+
+
+async def _resolve_and_cache(hostname: str) -> dict:
+    try:
+        record, ttl = await _query(hostname)
+    except Exception as e:
+        # Сбой резолвера не кэшируем — это не ответ DNS
+        record = _empty_record(hostname)
+        record["error"] = str(e)
+        return record
+
+    if len(_cache) >= DNS_CACHE_MAX_SIZE:
+        _cache.pop(next(iter(_cache)))
+    _cache[hostname] = (time.time() + ttl, record)
+    return record
+
+
+@instrument("dns")
+async def resolve(hostname: str) -> dict:
+    """
+    Возвращает {"hostname", "a", "aaaa", "cname", "error"} с учётом TTL записей.
+    NXDOMAIN кэшируется как отрицательный результат.
+    """
+    hostname = hostname.lower().rstrip(".")
+
+    # IP-адрес вместо имени — резолвить нечего
+    try:
+        ip = ipaddress.ip_address(hostname.strip("[]"))
+        record = _empty_record(hostname)
+        record["a" if ip.version == 4 else "aaaa"] = [str(ip)]
+        return record
+    except ValueError:
+        pass
+
+    cached = _cache.get(hostname)
+    if cached and cached[0] > time.time():
+        return cached[1]
+
+    task = _pending.get(hostname)
+    if task is None:
+        task = asyncio.ensure_future(_resolve_and_cache(hostname))
+        _pending[hostname] = task
+        task.add_done_callback(lambda _: _pending.pop(hostname, None))
+    return await asyncio.shield(task)
+
+
+async def resolve_many(hostnames: list[str]) -> dict[str, dict]:
+    """Резолвит несколько хостов параллельно"""
+    unique = list(dict.fromkeys(hostnames))
+    records = await asyncio.gather(*(resolve(h) for h in unique))
+    return dict(zip(unique, records))
+
+
+def first_address(record: dict) -> Optional[str]:
+    """Первый адрес записи: IPv4 в приоритете"""
+    addresses = record["a"] + record["aaaa"]
+    return addresses[0] if addresses else None
+
+
+class CachedResolver(AbstractResolver):
+    """Резолвер для aiohttp поверх общего кэша DNS"""
+
+    async def resolve(self, host: str, port: int = 0, family: socket.AddressFamily = socket.AF_INET) -> list[dict]:
+        record = await resolve(host)
+        results = []
+        if family in (socket.AF_INET, socket.AF_UNSPEC):
+            results += [(ip, socket.AF_INET) for ip in record["a"]]
+        if family in (socket.AF_INET6, socket.AF_UNSPEC):
+            results += [(ip, socket.AF_INET6) for ip in record["aaaa"]]
+        if not results:
+            raise OSError(record["error"] or f"Cannot resolve {host}")
+        return [
+            {
+                "hostname": host,
+                "host": ip,
+                "port": port,
+                "family": ip_family,
+                "proto": 0,
+                "flags": socket.AI_NUMERICHOST,
+            }
+            for ip, ip_family in results
+        ]
+
+    async def close(self) -> None:
+        pass
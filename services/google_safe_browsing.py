@@ -1,23 +1,54 @@
-import aiohttp
 import os
 
+from services.safebrowsing_local import GSB_API_BASE, check_urls_local
+from utils.http_client import get_session, API_TIMEOUT
+from utils.circuit_breaker import circuit
+from utils.metrics import instrument
+
 API_KEY = os.getenv('GOOGLE_SAFE_BROWSING_KEY')
-API_URL = "https://safebrowsing.googleapis.com/v4/threatMatches:find"
+API_URL = f"{GSB_API_BASE}/threatMatches:find"
+MAX_ENTRIES_PER_REQUEST = 500  # ограничение Lookup API
 
-async def check_google_safebrowsing(url: str) -> dict:
-    payload = {
-        "client": {"clientId": "your-bot", "clientVersion": "1.0"},
-        "threatInfo": {
-            "threatTypes": ["MALWARE", "SOCIAL_ENGINEERING", "UNWANTED_SOFTWARE"],
-            "platformTypes": ["ANY_PLATFORM"],
-            "threatEntryTypes": ["URL"],
-            "threatEntries": [{"url": url}],
+# lookup — каждый URL уходит в Lookup API, update — локальная база префиксов (Update API)
+GSB_MODE = os.getenv("GSB_MODE", "lookup")
+
+
+@circuit("google")
+@instrument("google")
+async def check_google_safebrowsing_many(urls: list[str]) -> dict[str, dict]:
+    """Проверяет несколько URL одним запросом threatMatches:find"""
+    if GSB_MODE == "update":
+        return await check_urls_local(urls)
+
+    results = {url: {"status": "clean", "details": None} for url in urls}
+    session = get_session()
+
+    for i in range(0, len(urls), MAX_ENTRIES_PER_REQUEST):
+        chunk = urls[i:i + MAX_ENTRIES_PER_REQUEST]
+        payload = {
+            "client": {"clientId": "your-bot", "clientVersion": "1.0"},
+            "threatInfo": {
+                "threatTypes": ["MALWARE", "SOCIAL_ENGINEERING", "UNWANTED_SOFTWARE"],
+                "platformTypes": ["ANY_PLATFORM"],
+                "threatEntryTypes": ["URL"],
+                "threatEntries": [{"url": url} for url in chunk],
+            }
         }
-    }
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(f"{API_URL}?key={API_KEY}", json=payload) as resp:
+        async with session.post(f"{API_URL}?key={API_KEY}", json=payload, timeout=API_TIMEOUT) as resp:
+            # В теле ошибки 429/5xx нет "matches" — без проверки статуса это был бы ложный "clean"
+            if resp.status != 200:
+                raise RuntimeError(f"Safe Browsing HTTP {resp.status}")
             data = await resp.json()
-            if "matches" in data:
-                return {"status": "danger", "details": data["matches"]}
-            return {"status": "clean", "details": None}
+
+        for match in data.get("matches", []):
+            url = match.get("threat", {}).get("url")
+            if url in results:
+                details = results[url]["details"] or []
+                results[url] = {"status": "danger", "details": details + [match]}
+
+    return results
+
+
+async def check_google_safebrowsing(url: str) -> dict:
+    return (await check_google_safebrowsing_many([url]))[url]
@@ -1,60 +1,157 @@
-import socket
+import asyncio
+import os
 import ssl
+import time
 import datetime
-import aiohttp
 import re
+from urllib.parse import urlparse
 
 from services.whois_check import fetch_whois_data
+from services.dns_resolver import resolve, first_address
+from services.ip_database import lookup_ip
+from utils.countries import country_name
+from utils.http_client import get_session, API_TIMEOUT
+from utils.circuit_breaker import CircuitOpenError, get_breaker
+from utils.metrics import instrument
 
-async def get_ssl_info(hostname: str) -> dict:
-    """Проверяет SSL-сертификат и его срок действия"""
+IPAPI_URL = "https://ipapi.co/{ip}/json/"
+_ipapi_breaker = get_breaker("ipapi")
+
+# Настройки TLS-проверки
+SSL_HANDSHAKE_TIMEOUT = float(os.getenv("SSL_HANDSHAKE_TIMEOUT", 5))
+SSL_CACHE_MARGIN = 60 * 60  # запись живёт до notAfter минус час
+SSL_CACHE_MAX_TTL = 60 * 60 * 24  # но не дольше суток — сертификаты перевыпускают заранее
+SSL_CACHE_MAX_SIZE = 10000
+
+# Кэш сертификатов: {hostname: (cache_expires_at, info)}
+_ssl_cache = {}
+
+
+async def _fetch_certificate(hostname: str) -> dict:
+    """Выполняет TLS-рукопожатие без блокировки event loop и разбирает сертификат"""
     context = ssl.create_default_context()
 
+    ip = first_address(await resolve(hostname))
+    if ip is None:
+        raise ConnectionError("Cannot resolve hostname")
+
+    _, writer = await asyncio.wait_for(
+        asyncio.open_connection(
+            ip, 443,
+            ssl=context,
+            server_hostname=hostname,
+            ssl_handshake_timeout=SSL_HANDSHAKE_TIMEOUT,
+        ),
+        timeout=SSL_HANDSHAKE_TIMEOUT,
+    )
     try:
-        with socket.create_connection((hostname, 443), timeout=5) as sock:
-            with context.wrap_socket(sock, server_hostname=hostname) as ssock:
-                cert = ssock.getpeercert()
-
-        issuer = dict(x[0] for x in cert["issuer"])
-        subject = dict(x[0] for x in cert["subject"])
-        issued_to = subject.get("commonName", "")
-        issued_by = issuer.get("organizationName", "")
-        valid_from = datetime.datetime.strptime(cert["notBefore"], "%b %d %H:%M:%S %Y %Z")
-        valid_to = datetime.datetime.strptime(cert["notAfter"], "%b %d %H:%M:%S %Y %Z")
-        days_left = (valid_to - datetime.datetime.utcnow()).days
+        ssl_object = writer.get_extra_info("ssl_object")
+        cert = ssl_object.getpeercert()
+        tls_version = ssl_object.version()
+        cipher = ssl_object.cipher()
+    finally:
+        writer.close()
+        # Без ожидания закрытия транспорты копятся под нагрузкой. Сервер может не ответить
+        # на close_notify — ждём не дольше рукопожатия, ошибки закрытия уже не важны
+        try:
+            await asyncio.wait_for(writer.wait_closed(), timeout=SSL_HANDSHAKE_TIMEOUT)
+        except (OSError, ssl.SSLError, asyncio.TimeoutError):
+            pass
+
+    issuer = dict(x[0] for x in cert["issuer"])
+    subject = dict(x[0] for x in cert["subject"])
+    valid_from = datetime.datetime.strptime(cert["notBefore"], "%b %d %H:%M:%S %Y %Z")
+    valid_to = datetime.datetime.strptime(cert["notAfter"], "%b %d %H:%M:%S %Y %Z")
 
-        return {
-            "valid": True,
-            "issued_to": issued_to,
-            "issued_by": issued_by,
-            "valid_from": str(valid_from),
-            "valid_to": str(valid_to),
-            "days_left": days_left
-        }
-
-    except ssl.SSLError:
-        return {"valid": False, "error": "SSL certificate invalid or missing"}
-    except Exception as e:
-        return {"valid": False, "error": str(e)}
+    return {
+        "valid": True,
+        "issued_to": subject.get("commonName", ""),
+        "issued_by": issuer.get("organizationName", ""),
+        "valid_from": str(valid_from),
+        "valid_to": str(valid_to),
+        "tls_version": tls_version,
+        "cipher": cipher[0] if cipher else None,
+        "chain": {
+            "issuer_cn": issuer.get("commonName", ""),
+            "ca_issuers": list(cert.get("caIssuers", ())),
+            "san_count": len(cert.get("subjectAltName", ())),
+        },
+    }
 
 
+@instrument("ssl")
+async def get_ssl_info(hostname: str) -> dict:
+    """Проверяет SSL-сертификат и его срок действия"""
+    now = time.time()
+    cached = _ssl_cache.get(hostname)
+    if cached and cached[0] > now:
+        info = cached[1]
+    else:
+        try:
+            info = await _fetch_certificate(hostname)
+        except ssl.SSLError:
+            return {"valid": False, "error": "SSL certificate invalid or missing"}
+        except asyncio.TimeoutError:
+            return {"valid": False, "error": f"TLS handshake timeout ({SSL_HANDSHAKE_TIMEOUT:g}s)"}
+        except Exception as e:
+            return {"valid": False, "error": str(e)}
+
+        not_after = datetime.datetime.fromisoformat(info["valid_to"]).replace(tzinfo=datetime.timezone.utc)
+        expires_at = min(not_after.timestamp() - SSL_CACHE_MARGIN, now + SSL_CACHE_MAX_TTL)
+        if expires_at > now:
+            if len(_ssl_cache) >= SSL_CACHE_MAX_SIZE:
+                _ssl_cache.pop(next(iter(_ssl_cache)))
+            _ssl_cache[hostname] = (expires_at, info)
+
+    valid_to = datetime.datetime.fromisoformat(info["valid_to"])
+    return {**info, "days_left": (valid_to - datetime.datetime.utcnow()).days}
+
+
+@instrument("ip")
 async def get_ip_info(hostname: str) -> dict:
     """Получает IP и информацию о хостинге / стране"""
-    try:
-        ip = socket.gethostbyname(hostname)
-    except Exception:
+    record = await resolve(hostname)
+    ip = first_address(record)
+    if ip is None:
         return {"error": "Cannot resolve hostname"}
 
+    # Сначала локальная база диапазонов, ipapi.co — только если адрес там не найден
+    local = lookup_ip(ip)
+    if local:
+        return {
+            "ip": ip,
+            "ips": record["a"] + record["aaaa"],
+            "cname": record["cname"],
+            **local,
+            "source": "local",
+        }
+
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"https://ipapi.co/{ip}/json/") as resp:
+        async with _ipapi_breaker.guard():
+            session = get_session()
+            async with session.get(IPAPI_URL.format(ip=ip), timeout=API_TIMEOUT) as resp:
+                if resp.status == 429 or resp.status >= 500:
+                    raise RuntimeError(f"ipapi HTTP {resp.status}")
                 data = await resp.json()
 
         return {
             "ip": ip,
-            "country": data.get("country_name", "Unknown"),
+            "ips": record["a"] + record["aaaa"],
+            "cname": record["cname"],
+            "country": data.get("country_name") or country_name(data.get("country", "")),
+            "country_code": data.get("country"),
             "org": data.get("org", "Unknown"),
-            "asn": data.get("asn", "Unknown")
+            "asn": data.get("asn", "Unknown"),
+            "source": "ipapi",
+        }
+    except CircuitOpenError as e:
+        # ipapi.co отключён после серии сбоев — не ждём его
+        return {
+            "ip": ip,
+            "ips": record["a"] + record["aaaa"],
+            "cname": record["cname"],
+            "error": str(e),
+            "circuit": "open",
         }
     except Exception as e:
         return {"ip": ip, "error": str(e)}
@@ -84,18 +181,26 @@ async def detect_cdn(org_name: str) -> str:
     return "Не используется или неизвестен"
 
 
+@instrument("infra")
 async def check_infrastructure(url: str) -> dict:
     """Главная функция анализа инфраструктуры сайта"""
-    # Извлекаем hostname
-    hostname = url.replace("http://", "").replace("https://", "").split("/")[0]
-
-    ssl_info = await get_ssl_info(hostname)
-    ip_info = await get_ip_info(hostname)
+    # Извлекаем hostname. Бот принимает и ссылки без схемы (www.example.com/x) —
+    # без неё urlparse не видит хоста
+    if "://" not in url:
+        url = f"http://{url}"
+    hostname = urlparse(url).hostname or ""
+
+    # Хост резолвится один раз, дальше SSL и IP берут адрес из кэша резолвера
+    await resolve(hostname)
+
+    # ⚡ SSL, IP и WHOIS / возраст домена параллельно
+    ssl_info, ip_info, whois_data = await asyncio.gather(
+        get_ssl_info(hostname),
+        get_ip_info(hostname),
+        fetch_whois_data(hostname),
+    )
     cdn = await detect_cdn(ip_info.get("org", ""))
 
-    # ⚡ WHOIS / возраст домена
-    whois_data = await fetch_whois_data(hostname)
-
     is_https = url.startswith("https://")
     proxy_suspect = any(
         term in (ip_info.get("org") or "").lower()
@@ -0,0 +1,226 @@
+import asyncio
+import glob
+import gzip
+import ipaddress
+import mmap
+import os
+import struct
+import time
+from typing import Iterable, Optional
+
+import aiohttp
+
+from utils.countries import country_name
+from utils.http_client import get_session
+
+# Дамп диапазонов IP → ASN/страна/организация (формат iptoasn.com)
+IP_DB_SOURCE_URL = os.getenv("IP_DB_SOURCE_URL", "https://iptoasn.com/data/ip2asn-combined.tsv.gz")
+IP_DB_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "common")
+# Открытый через mmap файл нельзя заменить (на Windows os.replace падает), поэтому каждая сборка
+# пишется в новый ip2asn-<версия>.bin, а имя актуальной хранится здесь и меняется атомарно.
+# За этим файлом следят остальные воркеры (utils/tasks.follow_file).
+IP_DB_FILE = os.path.join(IP_DB_DIR, "ip2asn.current")
+IP_DB_LEGACY_FILE = os.path.join(IP_DB_DIR, "ip2asn.bin")  # до версионных имён
+IP_DB_REFRESH_INTERVAL = 60 * 60 * 24 * 7  # раз в неделю
+IP_DB_DOWNLOAD_TIMEOUT = aiohttp.ClientTimeout(total=300, connect=10)
+
+# Формат файла:
+#   заголовок | записи (отсортированы по началу диапазона) | смещения строк org | строки org
+# Адреса хранятся в 16 байтах big-endian (IPv4 — как ::ffff:a.b.c.d),
+# поэтому побайтовое сравнение совпадает с числовым.
+_MAGIC = b"IPDB0001"
+_HEADER = struct.Struct("<8sIIQ")      # magic, число записей, число org, смещение таблицы org
+_RECORD = struct.Struct(">16s16sI2sI")  # start, end, asn, country, индекс org
+_OFFSET = struct.Struct("<I")
+
+
+def _ip_key(ip: str) -> bytes:
+    addr = ipaddress.ip_address(ip)
+    if addr.version == 4:
+        addr = ipaddress.IPv6Address(f"::ffff:{addr}")
+    return addr.packed
+
+
+def build_database(lines: Iterable[str], out_path: str) -> int:
+    """Собирает бинарную базу из строк TSV: start, end, asn, country, description"""
+    records = []
+    orgs = {}
+    for line in lines:
+        parts = line.rstrip("\n").split("\t")
+        if len(parts) < 5:
+            continue
+        start, end, asn, country, org = parts[:5]
+        if asn == "0":  # диапазон не анонсируется
+            continue
+        if len(country) != 2:  # "None" и т.п. — страна неизвестна
+            country = ""
+        try:
+            records.append((_ip_key(start), _ip_key(end), int(asn), country.encode()[:2], orgs.setdefault(org, len(orgs))))
+        except ValueError:
+            continue
+    records.sort()
+
+    org_blobs = [org.encode() for org in orgs]
+    tmp_path = f"{out_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        org_table_offset = _HEADER.size + len(records) * _RECORD.size
+        f.write(_HEADER.pack(_MAGIC, len(records), len(org_blobs), org_table_offset))
+        for start, end, asn, country, org_idx in records:
+            f.write(_RECORD.pack(start, end, asn, country.ljust(2, b" "), org_idx))
+        offset = 0
+        for blob in org_blobs:
+            f.write(_OFFSET.pack(offset))
+            offset += len(blob)
+        f.write(_OFFSET.pack(offset))
+        for blob in org_blobs:
+            f.write(blob)
+    os.replace(tmp_path, out_path)
+    return len(records)
+
+
+class IPDatabase:
+    """Интервальный индекс IP-диапазонов поверх memory map: поиск бинарным поиском"""
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.org_count, self._org_table = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError("Неверный формат базы IP")
+        self._org_blob = self._org_table + (self.org_count + 1) * _OFFSET.size
+
+    def _record(self, i: int) -> tuple:
+        return _RECORD.unpack_from(self._mm, _HEADER.size + i * _RECORD.size)
+
+    def _org(self, idx: int) -> str:
+        pos = self._org_table + idx * _OFFSET.size
+        start = _OFFSET.unpack_from(self._mm, pos)[0]
+        end = _OFFSET.unpack_from(self._mm, pos + _OFFSET.size)[0]
+        return self._mm[self._org_blob + start:self._org_blob + end].decode(errors="ignore")
+
+    def lookup(self, ip: str) -> Optional[dict]:
+        key = _ip_key(ip)
+        # Последний диапазон, начинающийся не позже адреса
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self._mm[_HEADER.size + mid * _RECORD.size:_HEADER.size + mid * _RECORD.size + 16]
+            if start <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return None
+        start, end, asn, country, org_idx = self._record(lo - 1)
+        if key > end:
+            return None
+        code = country.decode().strip()
+        if not (len(code) == 2 and code.isupper()):
+            code = ""  # в базах старой сборки "None" обрезано до "No"
+        return {
+            "country": country_name(code),
+            "country_code": code or None,
+            "asn": f"AS{asn}",
+            "org": self._org(org_idx),
+        }
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+_db: Optional[IPDatabase] = None
+
+
+def _current_path() -> Optional[str]:
+    """Файл актуальной базы: имя из IP_DB_FILE, у старых установок — ip2asn.bin"""
+    if os.path.exists(IP_DB_FILE):
+        with open(IP_DB_FILE, "r", encoding="utf-8") as f:
+            name = f.read().strip()
+        if name:
+            return os.path.join(IP_DB_DIR, name)
+    return IP_DB_LEGACY_FILE if os.path.exists(IP_DB_LEGACY_FILE) else None
+
+
+def load_ip_database():
+    """Открывает локальную базу IP, если она уже скачана"""
+    global _db
+    path = _current_path()
+    if path is None or not os.path.exists(path):
+        print("[IPDB] Локальная база не найдена, используется ipapi.co")
+        return
+    try:
+        new_db = IPDatabase(path)
+    except Exception as e:
+        print(f"[IPDB] Ошибка загрузки: {e}")
+        return
+    old_db, _db = _db, new_db
+    if old_db is not None:
+        old_db.close()
+    print(f"[IPDB] Загружено {new_db.count} диапазонов")
+
+
+def _activate(path: str):
+    """Делает собранный файл актуальным, переоткрывает базу и удаляет прежние версии"""
+    tmp_path = f"{IP_DB_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(path))
+    os.replace(tmp_path, IP_DB_FILE)
+    load_ip_database()
+
+    # Старые версии уже закрыты; если файл ещё открыт другим процессом — удалим в следующий раз
+    for stale in glob.glob(os.path.join(IP_DB_DIR, "ip2asn-*.bin")) + [IP_DB_LEGACY_FILE]:
+        if os.path.exists(stale) and not os.path.samefile(stale, path):
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+
+def lookup_ip(ip: str) -> Optional[dict]:
+    """Ищет IP в локальной базе. None — базы нет или адрес не найден."""
+    if _db is None:
+        return None
+    try:
+        return _db.lookup(ip)
+    except ValueError:
+        return None
+
+
+def _build_from_gzip(gz_path: str, out_path: str) -> int:
+    with gzip.open(gz_path, "rt", encoding="utf-8", errors="ignore") as f:
+        return build_database(f, out_path)
+
+
+async def refresh_ip_database():
+    """Скачивает свежий дамп, пересобирает базу в потоке и подменяет открытую"""
+    gz_path = os.path.join(IP_DB_DIR, "ip2asn.download.gz")
+    out_path = os.path.join(IP_DB_DIR, f"ip2asn-{time.time_ns()}.bin")
+    try:
+        session = get_session()
+        async with session.get(IP_DB_SOURCE_URL, timeout=IP_DB_DOWNLOAD_TIMEOUT) as resp:
+            if resp.status != 200:
+                print(f"[IPDB] ⚠️ {IP_DB_SOURCE_URL} — HTTP {resp.status}")
+                return
+            with open(gz_path, "wb") as f:
+                async for chunk in resp.content.iter_chunked(1 << 16):
+                    f.write(chunk)
+
+        count = await asyncio.get_running_loop().run_in_executor(None, _build_from_gzip, gz_path, out_path)
+        print(f"[IPDB] 📥 База обновлена: {count} диапазонов")
+        _activate(out_path)
+    except Exception as e:
+        print(f"[IPDB] ⚠️ Ошибка обновления: {e}")
+    finally:
+        if os.path.exists(gz_path):
+            os.remove(gz_path)
+
+
+async def schedule_ip_database_refresh():
+    """Фоновая задача: раз в неделю обновляет базу IP-диапазонов"""
+    if _db is None:
+        await refresh_ip_database()
+    while True:
+        await asyncio.sleep(IP_DB_REFRESH_INTERVAL)
+        await refresh_ip_database()
@@ -1,11 +1,28 @@
+import os
 import re
-import aiohttp
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse, parse_qs, urljoin
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+
+from services.page_parser import PageStream, parse_page
+from utils.cpu_pool import count_inline, offloads, run_cpu
+from utils.http_client import get_session, PAGE_TIMEOUT
+from utils.metrics import instrument
 
-SUSPICIOUS_KEYWORDS = ["login", "secure", "verify", "update", "bank", "paypal", "signin", "account"]
 TRACKING_PARAMS = ["utm_", "ref", "fbclid", "gclid", "mc_eid", "yclid", "igshid", "si"]
 
+# stream — разбор токенизатором без построения дерева, soup — полный разбор через BeautifulSoup
+ANALYZE_MODE = os.getenv("LINK_ANALYZE_MODE", "stream")
+PAGE_MAX_BYTES = int(os.getenv("PAGE_MAX_BYTES", 2 * 1024 * 1024))
+STREAM_CHUNK_SIZE = 64 * 1024
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+
+def find_tracking_params(url: str) -> list[str]:
+    """Трекинговые параметры в ссылке — зависят только от адреса, страница для них не нужна"""
+    query_params = parse_qs(urlparse(url).query)
+    return [k for k in query_params.keys() if any(tp in k for tp in TRACKING_PARAMS)]
+
+
+@instrument("link_analysis")
 async def analyze_link(url: str) -> dict:
     """
     Анализирует структуру и содержимое ссылки.
@@ -21,6 +38,7 @@ async def analyze_link(url: str) -> dict:
         "external_links": 0,
         "tracking_params": [],
         "risk_flags": [],
+        "truncated": False,
     }
 
     parsed = urlparse(url)
@@ -43,40 +61,86 @@ async def analyze_link(url: str) -> dict:
 
     # 🌐 3. Проверка редиректов и контента
     try:
-        timeout = aiohttp.ClientTimeout(total=10)
         headers = {"User-Agent": "Mozilla/5.0 (URLAnalyzerBot/1.0)"}
-        async with aiohttp.ClientSession(timeout=timeout, headers=headers) as session:
-            async with session.get(url, allow_redirects=True, ssl=False) as response:
-                result["redirect_count"] = len(response.history)
-                html = await response.text(errors="ignore")
-
-                soup = BeautifulSoup(html, "html.parser")
-
-                # 🔗 4. Подсчёт ссылок
-                for a in soup.find_all("a", href=True):
-                    href = a["href"]
-                    full = urljoin(url, href)
-                    if full.startswith(url):
-                        result["internal_links"] += 1
-                    else:
-                        result["external_links"] += 1
-
-                # 🪟 5. Подсчёт iframe
-                result["iframe_count"] = len(soup.find_all("iframe"))
-
-                # 🧭 6. Поиск трекинговых параметров
-                query_params = parse_qs(parsed.query)
-                tracking = [k for k in query_params.keys() if any(tp in k for tp in TRACKING_PARAMS)]
-                if tracking:
-                    result["tracking_params"] = tracking
-                    result["risk_flags"].append("tracking")
-
-                # 🧠 7. Поиск подозрительных слов в контенте
-                body_text = soup.get_text(" ").lower()
-                if any(kw in body_text for kw in SUSPICIOUS_KEYWORDS):
-                    result["risk_flags"].append("phishing_keywords")
+        session = get_session()
+        async with session.get(url, allow_redirects=True, ssl=False, headers=headers, timeout=PAGE_TIMEOUT) as response:
+            result["redirect_count"] = len(response.history)
+
+            keyword_hit = await _analyze_page(url, response, result)
+
+            # 🧭 6. Поиск трекинговых параметров
+            tracking = find_tracking_params(url)
+            if tracking:
+                result["tracking_params"] = tracking
+                result["risk_flags"].append("tracking")
+
+            # 🧠 7. Поиск подозрительных слов в контенте
+            if keyword_hit:
+                result["risk_flags"].append("phishing_keywords")
 
     except Exception as e:
         result["error"] = str(e)
 
     return result
+
+
+async def _read_body(response, result: dict, chunks: Optional[list] = None, received: int = 0) -> bytes:
+    """Читает (или дочитывает после уже прочитанных chunks) тело кусками, не больше PAGE_MAX_BYTES"""
+    chunks = [] if chunks is None else chunks
+    if not result["truncated"]:
+        async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+            if received + len(chunk) > PAGE_MAX_BYTES:
+                chunks.append(chunk[:PAGE_MAX_BYTES - received])
+                result["truncated"] = True
+                break
+            chunks.append(chunk)
+            received += len(chunk)
+    return b"".join(chunks)
+
+
+async def _scan_stream(url: str, response, charset: str, result: dict) -> dict:
+    """
+    Потоковый разбор: куски декодируются и скармливаются токенизатору по мере чтения.
+    Как только страница перерастает порог пула (utils/cpu_pool.offloads), прочитанное
+    и остаток уходят в пул одним телом — тогда в памяти держится до PAGE_MAX_BYTES.
+    """
+    stream = PageStream(url, charset)
+    chunks = []  # сырые байты до порога пула — на случай передачи туда
+    received = 0
+    async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+        if received + len(chunk) > PAGE_MAX_BYTES:
+            chunk = chunk[:PAGE_MAX_BYTES - received]
+            result["truncated"] = True
+        received += len(chunk)
+        chunks.append(chunk)
+        if offloads(received):
+            body = await _read_body(response, result, chunks, received)
+            return await run_cpu(parse_page, url, body, charset, "stream", size=len(body))
+        stream.feed(chunk)
+        if result["truncated"]:
+            break
+    count_inline()
+    return stream.close()
+
+
+async def _analyze_page(url: str, response, result: dict) -> bool:
+    """
+    Разбирает страницу: небольшие — потоком прямо в цикле, большие — в пуле процессов
+    (туда уходят только байты, обратно — счётчики). Возвращает, найдены ли подозрительные слова.
+    """
+    # Не-HTML контент не разбираем
+    if "Content-Type" in response.headers and response.content_type not in HTML_CONTENT_TYPES:
+        return False
+
+    charset = response.charset or "utf-8"
+    if ANALYZE_MODE == "stream":
+        parsed = await _scan_stream(url, response, charset, result)
+    else:
+        # BeautifulSoup строит дерево по всему документу — тело нужно целиком
+        body = await _read_body(response, result)
+        parsed = await run_cpu(parse_page, url, body, charset, ANALYZE_MODE, size=len(body))
+
+    result["internal_links"] = parsed["internal_links"]
+    result["external_links"] = parsed["external_links"]
+    result["iframe_count"] = parsed["iframe_count"]
+    return parsed["keyword_hit"]
@@ -0,0 +1,137 @@
+"""
+Разбор HTML страницы: ссылки, iframe, подозрительные слова.
+Только чистые функции без сети и asyncio — модуль выполняется в процессах пула utils/cpu_pool.
+"""
+import codecs
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+SUSPICIOUS_KEYWORDS = ["login", "secure", "verify", "update", "bank", "paypal", "signin", "account"]
+
+
+def _is_internal(url: str, href: str) -> bool:
+    return urljoin(url, href).startswith(url)
+
+
+def _parse_soup(url: str, html: str) -> dict:
+    """Полный разбор страницы через BeautifulSoup"""
+    soup = BeautifulSoup(html, "html.parser")
+    result = {"internal_links": 0, "external_links": 0}
+
+    # 🔗 Подсчёт ссылок
+    for a in soup.find_all("a", href=True):
+        if _is_internal(url, a["href"]):
+            result["internal_links"] += 1
+        else:
+            result["external_links"] += 1
+
+    # 🪟 Подсчёт iframe
+    result["iframe_count"] = len(soup.find_all("iframe"))
+
+    body_text = soup.get_text(" ").lower()
+    result["keyword_hit"] = any(kw in body_text for kw in SUSPICIOUS_KEYWORDS)
+    return result
+
+
+class _PageScanner(HTMLParser):
+    """Потоковый токенизатор: считает ссылки, iframe и ключевые слова без построения DOM"""
+
+    def __init__(self, url: str):
+        super().__init__(convert_charrefs=True)
+        self.url = url
+        self.internal_links = 0
+        self.external_links = 0
+        self.iframe_count = 0
+        self.keyword_hit = False
+        self._skip_depth = 0  # внутри <script>/<style> текст не учитывается
+        self._text = []  # текстовый узел может прийти несколькими кусками
+
+    def _flush_text(self):
+        if self._text and not self.keyword_hit:
+            text = "".join(self._text).lower()
+            self.keyword_hit = any(kw in text for kw in SUSPICIOUS_KEYWORDS)
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        if tag == "a":
+            attrs = dict(attrs)
+            if "href" in attrs:
+                if _is_internal(self.url, attrs["href"] or ""):
+                    self.internal_links += 1
+                else:
+                    self.external_links += 1
+        elif tag == "iframe":
+            self.iframe_count += 1
+        elif tag in ("script", "style"):
+            self._skip_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        # <script/> не открывает блок, который нужно пропускать
+        if tag not in ("script", "style"):
+            self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        if tag in ("script", "style") and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if not self.keyword_hit and not self._skip_depth:
+            self._text.append(data)
+
+    def close(self):
+        super().close()
+        self._flush_text()
+
+
+def _counts(scanner: _PageScanner) -> dict:
+    return {
+        "internal_links": scanner.internal_links,
+        "external_links": scanner.external_links,
+        "iframe_count": scanner.iframe_count,
+        "keyword_hit": scanner.keyword_hit,
+    }
+
+
+def _parse_stream(url: str, html: str) -> dict:
+    """Разбор токенизатором — без построения дерева"""
+    scanner = _PageScanner(url)
+    scanner.feed(html)
+    scanner.close()
+    return _counts(scanner)
+
+
+class PageStream:
+    """Инкрементальный разбор: байты страницы подаются кусками по мере чтения, тело целиком не хранится"""
+
+    def __init__(self, url: str, charset: str):
+        try:
+            self._decoder = codecs.getincrementaldecoder(charset or "utf-8")(errors="ignore")
+        except LookupError:
+            self._decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        self._scanner = _PageScanner(url)
+
+    def feed(self, chunk: bytes):
+        self._scanner.feed(self._decoder.decode(chunk))
+
+    def close(self) -> dict:
+        self._scanner.feed(self._decoder.decode(b"", final=True))
+        self._scanner.close()
+        return _counts(self._scanner)
+
+
+def parse_page(url: str, body: bytes, charset: str, mode: str = "stream") -> dict:
+    """
+    Разбирает сырое тело страницы.
+    Возвращает {"internal_links", "external_links", "iframe_count", "keyword_hit"}.
+    """
+    try:
+        html = body.decode(charset or "utf-8", errors="ignore")
+    except LookupError:
+        html = body.decode("utf-8", errors="ignore")
+    if mode == "soup":
+        return _parse_soup(url, html)
+    return _parse_stream(url, html)
@@ -0,0 +1,127 @@
+import asyncio
+import os
+import time
+from typing import Optional
+
+from utils.http_client import get_session, PAGE_TIMEOUT
+
+PSL_URL = "https://publicsuffix.org/list/public_suffix_list.dat"
+PSL_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "common", "public_suffix_list.dat")
+PSL_MAX_AGE = 60 * 60 * 24 * 7  # список меняется редко — обновляем раз в неделю
+PSL_RETRY_INTERVAL = 60 * 15  # после неудачной загрузки следующая попытка не раньше, с
+
+# Правила Public Suffix List: обычные, wildcard (*.ck) и исключения (!www.ck)
+_rules: Optional[set] = None
+_wildcards: set = set()
+_exceptions: set = set()
+_lock = asyncio.Lock()
+_next_attempt = 0.0  # time.monotonic(), раньше которого не скачиваем повторно
+
+
+# Дальше в списке — суффиксы частных сервисов (github.io, blogspot.com). Для RDAP/WHOIS они
+# не годятся: foo.github.io не зарегистрирован в реестре, спрашивать нужно про github.io
+PRIVATE_SECTION_MARKER = "===BEGIN PRIVATE DOMAINS==="
+
+
+def _parse(text: str):
+    """Разбирает только раздел ICANN — суффиксы, под которыми домены регистрируются в реестрах"""
+    global _rules, _wildcards, _exceptions
+    rules, wildcards, exceptions = set(), set(), set()
+    for line in text.splitlines():
+        line = line.strip()
+        if PRIVATE_SECTION_MARKER in line:
+            break
+        if not line or line.startswith("//"):
+            continue
+        rule = line.split()[0].lower()
+        if not rule.isascii():
+            # Хосты приходят в punycode, поэтому и правила приводим к нему
+            try:
+                rule = rule.encode("idna").decode()
+            except UnicodeError:
+                continue
+        if rule.startswith("!"):
+            exceptions.add(rule[1:])
+        elif rule.startswith("*."):
+            wildcards.add(rule[2:])
+        else:
+            rules.add(rule)
+    _rules, _wildcards, _exceptions = rules, wildcards, exceptions
+
+
+def _load_file():
+    with open(PSL_FILE, "r", encoding="utf-8") as f:
+        _parse(f.read())
+
+
+def _is_fresh() -> bool:
+    return os.path.exists(PSL_FILE) and time.time() - os.path.getmtime(PSL_FILE) < PSL_MAX_AGE
+
+
+def _up_to_date() -> bool:
+    """Список загружен и либо свежий, либо обновлять его пока не пытаемся (недавно не удалось)"""
+    return _rules is not None and (_is_fresh() or time.monotonic() < _next_attempt)
+
+
+async def ensure_loaded():
+    """
+    Загружает список из файла, при отсутствии или устаревании — скачивает.
+    Если скачать не удалось, до следующей попытки (PSL_RETRY_INTERVAL) работает устаревший список,
+    и вызовы не ждут тайм-аута сети друг за другом.
+    """
+    global _next_attempt
+    if _up_to_date():
+        return
+
+    async with _lock:
+        if _up_to_date():
+            return
+        if not _is_fresh() and time.monotonic() >= _next_attempt:
+            try:
+                session = get_session()
+                async with session.get(PSL_URL, timeout=PAGE_TIMEOUT) as resp:
+                    if resp.status == 200:
+                        text = await resp.text()
+                        with open(PSL_FILE, "w", encoding="utf-8") as f:
+                            f.write(text)
+                        _parse(text)
+                        print(f"[PSL] 📥 Public Suffix List обновлён ({len(_rules)} правил)")
+                        return
+                    print(f"[PSL] ⚠️ Ошибка загрузки: HTTP {resp.status}")
+            except Exception as e:
+                print(f"[PSL] ⚠️ Ошибка загрузки: {e}")
+            _next_attempt = time.monotonic() + PSL_RETRY_INTERVAL
+
+        if _rules is None and os.path.exists(PSL_FILE):
+            _load_file()
+
+
+def registrable_domain(hostname: str) -> str:
+    """
+    Регистрируемый домен (eTLD+1): a.b.example.co.uk → example.co.uk.
+    Без загруженного списка — два последних уровня.
+    """
+    labels = hostname.lower().strip(".").split(".")
+    if len(labels) < 2:
+        return hostname.lower()
+    if _rules is None:
+        return ".".join(labels[-2:])
+
+    # Длина публичного суффикса по самому длинному совпавшему правилу
+    suffix_len = 1
+    for i in range(len(labels)):
+        candidate = ".".join(labels[i:])
+        if candidate in _exceptions:
+            suffix_len = len(labels) - i - 1
+            break
+        if candidate in _rules:
+            suffix_len = len(labels) - i
+            break
+        parent = ".".join(labels[i + 1:])
+        if i + 1 < len(labels) and parent in _wildcards:
+            suffix_len = len(labels) - i
+            break
+
+    if suffix_len >= len(labels):
+        return hostname.lower()
+    return ".".join(labels[-(suffix_len + 1):])
@@ -0,0 +1,401 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import re
+import socket
+import time
+from typing import Optional
+from urllib.parse import unquote_to_bytes, urlsplit
+
+from utils.http_client import get_session, API_TIMEOUT
+
+# Локальная база префиксов Google Safe Browsing (Update API v4).
+# Список синхронизируется в фоне, URL проверяется локально,
+# и только при совпадении префикса идёт запрос fullHashes:find.
+
+API_KEY = os.getenv('GOOGLE_SAFE_BROWSING_KEY')
+GSB_API_BASE = os.getenv("GSB_API_BASE", "https://safebrowsing.googleapis.com/v4")
+GSB_STATE_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "common", "gsb_update.json")
+CLIENT = {"clientId": "your-bot", "clientVersion": "1.0"}
+
+THREAT_LISTS = [
+    {"threatType": t, "platformType": "ANY_PLATFORM", "threatEntryType": "URL"}
+    for t in ("MALWARE", "SOCIAL_ENGINEERING", "UNWANTED_SOFTWARE")
+]
+DEFAULT_SYNC_INTERVAL = 30 * 60
+
+
+# =========================
+#   КАНОНИЗАЦИЯ URL
+# =========================
+
+def _to_bytes(url) -> bytes:
+    """
+    Канонизация работает с байтами, как в спецификации. Символы до U+00FF — это сами байты
+    (так записаны тестовые векторы Google: http://\x01\x80.com/ → http://%01%80.com/),
+    остальные кодируются в UTF-8.
+    """
+    if isinstance(url, bytes):
+        return url
+    return b"".join(bytes((ord(c),)) if ord(c) < 0x100 else c.encode("utf-8") for c in url)
+
+
+def _unescape_fully(value: bytes) -> bytes:
+    """Снимает процентное кодирование, пока строка меняется"""
+    while True:
+        decoded = unquote_to_bytes(value)
+        if decoded == value:
+            return value
+        value = decoded
+
+
+def _escape(value: bytes) -> str:
+    """Экранирует байты <= 0x20, >= 0x7f, '#' и '%'"""
+    return "".join(
+        f"%{b:02X}" if b <= 0x20 or b >= 0x7F or b in (0x23, 0x25) else chr(b)
+        for b in value
+    )
+
+
+def _canonical_host(host: bytes) -> bytes:
+    host = re.sub(rb"\.+", b".", host.strip(b".")).lower()
+    # Десятичные, восьмеричные и шестнадцатеричные формы IPv4 приводим к a.b.c.d
+    if re.fullmatch(rb"(0x[0-9a-f]*|\d+)(\.(0x[0-9a-f]*|\d+)){0,3}", host):
+        try:
+            return socket.inet_ntoa(socket.inet_aton(host.decode())).encode()
+        except OSError:
+            pass
+    return host
+
+
+def _canonical_path(path: bytes) -> bytes:
+    segments = []
+    for segment in path.split(b"/"):
+        if segment == b"..":
+            if segments:
+                segments.pop()
+        elif segment not in (b"", b"."):
+            segments.append(segment)
+    canonical = b"/" + b"/".join(segments)
+    if path.endswith(b"/") and segments:
+        canonical += b"/"
+    return canonical
+
+
+def canonicalize(url) -> str:
+    """Канонизация URL по правилам Safe Browsing (str или bytes)"""
+    raw = re.sub(rb"[\t\r\n]", b"", _to_bytes(url).strip())
+    raw = raw.split(b"#", 1)[0]
+    if b"://" not in raw:
+        raw = b"http://" + raw
+
+    # Сначала делим на части и только потом раскодируем каждую:
+    # %23 в хосте или пути после раскодирования — это символ '#', а не начало фрагмента
+    scheme, rest = raw.split(b"://", 1)
+    authority, slash, path_query = re.match(rb"([^/?]*)([/?]?)(.*)", rest, re.DOTALL).groups()
+    path_query = slash + path_query
+    path, question, query = path_query.partition(b"?")
+
+    host = authority.rpartition(b"@")[2]
+    if re.search(rb":\d*$", host):
+        host = host.rsplit(b":", 1)[0]
+    host = _canonical_host(_unescape_fully(host))
+    path = _canonical_path(_unescape_fully(path or b"/"))
+    query = question + _unescape_fully(query)
+
+    return scheme.lower().decode("ascii", errors="replace") + "://" + _escape(host + path + query)
+
+
+def url_expressions(url: str) -> list[str]:
+    """Комбинации суффиксов хоста и префиксов пути для поиска в базе"""
+    parts = urlsplit(canonicalize(url), allow_fragments=False)
+    host = parts.hostname or ""
+    path = parts.path or "/"
+    query = parts.query
+
+    # Хост: точное имя и до 4 суффиксов из последних 5 компонентов (без одной TLD)
+    hosts = [host]
+    is_ip = re.fullmatch(r"[\d.]+", host) is not None
+    if not is_ip:
+        labels = host.split(".")[-5:]
+        for i in range(len(labels) - 1):
+            suffix = ".".join(labels[i:])
+            if suffix != host and len(hosts) < 5:
+                hosts.append(suffix)
+
+    # Путь: с query, без query и до 4 префиксов от корня
+    paths = []
+    if query:
+        paths.append(f"{path}?{query}")
+    paths.append(path)
+    directories = [s for s in path.split("/") if s]
+    if not path.endswith("/"):
+        directories = directories[:-1]
+    prefix = "/"
+    if prefix not in paths:
+        paths.append(prefix)
+    for segment in directories[:3]:
+        prefix = f"{prefix}{segment}/"
+        if prefix not in paths and len(paths) < 6:
+            paths.append(prefix)
+
+    return [f"{h}{p}" for h in hosts for p in paths]
+
+
+# =========================
+#   ЛОКАЛЬНАЯ БАЗА ПРЕФИКСОВ
+# =========================
+
+class PrefixStore:
+    """
+    Отсортированные префиксы хэшей одного списка угроз.
+    Для каждой длины префикса — один bytes-массив фиксированных записей.
+    """
+
+    def __init__(self):
+        self.state = ""
+        self._by_length: dict[int, bytes] = {}
+
+    def __len__(self) -> int:
+        return sum(len(blob) // length for length, blob in self._by_length.items())
+
+    def sorted_prefixes(self) -> list[bytes]:
+        prefixes = []
+        for length, blob in self._by_length.items():
+            prefixes += [blob[i:i + length] for i in range(0, len(blob), length)]
+        prefixes.sort()
+        return prefixes
+
+    def load(self, prefixes: list[bytes]):
+        grouped: dict[int, list[bytes]] = {}
+        for prefix in prefixes:
+            grouped.setdefault(len(prefix), []).append(prefix)
+        self._by_length = {length: b"".join(sorted(items)) for length, items in grouped.items()}
+
+    def match(self, full_hash: bytes) -> Optional[bytes]:
+        """Возвращает совпавший префикс или None (бинарный поиск в каждом массиве)"""
+        for length, blob in self._by_length.items():
+            prefix = full_hash[:length]
+            lo, hi = 0, len(blob) // length
+            while lo < hi:
+                mid = (lo + hi) // 2
+                value = blob[mid * length:(mid + 1) * length]
+                if value < prefix:
+                    lo = mid + 1
+                elif value > prefix:
+                    hi = mid
+                else:
+                    return prefix
+        return None
+
+    def apply_update(self, update: dict) -> bool:
+        """Применяет ответ threatListUpdates:fetch. False — контрольная сумма не сошлась."""
+        prefixes = [] if update.get("responseType") == "FULL_UPDATE" else self.sorted_prefixes()
+
+        removed = set()
+        for removal in update.get("removals", []):
+            removed.update(removal.get("rawIndices", {}).get("indices", []))
+        if removed:
+            prefixes = [p for i, p in enumerate(prefixes) if i not in removed]
+
+        for addition in update.get("additions", []):
+            raw = addition.get("rawHashes", {})
+            size = raw.get("prefixSize", 4)
+            blob = base64.b64decode(raw.get("rawHashes", ""))
+            prefixes += [blob[i:i + size] for i in range(0, len(blob), size)]
+        prefixes.sort()
+
+        expected = update.get("checksum", {}).get("sha256")
+        if expected and base64.b64encode(hashlib.sha256(b"".join(prefixes)).digest()).decode() != expected:
+            return False
+
+        self.load(prefixes)
+        self.state = update.get("newClientState", self.state)
+        return True
+
+    def to_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "prefixes": {str(length): base64.b64encode(blob).decode() for length, blob in self._by_length.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PrefixStore":
+        store = cls()
+        store.state = data.get("state", "")
+        store._by_length = {int(length): base64.b64decode(blob) for length, blob in data.get("prefixes", {}).items()}
+        return store
+
+
+def _list_key(threat_list: dict) -> str:
+    return f"{threat_list['threatType']}/{threat_list['platformType']}/{threat_list['threatEntryType']}"
+
+
+_stores: dict[str, PrefixStore] = {}
+# Кэш полных хэшей: {full_hash: (expires_at, [threatType, ...])} и отрицательный кэш префиксов
+_full_hash_cache: dict[bytes, tuple[float, list]] = {}
+_negative_cache: dict[bytes, float] = {}
+
+
+def is_loaded() -> bool:
+    """База уже синхронизирована или загружена из файла — по ней можно судить о URL"""
+    return any(store.state for store in _stores.values())
+
+
+def load_state():
+    """Загружает сохранённую базу префиксов"""
+    global _stores
+    if not os.path.exists(GSB_STATE_FILE):
+        return
+    try:
+        with open(GSB_STATE_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        _stores = {key: PrefixStore.from_dict(value) for key, value in data.items()}
+        print(f"[GSB] Загружено префиксов: {sum(len(s) for s in _stores.values())}")
+    except Exception as e:
+        print(f"[GSB] Ошибка загрузки базы: {e}")
+
+
+def _save_state():
+    tmp_path = f"{GSB_STATE_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({key: store.to_dict() for key, store in _stores.items()}, f)
+    os.replace(tmp_path, GSB_STATE_FILE)
+
+
+def _parse_duration(value: Optional[str], default: float) -> float:
+    """'593.44s' → 593.44"""
+    if not value:
+        return default
+    try:
+        return float(value.rstrip("s"))
+    except ValueError:
+        return default
+
+
+async def sync_threat_lists() -> float:
+    """Синхронизирует списки через threatListUpdates:fetch. Возвращает паузу до следующей синхронизации."""
+    payload = {
+        "client": CLIENT,
+        "listUpdateRequests": [
+            {
+                **threat_list,
+                "state": _stores.get(_list_key(threat_list), PrefixStore()).state,
+                "constraints": {"supportedCompressions": ["RAW"]},
+            }
+            for threat_list in THREAT_LISTS
+        ],
+    }
+
+    session = get_session()
+    async with session.post(f"{GSB_API_BASE}/threatListUpdates:fetch?key={API_KEY}", json=payload, timeout=API_TIMEOUT) as resp:
+        if resp.status != 200:
+            raise RuntimeError(f"threatListUpdates:fetch HTTP {resp.status}")
+        data = await resp.json()
+
+    for update in data.get("listUpdateResponses", []):
+        key = _list_key(update)
+        store = _stores.get(key) or PrefixStore()
+        if store.apply_update(update):
+            _stores[key] = store
+        else:
+            # Контрольная сумма не сошлась — при следующей синхронизации запросим список целиком
+            print(f"[GSB] ⚠️ {key} — неверная контрольная сумма, список сброшен")
+            _stores[key] = PrefixStore()
+
+    _save_state()
+    print(f"[GSB] 🔄 Синхронизировано, префиксов: {sum(len(s) for s in _stores.values())}")
+    return _parse_duration(data.get("minimumWaitDuration"), DEFAULT_SYNC_INTERVAL)
+
+
+async def schedule_gsb_sync():
+    """Фоновая задача: синхронизация списков с учётом minimumWaitDuration"""
+    load_state()
+    while True:
+        try:
+            wait = max(await sync_threat_lists(), DEFAULT_SYNC_INTERVAL)
+        except Exception as e:
+            print(f"[GSB] ⚠️ Ошибка синхронизации: {e}")
+            wait = DEFAULT_SYNC_INTERVAL
+        await asyncio.sleep(wait)
+
+
+async def _find_full_hashes(prefixes: list[bytes]) -> None:
+    """Запрашивает полные хэши для совпавших префиксов и кэширует ответ"""
+    payload = {
+        "client": CLIENT,
+        "clientStates": [store.state for store in _stores.values()],
+        "threatInfo": {
+            "threatTypes": [t["threatType"] for t in THREAT_LISTS],
+            "platformTypes": ["ANY_PLATFORM"],
+            "threatEntryTypes": ["URL"],
+            "threatEntries": [{"hash": base64.b64encode(p).decode()} for p in prefixes],
+        },
+    }
+
+    session = get_session()
+    async with session.post(f"{GSB_API_BASE}/fullHashes:find?key={API_KEY}", json=payload, timeout=API_TIMEOUT) as resp:
+        # Без ответа 200 ничего не кэшируем: иначе совпадения на время negativeCacheDuration станут "clean"
+        if resp.status != 200:
+            raise RuntimeError(f"fullHashes:find HTTP {resp.status}")
+        data = await resp.json()
+
+    now = time.time()
+    for full_hash in [h for h, (expires_at, _) in _full_hash_cache.items() if expires_at <= now]:
+        del _full_hash_cache[full_hash]
+    for prefix in [p for p, expires_at in _negative_cache.items() if expires_at <= now]:
+        del _negative_cache[prefix]
+
+    for match in data.get("matches", []):
+        full_hash = base64.b64decode(match["threat"]["hash"])
+        expires_at = now + _parse_duration(match.get("cacheDuration"), 300)
+        cached = _full_hash_cache.get(full_hash)
+        # Одна угроза может прийти несколько раз (по разным префиксам и спискам)
+        threats = list(dict.fromkeys((cached[1] if cached else []) + [match["threatType"]]))
+        _full_hash_cache[full_hash] = (expires_at, threats)
+
+    negative_until = now + _parse_duration(data.get("negativeCacheDuration"), 300)
+    for prefix in prefixes:
+        _negative_cache[prefix] = negative_until
+
+
+async def check_urls_local(urls: list[str]) -> dict[str, dict]:
+    """
+    Проверяет URL по локальной базе; в сеть — только при совпадении префикса.
+    Пока база не загружена, вердикта нет — "unknown", а не "clean".
+    """
+    if not is_loaded():
+        return {url: {"status": "unknown", "details": None} for url in urls}
+
+    now = time.time()
+    hashes = {url: [hashlib.sha256(e.encode()).digest() for e in url_expressions(url)] for url in urls}
+
+    # Префиксы, по которым нужен запрос полных хэшей
+    to_fetch = set()
+    for url_hashes in hashes.values():
+        for full_hash in url_hashes:
+            cached = _full_hash_cache.get(full_hash)
+            if cached and cached[0] > now:
+                continue
+            for store in _stores.values():
+                prefix = store.match(full_hash)
+                if prefix and _negative_cache.get(prefix, 0) <= now:
+                    to_fetch.add(prefix)
+
+    if to_fetch:
+        await _find_full_hashes(sorted(to_fetch))
+
+    results = {}
+    for url, url_hashes in hashes.items():
+        threats = []
+        for full_hash in url_hashes:
+            cached = _full_hash_cache.get(full_hash)
+            if cached and cached[0] > now:
+                threats += cached[1]
+        if threats:
+            results[url] = {"status": "danger", "details": [{"threatType": t} for t in dict.fromkeys(threats)]}
+        else:
+            results[url] = {"status": "clean", "details": None}
+    return results
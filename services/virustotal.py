@@ -1,35 +1,247 @@
-import aiohttp
+import asyncio
+import itertools
 import os
 import base64
+import time
+from typing import Callable, Optional
 
 from dotenv import find_dotenv, load_dotenv
 load_dotenv(find_dotenv())
 
+from utils.http_client import get_session, API_TIMEOUT
+from utils.circuit_breaker import get_breaker
+from utils.rate_limit import TokenBucket
+from utils.metrics import Counter, Gauge, instrument
+
 VT_KEY = os.getenv('VIRUSTOTAL_KEY')
-VT_URL = "https://www.virustotal.com/api/v3/urls"
+VT_API = "https://www.virustotal.com/api/v3"
+VT_URL = f"{VT_API}/urls"
+
+# Публичная квота VirusTotal — 4 запроса в минуту
+VT_RATE_PER_MINUTE = int(os.getenv("VT_RATE_PER_MINUTE", 4))
+VT_MAX_RETRIES = 3
+VT_POLL_INTERVAL = 60
+VT_POLL_MAX_AGE = 60 * 30  # дальше анализ считаем потерянным
+
+# Приоритеты очереди: меньше — раньше
+PRIORITY_INTERACTIVE = 0
+PRIORITY_POLL = 5
+PRIORITY_BACKGROUND = 10
+
+_bucket = TokenBucket(rate=VT_RATE_PER_MINUTE / 60, capacity=VT_RATE_PER_MINUTE)
+_queue: Optional[asyncio.PriorityQueue] = None
+_dispatcher: Optional[asyncio.Task] = None
+_poller: Optional[asyncio.Task] = None
+_seq = itertools.count()
+_paused_until = 0.0
+_stats = {"requests": 0, "throttled": 0, "completed_analyses": 0, "abandoned": 0}
+# Ответы 429/5xx и тайм-ауты размыкают выключатель — новые проверки не ждут очередь впустую.
+# Медленные ответы не считаются: задержку здесь создаёт в основном своя квота.
+_breaker = get_breaker("vt", slow_call=None)
+
+# Отправленные на анализ URL: {analysis_id: (url, submitted_at)}
+_pending_analyses: dict[str, tuple[str, float]] = {}
+# Кто хочет узнать о завершённых анализах: fn(url, result)
+_analysis_listeners: list[Callable[[str, dict], None]] = []
+
+Gauge("link_checker_vt_queue", "Запросы к VirusTotal в очереди").set_function(lambda: _queue.qsize() if _queue else 0)
+Gauge("link_checker_vt_pending_analyses", "Отправленные в VirusTotal анализы без результата").set_function(
+    lambda: len(_pending_analyses)
+)
+Counter(
+    "link_checker_vt_requests_total", "Запросы к VirusTotal: отправленные, ответы 429, брошенные до отправки", ("kind",)
+).set_function(
+    lambda: {(kind,): _stats[key] for kind, key in (("sent", "requests"), ("throttled", "throttled"), ("abandoned", "abandoned"))}
+)
+
+
+# =========================
+#   ОЧЕРЕДЬ ЗАПРОСОВ
+# =========================
+
+def set_quota_share(workers: int):
+    """Несколько воркеров делят одну квоту — каждому достаётся её часть"""
+    global _bucket
+    rate = VT_RATE_PER_MINUTE / workers
+    _bucket = TokenBucket(rate=rate / 60, capacity=max(1, int(rate)))
+
+
+def _ensure_dispatcher():
+    global _queue, _dispatcher
+    if _queue is None:
+        _queue = asyncio.PriorityQueue()
+    if _dispatcher is None or _dispatcher.done():
+        _dispatcher = asyncio.create_task(_dispatch())
+
+
+async def _dispatch():
+    """Выдаёт запросы из очереди по приоритету, не превышая квоту"""
+    while True:
+        priority, seq, request = await _queue.get()
+        # Вызывающий уже не ждёт (отменён по бюджету проверки) — квоту на него не тратим
+        if request["future"].done():
+            _stats["abandoned"] += 1
+            continue
+        pause = _paused_until - time.time()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        await _bucket.acquire()
+        if request["future"].done():
+            _bucket.release()
+            _stats["abandoned"] += 1
+            continue
+        asyncio.create_task(_execute(priority, seq, request))
+
+
+async def _execute(priority: int, seq: int, request: dict):
+    global _paused_until
+    future = request["future"]
+    if future.done():
+        return
+    if not _breaker.allow():
+        if not future.done():
+            future.set_exception(_breaker.reject())
+        return
+    try:
+        session = get_session()
+        _stats["requests"] += 1
+        async with session.request(
+            request["method"], request["url"],
+            headers={"x-apikey": VT_KEY}, timeout=API_TIMEOUT, **request["kwargs"],
+        ) as resp:
+            status = resp.status
+            retry_after = resp.headers.get("Retry-After", "")
+            data = None if status == 429 or status >= 500 else await resp.json(content_type=None)
+    except Exception as e:
+        _breaker.record(True)
+        if not future.done():
+            future.set_exception(e)
+        return
+    except BaseException:
+        _breaker.release()
+        raise
+    _breaker.record(data is None)
+
+    if data is None and request["attempt"] < VT_MAX_RETRIES:
+        delay = float(retry_after) if retry_after.isdigit() else 60 / VT_RATE_PER_MINUTE * 2 ** request["attempt"]
+        request["attempt"] += 1
+        print(f"[VT] ⏳ HTTP {status}, повтор через {delay:.0f} с")
+        if status == 429:
+            # Квота исчерпана — приостанавливаем всю очередь
+            _stats["throttled"] += 1
+            _paused_until = max(_paused_until, time.time() + delay)
+        else:
+            await asyncio.sleep(delay)
+        _queue.put_nowait((priority, seq, request))
+        return
+
+    if not future.done():
+        future.set_result((status, data if data is not None else {"error": {"code": f"HTTP {status}"}}))
+
+
+async def _request(method: str, url: str, priority: int, **kwargs) -> tuple[int, dict]:
+    """Ставит запрос в очередь с приоритетом и ждёт ответ"""
+    if _breaker.is_open():
+        raise _breaker.reject()
+    _ensure_dispatcher()
+    future = asyncio.get_running_loop().create_future()
+    request = {"method": method, "url": url, "kwargs": kwargs, "attempt": 0, "future": future}
+    _queue.put_nowait((priority, next(_seq), request))
+    return await future
 
-async def check_virustotal(url: str) -> dict:
-    headers = {"x-apikey": VT_KEY}
 
+# =========================
+#   ПРОВЕРКА URL
+# =========================
+
+def _result_from_stats(stats: dict) -> dict:
+    malicious = stats.get("malicious", 0)
+    suspicious = stats.get("suspicious", 0)
+
+    if malicious > 0 or suspicious > 0:
+        return {"status": "danger", "details": stats}
+    return {"status": "clean", "details": stats}
+
+
+@instrument("vt")
+async def check_virustotal(url: str, priority: int = PRIORITY_INTERACTIVE) -> dict:
     # Кодируем URL в base64
     url_id = base64.urlsafe_b64encode(url.encode()).decode().strip("=")
 
-    async with aiohttp.ClientSession(headers=headers) as session:
-        # Проверяем, есть ли уже анализ
-        async with session.get(f"{VT_URL}/{url_id}") as resp:
-            data = await resp.json()
-
-            # Если анализа нет — отправляем URL на сканирование
-            if "error" in data:
-                async with session.post(VT_URL, data={"url": url}) as post_resp:
-                    post_data = await post_resp.json()
-                    return {"status": "submitted", "details": post_data}
-
-            # Извлекаем статистику анализа
-            stats = data["data"]["attributes"]["last_analysis_stats"]
-            malicious = stats.get("malicious", 0)
-            suspicious = stats.get("suspicious", 0)
-
-            if malicious > 0 or suspicious > 0:
-                return {"status": "danger", "details": stats}
-            return {"status": "clean", "details": stats}
+    # Проверяем, есть ли уже анализ
+    status, data = await _request("GET", f"{VT_URL}/{url_id}", priority)
+
+    # Если анализа нет — отправляем URL на сканирование и следим за ним в фоне
+    if status == 404:
+        post_status, post_data = await _request("POST", VT_URL, priority, data={"url": url})
+        analysis_id = (post_data.get("data") or {}).get("id")
+        if post_status != 200 or not analysis_id:
+            # Отправка не удалась — анализа не будет, "submitted" здесь был бы неправдой
+            raise RuntimeError(f"VirusTotal submit error: HTTP {post_status} {post_data.get('error')}")
+        _pending_analyses[analysis_id] = (url, time.time())
+        _ensure_poller()
+        return {"status": "submitted", "details": post_data}
+
+    if "error" in data:
+        raise RuntimeError(f"VirusTotal error: {data['error']}")
+
+    # Извлекаем статистику анализа
+    stats = data["data"]["attributes"]["last_analysis_stats"]
+    return _result_from_stats(stats)
+
+
+# =========================
+#   ОТСЛЕЖИВАНИЕ АНАЛИЗОВ
+# =========================
+
+def add_analysis_listener(listener: Callable[[str, dict], None]):
+    """Регистрирует обработчик завершённых анализов: listener(url, result)"""
+    _analysis_listeners.append(listener)
+
+
+def _ensure_poller():
+    global _poller
+    if _poller is None or _poller.done():
+        _poller = asyncio.create_task(_poll_analyses())
+
+
+async def _poll_analyses():
+    """Фоновая задача: опрашивает отправленные анализы, пока они не завершатся"""
+    while _pending_analyses:
+        await asyncio.sleep(VT_POLL_INTERVAL)
+
+        for analysis_id, (url, submitted_at) in list(_pending_analyses.items()):
+            if time.time() - submitted_at > VT_POLL_MAX_AGE:
+                del _pending_analyses[analysis_id]
+                continue
+            try:
+                _, data = await _request("GET", f"{VT_API}/analyses/{analysis_id}", PRIORITY_POLL)
+            except Exception as e:
+                print(f"[VT] ⚠️ Ошибка опроса анализа {analysis_id}: {e}")
+                continue
+
+            attributes = (data.get("data") or {}).get("attributes", {})
+            if attributes.get("status") != "completed":
+                continue
+
+            del _pending_analyses[analysis_id]
+            _stats["completed_analyses"] += 1
+            result = _result_from_stats(attributes.get("stats", {}))
+            print(f"[VT] ✅ Анализ {url} завершён: {result['status']}")
+            for listener in _analysis_listeners:
+                try:
+                    listener(url, result)
+                except Exception as e:
+                    print(f"[VT] ⚠️ Ошибка обработчика анализа: {e}")
+
+
+def get_quota_state() -> dict:
+    """Состояние квоты и очереди VirusTotal"""
+    return {
+        "rate_per_minute": VT_RATE_PER_MINUTE,
+        "tokens_available": round(_bucket.available(), 2),
+        "queued": _queue.qsize() if _queue else 0,
+        "paused_for": max(0.0, round(_paused_until - time.time(), 1)),
+        "pending_analyses": len(_pending_analyses),
+        **_stats,
+    }
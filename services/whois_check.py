@@ -1,74 +1,232 @@
 import asyncio
 import datetime
+import json
+import os
 import re
-import aiohttp
+import time
+from typing import Optional
 
+from services.public_suffix import ensure_loaded, registrable_domain
+from utils.cache_backends import LRUCacheBackend, SQLiteCacheBackend
+from utils.circuit_breaker import CircuitOpenError, get_breaker
+from utils.http_client import get_session, API_TIMEOUT
+from utils.metrics import instrument
+
+COMMON_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "common")
+_rdap_breaker = get_breaker("rdap")
+
+# IANA bootstrap: какой RDAP-сервер отвечает за какую TLD
+RDAP_BOOTSTRAP_URL = "https://data.iana.org/rdap/dns.json"
+RDAP_BOOTSTRAP_FILE = os.path.join(COMMON_DIR, "rdap_dns.json")
+RDAP_BOOTSTRAP_MAX_AGE = 60 * 60 * 24 * 7
+RDAP_BOOTSTRAP_RETRY_INTERVAL = 60 * 15  # после неудачной загрузки следующая попытка не раньше, с
+RDAP_FALLBACK_URL = "https://rdap.org/"
+
+# Даты регистрации меняются раз в год — кэшируем надолго, но не дольше срока действия домена
+WHOIS_CACHE_DB = os.path.join(COMMON_DIR, "cache.sqlite3")
+WHOIS_MIN_TTL = 60 * 60 * 24
+WHOIS_MAX_TTL = 60 * 60 * 24 * 30
+WHOIS_DEFAULT_TTL = 60 * 60 * 24 * 7  # дата окончания неизвестна
+WHOIS_NEGATIVE_TTL = 60 * 60  # 404 помним час
+
+_whois_cache: Optional[LRUCacheBackend] = None
+_rdap_servers: Optional[dict] = None
+_bootstrap_lock = asyncio.Lock()
+_bootstrap_next_attempt = 0.0  # time.monotonic(), раньше которого не скачиваем повторно
+
+
+def _get_whois_cache() -> LRUCacheBackend:
+    global _whois_cache
+    if _whois_cache is None:
+        _whois_cache = LRUCacheBackend(SQLiteCacheBackend(WHOIS_CACHE_DB, table="whois"), maxsize=1000)
+    return _whois_cache
+
+
+def _parse_bootstrap(data: dict) -> dict:
+    servers = {}
+    for tlds, urls in data.get("services", []):
+        # Предпочитаем https-адреса
+        url = next((u for u in urls if u.startswith("https://")), urls[0] if urls else None)
+        if not url:
+            continue
+        for tld in tlds:
+            servers[tld.lower()] = url if url.endswith("/") else f"{url}/"
+    return servers
+
+
+def _bootstrap_is_fresh() -> bool:
+    return os.path.exists(RDAP_BOOTSTRAP_FILE) and time.time() - os.path.getmtime(RDAP_BOOTSTRAP_FILE) < RDAP_BOOTSTRAP_MAX_AGE
+
+
+def _bootstrap_up_to_date() -> bool:
+    """Bootstrap загружен и либо свежий, либо обновлять его пока не пытаемся (недавно не удалось)"""
+    return _rdap_servers is not None and (_bootstrap_is_fresh() or time.monotonic() < _bootstrap_next_attempt)
+
+
+async def _load_bootstrap():
+    """
+    Загружает IANA bootstrap из файла, при устаревании — скачивает.
+    Если скачать не удалось, до следующей попытки (RDAP_BOOTSTRAP_RETRY_INTERVAL) работает старый файл.
+    """
+    global _rdap_servers, _bootstrap_next_attempt
+    if _bootstrap_up_to_date():
+        return
+
+    async with _bootstrap_lock:
+        if _bootstrap_up_to_date():
+            return
+        if not _bootstrap_is_fresh() and time.monotonic() >= _bootstrap_next_attempt:
+            try:
+                session = get_session()
+                async with session.get(RDAP_BOOTSTRAP_URL, timeout=API_TIMEOUT) as resp:
+                    if resp.status == 200:
+                        data = await resp.json(content_type=None)
+                        with open(RDAP_BOOTSTRAP_FILE, "w", encoding="utf-8") as f:
+                            json.dump(data, f)
+                        _rdap_servers = _parse_bootstrap(data)
+                        return
+                    print(f"[WHOIS] ⚠️ Ошибка загрузки RDAP bootstrap: HTTP {resp.status}")
+            except Exception as e:
+                print(f"[WHOIS] ⚠️ Ошибка загрузки RDAP bootstrap: {e}")
+            _bootstrap_next_attempt = time.monotonic() + RDAP_BOOTSTRAP_RETRY_INTERVAL
+
+        if _rdap_servers is None and os.path.exists(RDAP_BOOTSTRAP_FILE):
+            with open(RDAP_BOOTSTRAP_FILE, "r", encoding="utf-8") as f:
+                _rdap_servers = _parse_bootstrap(json.load(f))
+
+
+async def _rdap_url(domain: str) -> str:
+    """Адрес RDAP-запроса сразу к серверу реестра, без редиректа через rdap.org"""
+    await _load_bootstrap()
+    tld = domain.rsplit(".", 1)[-1]
+    base = (_rdap_servers or {}).get(tld, RDAP_FALLBACK_URL)
+    return f"{base}domain/{domain}"
+
+
+def _parse_rdap(data: dict) -> dict:
+    """Извлекает из ответа RDAP только то, что нужно для отчёта"""
+    registrar = data.get("registrar", {}).get("name") or data.get("entities", [{}])[0].get("vcardArray", [[], []])[1][1] if data.get("entities") else "Unknown"
+
+    created_str = data.get("events", [{}])[0].get("eventDate")  # usually 'registration'
+    expires_str = None
+    for e in data.get("events", []):
+        if e.get("eventAction") == "expiration":
+            expires_str = e.get("eventDate")
+        elif e.get("eventAction") == "registration":
+            created_str = e.get("eventDate")
+
+    return {"registrar": registrar, "created": created_str, "expires": expires_str}
+
+
+def _parse_date(value: str) -> datetime.datetime:
+    date = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return date if date.tzinfo else date.replace(tzinfo=datetime.timezone.utc)
+
+
+def _build_result(domain: str, parsed: dict) -> dict:
+    """Считает возраст и риск. Выполняется при каждом чтении — возраст меняется каждый день."""
+    created_str = parsed["created"]
+    expires_str = parsed["expires"]
+
+    if created_str:
+        created = _parse_date(created_str)
+        age_days = (datetime.datetime.now(datetime.timezone.utc) - created).days
+        age_years = age_days // 365
+    else:
+        created = None
+        age_days = None
+        age_years = None
+
+    if expires_str:
+        expires = _parse_date(expires_str)
+        days_left = (expires - datetime.datetime.now(datetime.timezone.utc)).days
+    else:
+        expires = None
+        days_left = None
+
+    # Определяем уровень риска по возрасту домена
+    if age_days is not None:
+        if age_days < 90:
+            freshness = "🚨 Новый (меньше 3 месяцев)"
+            risk = "Высокий"
+        elif age_days < 365:
+            freshness = "⚠️ Молодой (менее 1 года)"
+            risk = "Средний"
+        else:
+            freshness = "✅ Старый (более года)"
+            risk = "Низкий"
+    else:
+        freshness = "❔ Не удалось определить"
+        risk = "Неизвестен"
+
+    return {
+        "domain": domain,
+        "registrar": parsed["registrar"] or "Unknown",
+        "created": str(created) if created else "Unknown",
+        "expires": str(expires) if expires else "Unknown",
+        "age_days": age_days,
+        "age_years": age_years,
+        "freshness": freshness,
+        "risk": risk,
+        "days_left": days_left
+    }
+
+
+def _positive_ttl(parsed: dict) -> float:
+    """TTL записи: до окончания регистрации, в пределах [WHOIS_MIN_TTL, WHOIS_MAX_TTL]"""
+    if not parsed["expires"]:
+        return WHOIS_DEFAULT_TTL
+    try:
+        expires = _parse_date(parsed["expires"])
+    except ValueError:
+        return WHOIS_DEFAULT_TTL
+    return max(WHOIS_MIN_TTL, min(expires.timestamp() - time.time(), WHOIS_MAX_TTL))
+
+
+def _remember(domain: str, data: dict, ttl: float):
+    now = time.time()
+    _get_whois_cache().set(domain, {"timestamp": now, "expires_at": now + ttl, "data": data})
+
+
+@instrument("whois")
 async def fetch_whois_data(domain: str) -> dict:
     """
-    Получает WHOIS-информацию с публичного API.
+    Получает WHOIS-информацию через RDAP.
+    Запрашивается регистрируемый домен (a.b.example.com → example.com), ответ кэшируется надолго.
     """
 
+    await ensure_loaded()
+    domain = registrable_domain(domain)
+
+    # ⚡ Кэш по регистрируемому домену
+    cache = _get_whois_cache()
+    entry = cache.get(domain)
+    if entry and entry["expires_at"] > time.time():
+        if entry["data"].get("not_found"):
+            return {"error": "WHOIS data not available (HTTP 404)"}
+        return _build_result(domain, entry["data"])
+
     # ✅ Используем RDAP
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"https://rdap.org/domain/{domain}") as resp:
+        rdap_url = await _rdap_url(domain)
+        async with _rdap_breaker.guard():
+            session = get_session()
+            async with session.get(rdap_url, timeout=API_TIMEOUT) as resp:
+                # 429/5xx — сбой сервера RDAP, а 404 и прочие 4xx — нормальный ответ про домен
+                if resp.status == 429 or resp.status >= 500:
+                    raise RuntimeError(f"RDAP HTTP {resp.status}")
+                if resp.status == 404:
+                    _remember(domain, {"not_found": True}, WHOIS_NEGATIVE_TTL)
                 if resp.status != 200:
                     return {"error": f"WHOIS data not available (HTTP {resp.status})"}
-                data = await resp.json()
-
-        # Извлекаем нужные поля
-        registrar = data.get("registrar", {}).get("name") or data.get("entities", [{}])[0].get("vcardArray", [[], []])[1][1] if data.get("entities") else "Unknown"
-
-        created_str = data.get("events", [{}])[0].get("eventDate")  # usually 'registration'
-        expires_str = None
-        for e in data.get("events", []):
-            if e.get("eventAction") == "expiration":
-                expires_str = e.get("eventDate")
-            elif e.get("eventAction") == "registration":
-                created_str = e.get("eventDate")
-
-        if created_str:
-            created = datetime.datetime.fromisoformat(created_str.replace("Z", "+00:00"))
-            age_days = (datetime.datetime.utcnow() - created).days
-            age_years = age_days // 365
-        else:
-            created = None
-            age_days = None
-            age_years = None
+                data = await resp.json(content_type=None)
 
-        if expires_str:
-            expires = datetime.datetime.fromisoformat(expires_str.replace("Z", "+00:00"))
-            days_left = (expires - datetime.datetime.utcnow()).days
-        else:
-            expires = None
-            days_left = None
-
-        # Определяем уровень риска по возрасту домена
-        if age_days is not None:
-            if age_days < 90:
-                freshness = "🚨 Новый (меньше 3 месяцев)"
-                risk = "Высокий"
-            elif age_days < 365:
-                freshness = "⚠️ Молодой (менее 1 года)"
-                risk = "Средний"
-            else:
-                freshness = "✅ Старый (более года)"
-                risk = "Низкий"
-        else:
-            freshness = "❔ Не удалось определить"
-            risk = "Неизвестен"
-
-        return {
-            "domain": domain,
-            "registrar": registrar or "Unknown",
-            "created": str(created) if created else "Unknown",
-            "expires": str(expires) if expires else "Unknown",
-            "age_days": age_days,
-            "age_years": age_years,
-            "freshness": freshness,
-            "risk": risk,
-            "days_left": days_left
-        }
+        parsed = _parse_rdap(data)
+        _remember(domain, parsed, _positive_ttl(parsed))
+        return _build_result(domain, parsed)
 
+    except CircuitOpenError as e:
+        # RDAP отключён после серии сбоев — не ждём его
+        return {"error": f"WHOIS error: {e}", "circuit": "open"}
     except Exception as e:
         return {"error": f"WHOIS error: {e}"}
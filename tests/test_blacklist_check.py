@@ -0,0 +1,55 @@
+"""
+check_blacklists по подменённому индексу фидов: совпадения по режимам и возраст снимка.
+
+    python -m pytest -q tests
+"""
+import time
+import unittest
+from unittest import mock
+
+from services import blacklist_check
+from services.blacklist_check import MATCH_EXACT, MATCH_HOST, check_blacklists
+
+FEED = "https://openphish.com/feed.txt"
+OTHER_FEED = "https://phishunt.io/feed.txt"
+
+
+class CheckBlacklistsTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        now = time.time()
+        feed = blacklist_check._parse_feed("https://evil.example.com/login/verify\n# комментарий\n")
+        feed["loaded_at"] = now - 120
+        other = blacklist_check._parse_feed("http://phish.test/\n")
+        other["loaded_at"] = now - 600
+        patch = mock.patch.object(blacklist_check, "_index", {FEED: feed, OTHER_FEED: other})
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    async def test_danger_and_clean_share_the_shape(self):
+        danger = await check_blacklists("https://EVIL.example.com/login/verify/?utm_source=tg")
+        clean = await check_blacklists("https://example.org/")
+
+        self.assertEqual(danger["status"], "danger")
+        self.assertEqual(danger["details"], {"blacklist": FEED, "match": "prefix"})
+        self.assertAlmostEqual(danger["snapshot_age"], 120, delta=2)
+
+        self.assertEqual(clean["status"], "clean")
+        self.assertIsNone(clean["details"])
+        self.assertAlmostEqual(clean["snapshot_age"], 600, delta=2)  # самый старый фид
+
+    async def test_match_modes(self):
+        deeper = "https://evil.example.com/login/verify/step2"
+        self.assertEqual((await check_blacklists(deeper))["status"], "danger")
+        self.assertEqual((await check_blacklists(deeper, MATCH_EXACT))["status"], "clean")
+        self.assertEqual((await check_blacklists("https://evil.example.com/", MATCH_HOST))["status"], "danger")
+        self.assertEqual((await check_blacklists("https://evil.example.com/login"))["status"], "clean")
+
+    async def test_not_loaded(self):
+        with mock.patch.object(blacklist_check, "_index", {}):
+            result = await check_blacklists("https://example.org/")
+        self.assertEqual(result["status"], "unknown")
+        self.assertNotIn("snapshot_age", result)
+
+
+if __name__ == "__main__":
+    unittest.main()
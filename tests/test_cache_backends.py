@@ -0,0 +1,115 @@
+"""
+LogCacheBackend: учёт мусора, compact() и повторная загрузка файла.
+
+    python -m pytest -q tests
+"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from utils import cache_backends
+from utils.cache_backends import LogCacheBackend
+
+NOW = 1_700_000_000.0
+
+
+def _entry(value, ttl: float = 3600) -> dict:
+    return {"timestamp": NOW, "expires_at": NOW + ttl, "soft_expires_at": NOW + ttl / 2, "data": {"value": value}}
+
+
+class LogCacheBackendTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="logcache_test_")
+        self.path = os.path.join(self.workdir, "cache.log")
+        self.backend = self._open()
+
+    def _open(self) -> LogCacheBackend:
+        backend = LogCacheBackend(self.path)
+        self.addCleanup(backend.close)
+        return backend
+
+    def _fill(self):
+        self.backend.set_many([(f"https://site{i}.com/", _entry(i)) for i in range(10)])
+        self.backend.set("https://site0.com/", _entry("new"))  # перезапись
+        self.backend.delete("https://site1.com/")
+        self.backend.set("https://old.com/", _entry("old", ttl=-1))  # уже устарела
+        self.backend.set_meta("version", "1")
+        self.backend.set_meta("version", "2")
+
+    def _check_contents(self, backend: LogCacheBackend):
+        self.assertEqual(backend.get("https://site0.com/")["data"], {"value": "new"})
+        self.assertIsNone(backend.get("https://site1.com/"))
+        self.assertEqual(backend.get("https://site9.com/"), _entry(9))
+        self.assertEqual(backend.get_meta("version"), "2")
+
+    def test_reload_replays_the_log(self):
+        self._fill()
+        self.backend.close()
+
+        backend = self._open()
+        self._check_contents(backend)
+        self.assertEqual(len(backend), 10)  # 9 + устаревшая, до compact() она остаётся
+        self.assertGreater(backend.garbage_ratio(), 0)
+
+    def test_compact_drops_garbage_and_survives_reload(self):
+        self._fill()
+        size_before = os.path.getsize(self.path)
+        self.assertGreater(self.backend.garbage_ratio(), 0)
+
+        self.assertEqual(self.backend.compact(now=NOW), 1)
+        self.assertEqual(self.backend.garbage_ratio(), 0.0)
+        self.assertLess(os.path.getsize(self.path), size_before)
+        self.assertFalse(os.path.exists(self.path + ".compact"))
+        self._check_contents(self.backend)
+        self.assertIsNone(self.backend.get("https://old.com/"))
+
+        # После compact() дозапись идёт в новый файл
+        self.backend.set("https://after.com/", _entry("after"))
+        self.backend.close()
+
+        backend = self._open()
+        self._check_contents(backend)
+        self.assertEqual(len(backend), 10)
+        self.assertEqual(backend.get("https://after.com/")["data"], {"value": "after"})
+        self.assertEqual(backend.garbage_ratio(), 0.0)
+
+    def test_writes_during_compact_are_kept(self):
+        self._fill()
+        real_fsync = os.fsync
+
+        def write_meanwhile(fd):
+            # Копирование уже закончено, но файл ещё не подменён
+            self.backend.set("https://site2.com/", _entry("meanwhile"))
+            self.backend.delete("https://site3.com/")
+            self.backend.set("https://fresh.com/", _entry("fresh"))
+            real_fsync(fd)
+
+        with mock.patch.object(cache_backends.os, "fsync", write_meanwhile):
+            self.backend.compact(now=NOW)
+
+        def check(backend: LogCacheBackend):
+            self._check_contents(backend)
+            self.assertEqual(backend.get("https://site2.com/")["data"], {"value": "meanwhile"})
+            self.assertIsNone(backend.get("https://site3.com/"))
+            self.assertEqual(backend.get("https://fresh.com/")["data"], {"value": "fresh"})
+            self.assertEqual(len(backend), 9)
+
+        check(self.backend)
+        self.backend.close()
+        check(self._open())
+
+    def test_torn_tail_is_truncated(self):
+        self._fill()
+        self.backend.close()
+        size = os.path.getsize(self.path)
+        with open(self.path, "ab") as f:
+            f.write(LogCacheBackend.HEADER.pack(LogCacheBackend.ENTRY, 100, NOW, 3) + b"abc" + b"\x00" * 10)
+
+        backend = self._open()
+        self.assertEqual(os.path.getsize(self.path), size)
+        self._check_contents(backend)
+
+
+if __name__ == "__main__":
+    unittest.main()
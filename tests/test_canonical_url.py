@@ -0,0 +1,60 @@
+"""
+canonicalize_url: разные записи одного адреса дают один ключ кэша, разные адреса — разные.
+
+    python -m pytest -q tests
+"""
+import unittest
+
+from utils.canonical_url import canonicalize_url
+
+
+class CanonicalizeUrlTest(unittest.TestCase):
+    def test_same_page_gives_same_key(self):
+        variants = [
+            "https://example.com/login",
+            "HTTPS://WWW.Example.COM/login",
+            "https://example.com:443/login/",
+            "https://example.com/./a/../login",
+            "https://example.com//login#form",
+            " https://example.com/login?utm_source=tg&utm_medium=chat ",
+        ]
+        for url in variants:
+            with self.subTest(url=url):
+                self.assertEqual(canonicalize_url(url), "https://example.com/login")
+
+    def test_scheme_less_url_is_http(self):
+        self.assertEqual(canonicalize_url("example.com"), "http://example.com/")
+        self.assertEqual(canonicalize_url("example.com/a?b=1"), "http://example.com/a?b=1")
+
+    def test_non_default_port_is_kept(self):
+        self.assertEqual(canonicalize_url("https://example.com:8443"), "https://example.com:8443/")
+        self.assertEqual(canonicalize_url("http://example.com:443/"), "http://example.com:443/")
+
+    def test_idna_host(self):
+        self.assertEqual(
+            canonicalize_url("https://Пример.РФ/путь"),
+            "https://xn--e1afmkfd.xn--p1ai/%D0%BF%D1%83%D1%82%D1%8C",
+        )
+
+    def test_escapes(self):
+        # Незарезервированные символы раскодируются, %2F остаётся — это другой путь
+        self.assertEqual(canonicalize_url("http://example.com/%7euser/%2f%41"), "http://example.com/~user/%2FA")
+        self.assertEqual(canonicalize_url("http://example.com/a b"), "http://example.com/a%20b")
+
+    def test_query_is_sorted_without_tracking(self):
+        self.assertEqual(
+            canonicalize_url("https://example.com/?b=2&fbclid=x&a=1&gclid=y&utm_campaign=z"),
+            "https://example.com/?a=1&b=2",
+        )
+        # Параметр, который лишь содержит «ref», не трекинговый
+        self.assertEqual(canonicalize_url("https://example.com/?referrer=1"), "https://example.com/?referrer=1")
+        self.assertEqual(canonicalize_url("https://example.com/?q="), "https://example.com/?q=")
+
+    def test_different_pages_stay_different(self):
+        self.assertNotEqual(canonicalize_url("https://example.com/a"), canonicalize_url("https://example.com/b"))
+        self.assertNotEqual(canonicalize_url("http://example.com/"), canonicalize_url("https://example.com/"))
+        self.assertNotEqual(canonicalize_url("https://example.com/?id=1"), canonicalize_url("https://example.com/?id=2"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+"""
+run_link_check с подменёнными провайдерами, которые возвращают ответы настоящего вида.
+
+    python -m pytest -q tests
+"""
+import asyncio
+import unittest
+from unittest import mock
+
+from services import checker
+from utils.report import render
+
+URL = "https://example.com/login"
+
+INFRA = {
+    "hostname": "example.com",
+    "is_https": True,
+    "ssl_info": {"valid": True, "issued_to": "example.com", "issued_by": "Let's Encrypt", "days_left": 60},
+    "ip_info": {"ip": "93.184.216.34", "ips": ["93.184.216.34"], "cname": None,
+                "country": "United States", "org": "Edgecast", "asn": "AS15133", "source": "local"},
+    "cdn": "Не используется или неизвестен",
+    "proxy_suspect": False,
+    "whois": {"registrar": "Example Registrar", "age_days": 9000},
+}
+
+LINK_ANALYSIS = {
+    "masked_domain": None,
+    "is_punycode": False,
+    "redirect_count": 0,
+    "iframe_count": 0,
+    "internal_links": 3,
+    "external_links": 1,
+    "tracking_params": [],
+    "risk_flags": [],
+    "truncated": False,
+}
+
+
+def _returning(value, delay: float = 0.0):
+    async def provider(url, *args, **kwargs):
+        await asyncio.sleep(delay)
+        return value
+    return provider
+
+
+class RunLinkCheckTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.cache = {}
+        patches = [
+            mock.patch.object(checker, "check_google_safebrowsing", _returning({"status": "clean", "details": None})),
+            mock.patch.object(checker, "check_virustotal", _returning({"status": "clean", "details": {"malicious": 0}})),
+            mock.patch.object(checker, "check_blacklists", _returning({"status": "clean", "details": []})),
+            mock.patch.object(checker, "check_infrastructure", _returning(INFRA)),
+            mock.patch.object(checker, "analyze_link", _returning(LINK_ANALYSIS)),
+            mock.patch.object(checker, "set_cache", self.cache.__setitem__),
+            mock.patch.object(checker, "get_cache", self.cache.get),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def test_all_providers_answer(self):
+        record = await checker.run_link_check(URL)
+
+        self.assertEqual(record.results["infra"]["ip_info"]["ip"], "93.184.216.34")
+        self.assertEqual(record.results["link_analysis"]["internal_links"], 3)
+        self.assertEqual(len(self.cache), 1)
+        self.assertIn(URL, render(record))
+
+    async def test_slow_provider_without_status_is_finished_in_background(self):
+        with mock.patch.object(checker, "check_infrastructure", _returning(INFRA, delay=0.2)), \
+                mock.patch.dict(checker.PROVIDER_BUDGETS, {"infra": 0.05}):
+            record = await checker.run_link_check(URL)
+            self.assertEqual(record.results["infra"]["status"], "timeout")
+            self.assertIn("Не успели ответить", render(record))
+
+            # Опоздавший ответ дописывается в ту же запись кэша
+            await asyncio.sleep(0.3)
+            (data,) = self.cache.values()
+            self.assertEqual(data["results"]["infra"]["hostname"], "example.com")
+
+    async def test_failing_provider_is_reported_as_error(self):
+        async def broken(url, *args, **kwargs):
+            raise RuntimeError("boom")
+
+        with mock.patch.object(checker, "analyze_link", broken):
+            record = await checker.run_link_check(URL)
+        self.assertEqual(record.results["link_analysis"]["status"], "error")
+
+    async def test_cached_result_is_shown_for_requesters_url(self):
+        tracked = {**LINK_ANALYSIS, "tracking_params": ["utm_source"], "risk_flags": ["tracking"]}
+        with mock.patch.object(checker, "analyze_link", _returning(tracked)):
+            await checker.run_link_check("https://www.example.com/login?utm_source=mail")
+        (data,) = self.cache.values()
+        now = data["checked_at"]
+        entry = {"timestamp": now, "soft_expires_at": now + 60, "expires_at": now + 120, "data": data}
+
+        with mock.patch.object(checker, "get_cache_entry", return_value=entry):
+            record = checker.get_cached_result(URL)
+        self.assertEqual(record.url, URL)
+        self.assertEqual(record.results["link_analysis"]["tracking_params"], [])
+        self.assertNotIn("tracking", record.results["link_analysis"]["risk_flags"])
+        self.assertNotIn("utm_source", render(record))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+"""
+CircuitBreaker: замкнут → разомкнут → пробный вызов → замкнут или снова разомкнут.
+
+    python -m pytest -q tests
+"""
+import unittest
+from unittest import mock
+
+from utils import circuit_breaker
+from utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class CircuitBreakerTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patches = [
+            mock.patch.object(circuit_breaker, "time", self.clock),
+            mock.patch.object(circuit_breaker, "BREAKER_WINDOW", 60.0),
+            mock.patch.object(circuit_breaker, "BREAKER_MIN_CALLS", 5),
+            mock.patch.object(circuit_breaker, "BREAKER_ERROR_RATE", 0.5),
+            mock.patch.object(circuit_breaker, "BREAKER_COOLDOWN", 30.0),
+            mock.patch.object(circuit_breaker, "BREAKER_MAX_COOLDOWN", 300.0),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.breaker = CircuitBreaker("test", slow_call=5.0)
+
+    def _fail(self, count: int):
+        for _ in range(count):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record(True)
+
+    def test_stays_closed_below_min_calls(self):
+        self._fail(4)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_stays_closed_below_error_rate(self):
+        for failed in (False, False, True, False, True, False):
+            self.breaker.record(failed)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_old_failures_leave_the_window(self):
+        self._fail(4)
+        self.clock.now += 61
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_slow_call_counts_as_failure(self):
+        for _ in range(5):
+            self.breaker.record(False, elapsed=6.0)
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_open_half_open_closed(self):
+        self._fail(5)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.retry_in(), 30.0)
+
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertFalse(self.breaker.allow())  # пробный вызов только один
+
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.error_rate(), 0.0)
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_probe_doubles_cooldown(self):
+        self._fail(5)
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.retry_in(), 60.0)
+        self.assertEqual(self.breaker.stats["opened"], 2)
+
+        # После удачной пробы пауза снова начинается с BREAKER_COOLDOWN
+        self.clock.now += 60
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record(False)
+        self._fail(5)
+        self.assertEqual(self.breaker.retry_in(), 30.0)
+
+    def test_cancelled_probe_is_released(self):
+        self._fail(5)
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.breaker.release()
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertTrue(self.breaker.allow())
+
+    async def test_guard_rejects_when_open(self):
+        for _ in range(5):
+            with self.assertRaises(ValueError):
+                async with self.breaker.guard():
+                    raise ValueError("upstream error")
+        self.assertEqual(self.breaker.state, OPEN)
+
+        with self.assertRaises(CircuitOpenError) as raised:
+            async with self.breaker.guard():
+                self.fail("вызов не должен выполняться")
+        self.assertEqual(raised.exception.retry_in, 30.0)
+        self.assertEqual(self.breaker.stats["short_circuited"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
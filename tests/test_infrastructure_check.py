@@ -0,0 +1,42 @@
+"""
+check_infrastructure: из какой части ссылки берётся хост для SSL, IP и WHOIS.
+
+    python -m pytest -q tests
+"""
+import unittest
+from unittest import mock
+
+from services import infrastructure_check
+
+
+class CheckInfrastructureHostTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.hosts = []
+
+        async def record(hostname, *args, **kwargs):
+            self.hosts.append(hostname)
+            return {}
+
+        patches = [
+            mock.patch.object(infrastructure_check, name, record)
+            for name in ("resolve", "get_ssl_info", "get_ip_info", "fetch_whois_data")
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def test_url_without_scheme(self):
+        result = await infrastructure_check.check_infrastructure("www.example.com/login?next=/")
+        self.assertEqual(result["hostname"], "www.example.com")
+        self.assertEqual(set(self.hosts), {"www.example.com"})
+        self.assertFalse(result["is_https"])
+
+    async def test_port_and_credentials_are_not_part_of_host(self):
+        result = await infrastructure_check.check_infrastructure("https://user@Example.com:8443/path")
+        self.assertEqual(result["hostname"], "example.com")
+        self.assertEqual(set(self.hosts), {"example.com"})
+        self.assertTrue(result["is_https"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+"""
+Локальная база IP-диапазонов: поиск по границам, промахи, IPv6 и замена файла при обновлении.
+
+    python -m pytest -q tests
+"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from services import ip_database
+from services.ip_database import IPDatabase, build_database
+
+RANGES = [
+    "1.0.0.0\t1.0.0.255\t13335\tUS\tCLOUDFLARENET\n",
+    "1.0.1.0\t1.0.3.255\t4134\tCN\tCHINANET\n",
+    "5.0.0.0\t5.0.0.255\t0\tNone\tNot routed\n",
+    "8.8.8.0\t8.8.8.255\t15169\tUS\tGOOGLE\n",
+    "9.9.9.0\t9.9.9.255\t64500\tNone\tNO COUNTRY\n",
+    "2001:db8::\t2001:db8::ffff\t3320\tDE\tDTAG\n",
+]
+
+
+class LookupTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="ipdb_test_")
+        path = os.path.join(self.workdir, "db.bin")
+        build_database(RANGES, path)
+        self.db = IPDatabase(path)
+        self.addCleanup(self.db.close)
+
+    def test_range_boundaries_are_inclusive(self):
+        for ip in ("1.0.0.0", "1.0.0.128", "1.0.0.255"):
+            self.assertEqual(self.db.lookup(ip)["org"], "CLOUDFLARENET", ip)
+        self.assertEqual(self.db.lookup("1.0.1.0")["asn"], "AS4134")
+        self.assertEqual(self.db.lookup("1.0.3.255")["country"], "China")
+
+    def test_misses(self):
+        self.assertIsNone(self.db.lookup("0.255.255.255"))  # раньше первого диапазона
+        self.assertIsNone(self.db.lookup("1.0.4.0"))  # сразу за концом диапазона
+        self.assertIsNone(self.db.lookup("5.0.0.1"))  # ASN 0 не попадает в базу
+        self.assertIsNone(self.db.lookup("200.0.0.1"))  # после последнего IPv4
+        self.assertIsNone(self.db.lookup("2001:db8::1:0"))
+
+    def test_ipv6(self):
+        found = self.db.lookup("2001:db8::abcd")
+        self.assertEqual(found, {"country": "Germany", "country_code": "DE", "asn": "AS3320", "org": "DTAG"})
+
+    def test_unknown_country(self):
+        found = self.db.lookup("9.9.9.9")
+        self.assertEqual(found["country"], "Unknown")
+        self.assertIsNone(found["country_code"])
+
+
+class RefreshSwitchTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="ipdb_test_")
+        patches = [
+            mock.patch.object(ip_database, "IP_DB_DIR", self.workdir),
+            mock.patch.object(ip_database, "IP_DB_FILE", os.path.join(self.workdir, "ip2asn.current")),
+            mock.patch.object(ip_database, "IP_DB_LEGACY_FILE", os.path.join(self.workdir, "ip2asn.bin")),
+            mock.patch.object(ip_database, "_db", None),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(lambda: ip_database._db and ip_database._db.close())
+
+    def _build(self, name: str, lines: list) -> str:
+        path = os.path.join(self.workdir, name)
+        build_database(lines, path)
+        return path
+
+    def test_new_version_replaces_the_open_one(self):
+        # Старая установка: база в ip2asn.bin без указателя
+        self._build("ip2asn.bin", RANGES[:1])
+        ip_database.load_ip_database()
+        self.assertEqual(ip_database.lookup_ip("1.0.0.1")["org"], "CLOUDFLARENET")
+
+        first = self._build("ip2asn-1.bin", ["1.0.0.0\t1.0.0.255\t64501\tNL\tNEW ORG\n"])
+        ip_database._activate(first)
+        self.assertEqual(ip_database.lookup_ip("1.0.0.1")["org"], "NEW ORG")
+
+        # Прежний файл открыт через mmap до самого переключения — новый пишется рядом
+        second = self._build("ip2asn-2.bin", RANGES)
+        ip_database._activate(second)
+        self.assertEqual(ip_database.lookup_ip("1.0.0.1")["org"], "CLOUDFLARENET")
+        self.assertEqual(ip_database.lookup_ip("8.8.8.8")["org"], "GOOGLE")
+        self.assertIsNone(ip_database.lookup_ip("not an ip"))
+
+        self.assertEqual(sorted(os.listdir(self.workdir)), ["ip2asn-2.bin", "ip2asn.current"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+analyze_link на странице из bench/stubs.py: небольшие страницы разбираются потоком в цикле,
+большие — уходят в пул процессов.
+
+    python -m pytest -q tests
+"""
+import unittest
+from unittest import mock
+
+from bench.stubs import StubConfig, _page, start_stubs
+from services import link_analyzer
+from services.page_parser import parse_page
+from utils import cpu_pool
+from utils.http_client import close_http_client
+
+
+class AnalyzePageTest(unittest.IsolatedAsyncioTestCase):
+    """Общая подготовка: заглушка со страницей PAGE_SIZE байт и подменённый пул"""
+
+    PAGE_SIZE = 8 * 1024
+
+    async def asyncSetUp(self):
+        self.runner, self.base_url = await start_stubs(StubConfig(latency=0, page_size=self.PAGE_SIZE))
+        self.url = f"{self.base_url}/page/1"
+        self.expected = parse_page(self.url, _page(self.PAGE_SIZE, "1"), "utf-8")
+        self.pool_calls = []
+
+        async def fake_run_cpu(func, *args, size=0):
+            self.pool_calls.append(size)
+            return func(*args)
+
+        patches = [
+            mock.patch.object(cpu_pool, "CPU_WORKERS", 2),
+            mock.patch.object(cpu_pool, "CPU_INLINE_BYTES", 32 * 1024),
+            mock.patch.object(link_analyzer, "run_cpu", fake_run_cpu),
+            mock.patch.object(link_analyzer, "ANALYZE_MODE", "stream"),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def asyncTearDown(self):
+        await close_http_client()
+        await self.runner.cleanup()
+
+    async def _check(self):
+        result = await link_analyzer.analyze_link(self.url)
+        self.assertNotIn("error", result)
+        for key in ("internal_links", "external_links", "iframe_count"):
+            self.assertEqual(result[key], self.expected[key], key)
+        self.assertEqual("phishing_keywords" in result["risk_flags"], self.expected["keyword_hit"])
+        return result
+
+
+class AnalyzeSmallPageTest(AnalyzePageTest):
+    async def test_small_page_is_parsed_inline_as_a_stream(self):
+        await self._check()
+        self.assertEqual(self.pool_calls, [])
+
+
+class AnalyzeLargePageTest(AnalyzePageTest):
+    PAGE_SIZE = 200 * 1024
+
+    async def test_large_page_goes_to_pool_whole(self):
+        await self._check()
+        self.assertEqual(len(self.pool_calls), 1)
+        self.assertGreaterEqual(self.pool_calls[0], len(_page(self.PAGE_SIZE, "1")))
+
+
+class TrackingParamsTest(unittest.TestCase):
+    def test_find_tracking_params(self):
+        self.assertEqual(
+            link_analyzer.find_tracking_params("https://example.com/?utm_source=mail&id=5&fbclid=x"),
+            ["utm_source", "fbclid"],
+        )
+        self.assertEqual(link_analyzer.find_tracking_params("https://example.com/a"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+"""
+registrable_domain по Public Suffix List: берутся только суффиксы раздела ICANN.
+
+    python -m pytest -q tests
+"""
+import unittest
+from unittest import mock
+
+from services import public_suffix
+
+PSL = """\
+// ===BEGIN ICANN DOMAINS===
+com
+uk
+co.uk
+*.ck
+!www.ck
+рф
+// ===END ICANN DOMAINS===
+// ===BEGIN PRIVATE DOMAINS===
+github.io
+blogspot.com
+*.pages.dev
+// ===END PRIVATE DOMAINS===
+"""
+
+
+class RegistrableDomainTest(unittest.TestCase):
+    def setUp(self):
+        patches = [mock.patch.object(public_suffix, name, getattr(public_suffix, name))
+                   for name in ("_rules", "_wildcards", "_exceptions")]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        public_suffix._parse(PSL)
+
+    def test_icann_suffixes(self):
+        self.assertEqual(public_suffix.registrable_domain("a.b.example.co.uk"), "example.co.uk")
+        self.assertEqual(public_suffix.registrable_domain("WWW.Example.com"), "example.com")
+        self.assertEqual(public_suffix.registrable_domain("xn--e1afmkfd.xn--p1ai"), "xn--e1afmkfd.xn--p1ai")
+
+    def test_wildcard_and_exception(self):
+        self.assertEqual(public_suffix.registrable_domain("shop.example.foo.ck"), "example.foo.ck")
+        self.assertEqual(public_suffix.registrable_domain("a.www.ck"), "www.ck")
+
+    def test_private_suffix_host_resolves_to_registered_domain(self):
+        self.assertEqual(public_suffix.registrable_domain("foo.github.io"), "github.io")
+        self.assertEqual(public_suffix.registrable_domain("my.blog.blogspot.com"), "blogspot.com")
+        self.assertEqual(public_suffix.registrable_domain("app.site.pages.dev"), "pages.dev")
+
+
+if __name__ == "__main__":
+    unittest.main()
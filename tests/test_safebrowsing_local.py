@@ -0,0 +1,197 @@
+"""
+Локальная база Safe Browsing (Update API): канонизация, выражения для поиска,
+применение обновлений и синхронизация с заглушкой из bench/stubs.py.
+
+    python -m pytest -q tests
+"""
+import base64
+import hashlib
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from bench.stubs import GSB_LISTS, StubConfig, start_stubs
+from services import safebrowsing_local as gsb
+from utils.http_client import close_http_client
+
+# Тестовые векторы из описания канонизации Safe Browsing
+CANONICAL = {
+    "http://host/%25%32%35": "http://host/%25",
+    "http://host/%25%32%35%25%32%35": "http://host/%25%25",
+    "http://host/%2525252525252525": "http://host/%25",
+    "http://host/asdf%25%32%35asd": "http://host/asdf%25asd",
+    "http://host/%%%25%32%35asd%%": "http://host/%25%25%25asd%25%25",
+    "http://www.google.com/": "http://www.google.com/",
+    "http://%31%36%38%2e%31%38%38%2e%39%39%2e%32%36/%2E%73%65%63%75%72%65/%77%77%77%2E%65%62%61%79%2E%63%6F%6D/":
+        "http://168.188.99.26/.secure/www.ebay.com/",
+    "http://195.127.0.11/uploads/%20%20%20%20/.verify/.eBaysecure=updateuserdataxplimnbqmn-xplmvalidateinfoswqpcmlx=hgplmcx/":
+        "http://195.127.0.11/uploads/%20%20%20%20/.verify/.eBaysecure=updateuserdataxplimnbqmn-xplmvalidateinfoswqpcmlx=hgplmcx/",
+    "http://host%23.com/%257Ea%2521b%2540c%2523d%2524e%25f%255E00%252611%252A22%252833%252944_55%252B":
+        "http://host%23.com/~a!b@c%23d$e%25f^00&11*22(33)44_55+",
+    "http://3279880203/blah": "http://195.127.0.11/blah",
+    "http://www.google.com/blah/..": "http://www.google.com/",
+    "www.google.com/": "http://www.google.com/",
+    "www.google.com": "http://www.google.com/",
+    "http://www.evil.com/blah#frag": "http://www.evil.com/blah",
+    "http://www.GOOgle.com/": "http://www.google.com/",
+    "http://www.google.com.../": "http://www.google.com/",
+    "http://www.google.com/foo\tbar\rbaz\n2": "http://www.google.com/foobarbaz2",
+    "http://www.google.com/q?": "http://www.google.com/q?",
+    "http://www.google.com/q?r?": "http://www.google.com/q?r?",
+    "http://www.google.com/q?r?s": "http://www.google.com/q?r?s",
+    "http://evil.com/foo#bar#baz": "http://evil.com/foo",
+    "http://evil.com/foo;": "http://evil.com/foo;",
+    "http://evil.com/foo?bar;": "http://evil.com/foo?bar;",
+    "http://\x01\x80.com/": "http://%01%80.com/",
+    "http://notrailingslash.com": "http://notrailingslash.com/",
+    "http://www.gotaport.com:1234/": "http://www.gotaport.com/",
+    "  http://www.google.com/  ": "http://www.google.com/",
+    "http:// leadingspace.com/": "http://%20leadingspace.com/",
+    "http://%20leadingspace.com/": "http://%20leadingspace.com/",
+    "%20leadingspace.com/": "http://%20leadingspace.com/",
+    "https://www.securesite.com/": "https://www.securesite.com/",
+    "http://host.com/ab%23cd": "http://host.com/ab%23cd",
+    "http://host.com//twoslashes?more//slashes": "http://host.com/twoslashes?more//slashes",
+}
+
+
+def _prefix(expression: str) -> bytes:
+    return hashlib.sha256(expression.encode()).digest()[:4]
+
+
+class CanonicalizeTest(unittest.TestCase):
+    def test_spec_vectors(self):
+        for url, expected in CANONICAL.items():
+            with self.subTest(url=url):
+                self.assertEqual(gsb.canonicalize(url), expected)
+
+    def test_percent_encoded_utf8_is_kept(self):
+        self.assertEqual(gsb.canonicalize("https://Example.com:443/caf%C3%A9"), "https://example.com/caf%C3%A9")
+
+    def test_url_expressions(self):
+        self.assertEqual(gsb.url_expressions("http://a.b.c/1/2.html?param=1"), [
+            "a.b.c/1/2.html?param=1", "a.b.c/1/2.html", "a.b.c/", "a.b.c/1/",
+            "b.c/1/2.html?param=1", "b.c/1/2.html", "b.c/", "b.c/1/",
+        ])
+        self.assertEqual(gsb.url_expressions("http://a.b.c.d.e.f.g/1.html"), [
+            "a.b.c.d.e.f.g/1.html", "a.b.c.d.e.f.g/", "c.d.e.f.g/1.html", "c.d.e.f.g/",
+            "d.e.f.g/1.html", "d.e.f.g/", "e.f.g/1.html", "e.f.g/", "f.g/1.html", "f.g/",
+        ])
+        self.assertEqual(gsb.url_expressions("http://1.2.3.4/1/"), ["1.2.3.4/1/", "1.2.3.4/"])
+
+
+class PrefixStoreTest(unittest.TestCase):
+    @staticmethod
+    def _update(prefixes, response_type="FULL_UPDATE", removals=(), checksum_of=None, state="s1"):
+        update = {
+            "responseType": response_type,
+            "newClientState": state,
+            "additions": [{"rawHashes": {"prefixSize": 4, "rawHashes": base64.b64encode(b"".join(prefixes)).decode()}}],
+        }
+        if removals:
+            update["removals"] = [{"rawIndices": {"indices": list(removals)}}]
+        if checksum_of is not None:
+            digest = hashlib.sha256(b"".join(sorted(checksum_of))).digest()
+            update["checksum"] = {"sha256": base64.b64encode(digest).decode()}
+        return update
+
+    def test_partial_update_removes_by_index_of_sorted_prefixes(self):
+        a, b, c, d = b"aaaa", b"bbbb", b"cccc", b"dddd"
+        store = gsb.PrefixStore()
+        self.assertTrue(store.apply_update(self._update([c, a, b], checksum_of=[a, b, c])))
+
+        # Индексы — позиции в отсортированном списке клиента: 1 — это b
+        self.assertTrue(store.apply_update(
+            self._update([d], "PARTIAL_UPDATE", removals=[1], checksum_of=[a, c, d], state="s2")
+        ))
+        self.assertEqual(store.sorted_prefixes(), [a, c, d])
+        self.assertEqual(store.state, "s2")
+        self.assertEqual(store.match(d + b"rest of the hash"), d)
+        self.assertIsNone(store.match(b + b"rest of the hash"))
+
+    def test_checksum_mismatch_keeps_previous_state(self):
+        store = gsb.PrefixStore()
+        store.apply_update(self._update([b"aaaa"], checksum_of=[b"aaaa"]))
+        self.assertFalse(store.apply_update(self._update([b"bbbb"], "PARTIAL_UPDATE", checksum_of=[b"zzzz"], state="s2")))
+        self.assertEqual(store.sorted_prefixes(), [b"aaaa"])
+        self.assertEqual(store.state, "s1")
+
+
+class UpdateApiSyncTest(unittest.IsolatedAsyncioTestCase):
+    BLOCKED = ("evil.test/", "phish.test/login/")
+
+    async def asyncSetUp(self):
+        self.runner, base_url = await start_stubs(StubConfig(latency=0, gsb_blocked=self.BLOCKED))
+        self.lists = self.runner.app[GSB_LISTS]
+        workdir = tempfile.mkdtemp(prefix="gsb_test_")
+        patches = [
+            mock.patch.object(gsb, "API_KEY", "test-key"),
+            mock.patch.object(gsb, "GSB_API_BASE", f"{base_url}/gsb"),
+            mock.patch.object(gsb, "GSB_STATE_FILE", os.path.join(workdir, "gsb_update.json")),
+            mock.patch.object(gsb, "_stores", {}),
+            mock.patch.object(gsb, "_full_hash_cache", {}),
+            mock.patch.object(gsb, "_negative_cache", {}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def asyncTearDown(self):
+        await close_http_client()
+        await self.runner.cleanup()
+
+    async def test_unknown_until_synced(self):
+        results = await gsb.check_urls_local(["http://evil.test/"])
+        self.assertEqual(results["http://evil.test/"]["status"], "unknown")
+
+    async def test_sync_and_lookup(self):
+        await gsb.sync_threat_lists()
+        results = await gsb.check_urls_local([
+            "http://www.evil.test/any/page?x=1",
+            "https://phish.test/login/form.php",
+            "https://phish.test/other",
+            "https://good.test/",
+        ])
+        self.assertEqual(results["http://www.evil.test/any/page?x=1"]["status"], "danger")
+        self.assertEqual(results["http://www.evil.test/any/page?x=1"]["details"], [{"threatType": "SOCIAL_ENGINEERING"}])
+        self.assertEqual(results["https://phish.test/login/form.php"]["status"], "danger")
+        self.assertEqual(results["https://phish.test/other"]["status"], "clean")
+        self.assertEqual(results["https://good.test/"]["status"], "clean")
+
+        # Сохранённая база читается обратно
+        with mock.patch.object(gsb, "_stores", {}):
+            gsb.load_state()
+            self.assertTrue(gsb.is_loaded())
+
+    async def test_partial_update_with_removals(self):
+        await gsb.sync_threat_lists()
+        self.lists.set_expressions(["phish.test/login/", "new-threat.test/"])
+        update = self.lists.list_update({**gsb.THREAT_LISTS[1], "state": "0"})
+        self.assertEqual(update["responseType"], "PARTIAL_UPDATE")
+        self.assertEqual(update["removals"][0]["rawIndices"]["indices"], [
+            sorted([_prefix(e) for e in self.BLOCKED]).index(_prefix("evil.test/"))
+        ])
+        await gsb.sync_threat_lists()
+
+        store = gsb._stores["SOCIAL_ENGINEERING/ANY_PLATFORM/URL"]
+        self.assertEqual(store.state, "1")
+        self.assertEqual(store.sorted_prefixes(), sorted([_prefix("phish.test/login/"), _prefix("new-threat.test/")]))
+
+        gsb._full_hash_cache.clear()
+        gsb._negative_cache.clear()
+        results = await gsb.check_urls_local(["http://evil.test/", "http://new-threat.test/a"])
+        self.assertEqual(results["http://evil.test/"]["status"], "clean")
+        self.assertEqual(results["http://new-threat.test/a"]["status"], "danger")
+
+    async def test_repeated_full_hash_matches_are_deduplicated(self):
+        await gsb.sync_threat_lists()
+        prefix = _prefix("evil.test/")
+        await gsb._find_full_hashes([prefix])
+        await gsb._find_full_hashes([prefix])
+        full_hash = hashlib.sha256(b"evil.test/").digest()
+        self.assertEqual(gsb._full_hash_cache[full_hash][1], ["SOCIAL_ENGINEERING"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+"""
+run_once: одна проверка на ключ внутри процесса и между воркерами через аренду в общем SQLite.
+
+    python -m pytest -q tests
+"""
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from utils import singleflight
+from utils.cache_backends import SQLiteLeaseTable
+
+
+class CountingFactory:
+    def __init__(self, result="report", delay: float = 0.05, error: Exception = None):
+        self.calls = 0
+        self.result = result
+        self.delay = delay
+        self.error = error
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class RunOnceTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patches = [
+            mock.patch.dict(singleflight._stats),
+            mock.patch.object(singleflight, "_leases", None),
+            mock.patch.object(singleflight, "_shared_lookup", None),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def test_concurrent_calls_share_one_run(self):
+        factory = CountingFactory()
+        started = singleflight._stats["started"]
+        coalesced = singleflight._stats["coalesced"]
+
+        results = await asyncio.gather(*(singleflight.run_once("https://example.com/", factory) for _ in range(5)))
+
+        self.assertEqual(results, ["report"] * 5)
+        self.assertEqual(factory.calls, 1)
+        self.assertEqual(singleflight._stats["started"] - started, 1)
+        self.assertEqual(singleflight._stats["coalesced"] - coalesced, 4)
+        self.assertFalse(singleflight.is_running("https://example.com/"))
+        self.assertEqual(singleflight.inflight_count(), 0)
+
+    async def test_different_keys_run_separately(self):
+        factory = CountingFactory()
+        await asyncio.gather(
+            singleflight.run_once("https://a.com/", factory),
+            singleflight.run_once("https://b.com/", factory),
+        )
+        self.assertEqual(factory.calls, 2)
+
+    async def test_finished_key_runs_again(self):
+        factory = CountingFactory(delay=0)
+        await singleflight.run_once("https://example.com/", factory)
+        await singleflight.run_once("https://example.com/", factory)
+        self.assertEqual(factory.calls, 2)
+
+    async def test_cancelled_waiter_does_not_cancel_the_check(self):
+        factory = CountingFactory(delay=0.1)
+        first = asyncio.ensure_future(singleflight.run_once("https://example.com/", factory))
+        second = asyncio.ensure_future(singleflight.run_once("https://example.com/", factory))
+        await asyncio.sleep(0.01)
+        self.assertTrue(singleflight.is_running("https://example.com/"))
+
+        first.cancel()
+        self.assertEqual(await second, "report")
+        self.assertTrue(first.cancelled())
+        self.assertEqual(factory.calls, 1)
+
+    async def test_error_reaches_every_waiter(self):
+        factory = CountingFactory(error=RuntimeError("provider down"))
+        results = await asyncio.gather(
+            *(singleflight.run_once("https://example.com/", factory) for _ in range(3)),
+            return_exceptions=True,
+        )
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in results))
+        self.assertEqual(factory.calls, 1)
+        self.assertFalse(singleflight.is_running("https://example.com/"))
+
+
+class SharedRunOnceTest(unittest.IsolatedAsyncioTestCase):
+    """Второй воркер изображается другим владельцем аренды в том же файле"""
+
+    KEY = "https://example.com/"
+
+    def setUp(self):
+        workdir = tempfile.mkdtemp(prefix="singleflight_test_")
+        self.leases = SQLiteLeaseTable(os.path.join(workdir, "leases.db"))
+        self.addCleanup(self.leases.close)
+        self.shared = {}  # общий кэш: {ключ: результат}
+
+        patches = [
+            mock.patch.dict(singleflight._stats),
+            mock.patch.object(singleflight, "LEASE_POLL_INTERVAL", 0.01),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        singleflight.configure_shared(self.leases, lambda key, since: self.shared.get(key))
+        self.addCleanup(setattr, singleflight, "_leases", None)
+        self.addCleanup(setattr, singleflight, "_shared_lookup", None)
+
+    async def test_lease_owner_runs_the_check(self):
+        factory = CountingFactory()
+        self.assertEqual(await singleflight.run_once(self.KEY, factory), "report")
+        self.assertEqual(factory.calls, 1)
+        self.assertFalse(self.leases.is_held(self.KEY))
+
+    async def test_waits_for_result_of_other_worker(self):
+        self.assertTrue(self.leases.acquire(self.KEY, "other-worker", 60))
+        factory = CountingFactory()
+        shared = singleflight._stats["shared"]
+
+        waiter = asyncio.ensure_future(singleflight.run_once(self.KEY, factory))
+        await asyncio.sleep(0.05)
+        self.assertFalse(waiter.done())
+
+        self.shared[self.KEY] = "report from other worker"
+        self.leases.release(self.KEY, "other-worker")
+        self.assertEqual(await waiter, "report from other worker")
+        self.assertEqual(factory.calls, 0)
+        self.assertEqual(singleflight._stats["shared"] - shared, 1)
+
+    async def test_takes_over_lease_released_without_result(self):
+        self.assertTrue(self.leases.acquire(self.KEY, "other-worker", 60))
+        factory = CountingFactory()
+
+        waiter = asyncio.ensure_future(singleflight.run_once(self.KEY, factory))
+        await asyncio.sleep(0.05)
+        self.leases.release(self.KEY, "other-worker")  # воркер упал или проверка отменена
+
+        self.assertEqual(await waiter, "report")
+        self.assertEqual(factory.calls, 1)
+
+    async def test_takes_over_expired_lease(self):
+        self.assertTrue(self.leases.acquire(self.KEY, "other-worker", -1))
+        factory = CountingFactory()
+        self.assertEqual(await singleflight.run_once(self.KEY, factory), "report")
+        self.assertEqual(factory.calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+"""
+Пакетная проверка нескольких ссылок из одного сообщения.
+
+    python -m pytest -q tests
+"""
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+from handlers import user_private
+from utils.report import CheckRecord
+
+URLS = ["https://a.example/", "https://b.example/"]
+
+
+class CheckBatchTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.google_seen = {}
+
+        async def check_once(url, google_res=None, **kwargs):
+            self.google_seen[url] = google_res
+            return CheckRecord.create(url, {"google": google_res})
+
+        patches = [
+            mock.patch.object(user_private, "get_cached_result", lambda url: None),
+            mock.patch.object(user_private, "check_once", check_once),
+            mock.patch.dict(user_private.PROVIDER_BUDGETS, {"google": 0.05}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def test_slow_google_does_not_stall_the_batch(self):
+        async def slow_google(urls):
+            await asyncio.sleep(5)
+
+        started = time.monotonic()
+        with mock.patch.object(user_private, "check_google_safebrowsing_many", slow_google):
+            records = await user_private.check_batch(URLS)
+
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual([r.url for r in records], URLS)
+        self.assertEqual({url: res["status"] for url, res in self.google_seen.items()},
+                         {url: "timeout" for url in URLS})
+
+    async def test_google_answer_is_passed_per_url(self):
+        async def google(urls):
+            return {url: {"status": "clean", "details": None} for url in urls}
+
+        with mock.patch.object(user_private, "check_google_safebrowsing_many", google):
+            await user_private.check_batch(URLS)
+        self.assertEqual({url: res["status"] for url, res in self.google_seen.items()},
+                         {url: "clean" for url in URLS})
+
+
+if __name__ == "__main__":
+    unittest.main()
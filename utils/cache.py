@@ -7,138 +7,374 @@ from datetime import datetime
 
 from services.validator import is_working_url
 from services.google_safe_browsing import check_google_safebrowsing
-from services.virustotal import check_virustotal
+from services.virustotal import check_virustotal, PRIORITY_BACKGROUND
 from services.blacklist_check import check_blacklists
 from utils.calculate_risk import calculate_risk_score
+from utils.cache_backends import CacheBackend, SQLiteCacheBackend, LogCacheBackend, LRUCacheBackend
+from utils.metrics import CACHE_OPERATIONS, Counter, Gauge
+from utils.rate_limit import TokenBucket
+from utils.report import CheckRecord
+from utils.singleflight import inflight_count
 
 
 CACHE_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "common", "cache.json")
-TTL = 60 * 30  # 30 минут
+CACHE_DB = os.path.join(os.path.dirname(os.path.dirname(__file__)), "common", "cache.sqlite3")
+CACHE_LOG = os.path.join(os.path.dirname(os.path.dirname(__file__)), "common", "cache.log")
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite")  # sqlite или log (один процесс)
+CACHE_LRU_SIZE = int(os.getenv("CACHE_LRU_SIZE", 1000))  # 0 — без слоя в памяти
+TTL = 60 * 30  # 30 минут — мягкий срок по умолчанию
 
-_cache = {}
+# Сроки жизни по вердикту: (мягкий, жёсткий), с.
+# После мягкого срока запись отдаётся сразу, а в фоне перепроверяется; после жёсткого — удаляется.
+TTL_CLEAN_OLD = (60 * 60 * 6, 60 * 60 * 24)  # чисто, домену больше года
+TTL_DEFAULT = (TTL, 60 * 60 * 2)
+TTL_INCOMPLETE = (60 * 5, 60 * 30)  # VirusTotal ещё считает, сервис упал или не успел
+TTL_HIGH_RISK = (60 * 2, 60 * 10)  # опасные сайты быстро меняются и удаляются
+TTL_UNREACHABLE = (60 * 5, 60 * 15)  # отрицательный кэш: сайт не открылся и не резолвится
+
+_cache: Optional[CacheBackend] = None
+
+Counter("link_checker_cache_evictions_total", "Вытеснения из LRU-слоя кэша").set_function(
+    lambda: getattr(_cache, "evictions", 0)
+)
+Gauge("link_checker_cache_entries", "Записей в кэше результатов").set_function(
+    lambda: len(_cache) if _cache is not None else 0
+)
 
 
 # =========================
 #   БАЗОВЫЕ ОПЕРАЦИИ
 # =========================
 
+def _create_backend() -> CacheBackend:
+    """Создаёт хранилище кэша по настройке CACHE_BACKEND"""
+    if CACHE_BACKEND == "sqlite":
+        backend = SQLiteCacheBackend(CACHE_DB)
+    elif CACHE_BACKEND == "log":
+        backend = LogCacheBackend(CACHE_LOG)
+    else:
+        raise ValueError(f"Неизвестный CACHE_BACKEND: {CACHE_BACKEND}")
+    if CACHE_LRU_SIZE <= 0:
+        return backend
+    return LRUCacheBackend(backend, maxsize=CACHE_LRU_SIZE)
+
+
+def use_shared_storage():
+    """
+    Кэш общий для нескольких процессов (webhook.py с WEB_WORKERS > 1).
+    Слой LRU в памяти отключается: другой воркер мог уже переписать запись в SQLite,
+    а в памяти осталась бы старая.
+    """
+    global CACHE_LRU_SIZE, _cache
+    if CACHE_BACKEND != "sqlite":
+        raise ValueError(f"CACHE_BACKEND={CACHE_BACKEND} рассчитан на один процесс, для воркеров нужен sqlite")
+    CACHE_LRU_SIZE = 0
+    if _cache is not None:
+        _cache.close()
+        _cache = None
+
+
+def _migrate_json(backend: CacheBackend):
+    """Однократно переносит записи из старого cache.json в новое хранилище"""
+    if backend.get_meta("json_migrated") or not os.path.exists(CACHE_FILE):
+        return
+    try:
+        with open(CACHE_FILE, "r", encoding="utf-8") as f:
+            old = json.load(f)
+        backend.set_many(
+            (url, {**entry, "expires_at": entry["timestamp"] + TTL})
+            for url, entry in old.items()
+        )
+        print(f"[CACHE] 📦 Перенесено {len(old)} записей из {os.path.basename(CACHE_FILE)}")
+    except Exception as e:
+        print(f"[CACHE] Ошибка миграции: {e}")
+        return
+    backend.set_meta("json_migrated", str(time.time()))
+
+
+def _get_backend() -> CacheBackend:
+    if _cache is None:
+        load_cache()
+    return _cache
+
+
 def load_cache():
-    """Загружает кэш из файла"""
+    """Открывает хранилище кэша и удаляет устаревшие записи"""
     global _cache
-    if os.path.exists(CACHE_FILE):
+    if _cache is None:
         try:
-            with open(CACHE_FILE, "r", encoding="utf-8") as f:
-                _cache = json.load(f)
-            print(f"[CACHE] Загружено {len(_cache)} записей из файла")
+            _cache = _create_backend()
         except Exception as e:
             print(f"[CACHE] Ошибка загрузки: {e}")
-            _cache = {}
-    else:
-        _cache = {}
+            raise
+        _migrate_json(_cache)
+    purged = _cache.purge_expired()
+    print(f"[CACHE] Загружено {len(_cache)} записей (удалено устаревших: {purged})")
 
 
-def save_cache():
-    """Сохраняет кэш в файл"""
-    try:
-        with open(CACHE_FILE, "w", encoding="utf-8") as f:
-            json.dump(_cache, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"[CACHE] Ошибка сохранения: {e}")
+def is_unreachable(results: dict) -> bool:
+    """Страница не открылась и адрес хоста не получен — проверять нечего"""
+    link = results.get("link_analysis", {})
+    ip_info = results.get("infra", {}).get("ip_info", {})
+    return bool(link.get("error")) and not ip_info.get("ip")
 
 
-def get_cache(url: str) -> Optional[dict]:
-    """Возвращает данные из кэша, если они актуальны"""
-    entry = _cache.get(url)
+def ttl_for_result(data: dict) -> tuple[float, float]:
+    """Мягкий и жёсткий срок жизни записи в зависимости от вердикта"""
+    results = data["results"]
+    if is_unreachable(results):
+        return TTL_UNREACHABLE
+
+    level, _, _ = calculate_risk_score(results)
+    if level == "высокий":
+        return TTL_HIGH_RISK
+
+    statuses = [res.get("status") for res in results.values() if isinstance(res, dict)]
+    if any(status in ("error", "timeout", "submitted") for status in statuses):
+        return TTL_INCOMPLETE
+
+    age_days = results.get("infra", {}).get("whois", {}).get("age_days")
+    if level == "низкий" and age_days is not None and age_days >= 365:
+        return TTL_CLEAN_OLD
+    return TTL_DEFAULT
+
+
+def get_cache_entry(url: str) -> Optional[dict]:
+    """
+    Возвращает запись кэша {"timestamp", "soft_expires_at", "expires_at", "data"},
+    пока не истёк жёсткий срок. Мягкий срок проверяет вызывающий.
+    """
+    cache = _get_backend()
+    entry = cache.get(url)
     if not entry:
+        CACHE_OPERATIONS.inc(op="miss")
         return None
 
-    # Проверка TTL
-    if time.time() - entry["timestamp"] > TTL:
+    # Жёсткий срок истёк — запись больше не отдаём
+    if time.time() > entry["expires_at"]:
         print(f"[CACHE] ⏰ {url} — запись устарела, удаляю")
-        del _cache[url]
-        save_cache()
+        cache.delete(url)
+        CACHE_OPERATIONS.inc(op="expired")
         return None
 
-    return entry["data"]
+    CACHE_OPERATIONS.inc(op="stale" if is_stale(entry) else "hit")
+    return entry
+
+
+def peek_cache_entry(url: str) -> Optional[dict]:
+    """Запись как есть, без проверки сроков и без учёта в метриках обращений"""
+    return _get_backend().get(url)
+
+
+def is_stale(entry: dict) -> bool:
+    """Мягкий срок прошёл — запись пора перепроверить"""
+    return time.time() > entry.get("soft_expires_at", entry["expires_at"])
+
+
+def get_cache(url: str) -> Optional[dict]:
+    """Возвращает данные из кэша, если не истёк жёсткий срок (в том числе устаревшие по мягкому)"""
+    entry = get_cache_entry(url)
+    return entry["data"] if entry else None
 
 
 def set_cache(url: str, data: dict):
-    """Добавляет новую запись в кэш"""
-    _cache[url] = {"timestamp": time.time(), "data": data}
-    save_cache()
-    print(f"[CACHE] 💾 {url} — записано в кэш")
+    """Добавляет новую запись в кэш со сроками по вердикту"""
+    now = time.time()
+    soft_ttl, hard_ttl = ttl_for_result(data)
+    _get_backend().set(url, {
+        "timestamp": now,
+        "soft_expires_at": now + soft_ttl,
+        "expires_at": now + hard_ttl,
+        "data": data,
+    })
+    CACHE_OPERATIONS.inc(op="set")
+    print(f"[CACHE] 💾 {url} — записано в кэш на {soft_ttl // 60:.0f}/{hard_ttl // 60:.0f} мин")
 
 
 def clear_cache():
     """Полная очистка кэша"""
-    global _cache
-    _cache = {}
-    save_cache()
+    _get_backend().clear()
     print("[CACHE] 🧹 Очищен весь кэш")
 
 
+# Сжатие хранилища: переписываем файл, когда мусора в нём больше этой доли
+CACHE_COMPACT_RATIO = float(os.getenv("CACHE_COMPACT_RATIO", 0.5))
+
+
+async def compact_cache(force: bool = False) -> int:
+    """
+    Убирает устаревшие записи и, если перезаписанных и удалённых кадров накопилось
+    больше CACHE_COMPACT_RATIO, переписывает файл хранилища в отдельном потоке.
+    """
+    cache = _get_backend()
+    purged = cache.purge_expired()
+    ratio = cache.garbage_ratio()
+    if force or ratio >= CACHE_COMPACT_RATIO:
+        started = time.monotonic()
+        purged += await asyncio.to_thread(cache.compact)
+        print(f"[CACHE] 🗜 Хранилище сжато за {time.monotonic() - started:.2f} с (мусора было {ratio:.0%})")
+    return purged
+
+
 # =========================
 #   ЕЖЕДНЕВНОЕ ОБНОВЛЕНИЕ
 # =========================
 
+# Настройки ночного обновления
+REFRESH_WORKERS = int(os.getenv("REFRESH_WORKERS", 8))
+REFRESH_BATCH_SIZE = 50
+# Сколько интерактивных проверок должно идти, чтобы обновление уступило им место
+REFRESH_YIELD_THRESHOLD = 3
+
+# Лимиты на обновление: только часть квоты, остальное остаётся пользователям
+_refresh_buckets = {
+    "google": TokenBucket(rate=5, capacity=5),
+    "vt": TokenBucket(rate=2 / 60, capacity=1),  # публичная квота VT — 4 запроса в минуту
+}
+
+
+async def _refresh_one(url: str, entry: dict):
+    """
+    Пересчитывает одну запись. Возвращает новую запись или None, если её нужно удалить.
+    url — ключ кэша (канонический вид), проверяется же адрес, сохранённый в записи:
+    канонический может отличаться от него (www., параметры) и давать другие ответы.
+    """
+    # Удаляем записи с истёкшим жёстким сроком
+    if time.time() > entry["expires_at"]:
+        print(f"[CACHE] ⏳ {url} — устарел, удаляю")
+        return None
+
+    target = entry["data"].get("url") or url
+
+    # Проверяем доступность
+    if not await is_working_url(target):
+        print(f"[CACHE] ❌ {url} — недоступен, удаляю из кэша")
+        return None
+
+    # Пропускаем вперёд интерактивные проверки пользователей
+    while inflight_count() >= REFRESH_YIELD_THRESHOLD:
+        await asyncio.sleep(1)
+
+    async def limited(bucket: str, coro_func, **kwargs):
+        await _refresh_buckets[bucket].acquire()
+        return await coro_func(target, **kwargs)
+
+    checks = {
+        "google": limited("google", check_google_safebrowsing),
+        "blacklist": check_blacklists(target),
+    }
+    # Квоты VT хватает на пару записей в минуту, а их тысячи — обновление её не ждёт:
+    # VT перепроверяется, только если токен есть прямо сейчас, иначе остаётся прежний ответ.
+    # Фоновые запросы VirusTotal пропускают вперёд интерактивные.
+    if _refresh_buckets["vt"].try_acquire():
+        checks["vt"] = check_virustotal(target, priority=PRIORITY_BACKGROUND)
+    results = await asyncio.gather(*checks.values())
+
+    # Обновляются только быстрые внешние проверки — инфраструктура и анализ страницы остаются из записи
+    record = CheckRecord.from_dict(entry["data"], url=target, timestamp=entry["timestamp"])
+    for key, res in zip(checks, results):
+        record = record.with_result(key, res)
+    _, score, _ = calculate_risk_score(record.results)
+
+    now = time.time()
+    data = record.to_dict()
+    soft_ttl, hard_ttl = ttl_for_result(data)
+    print(f"[CACHE] 🔁 {url} — обновлён ({score} баллов)")
+    return {
+        "timestamp": now,
+        "soft_expires_at": now + soft_ttl,
+        "expires_at": now + hard_ttl,
+        "data": data,
+    }
+
+
 async def refresh_cache():
     """
     Обновление кэша в 00:00:
     - удаляет мертвые и устаревшие ссылки
     - пересчитывает данные по рабочим
+    Работает пулом воркеров, пишет пачками и продолжает с места остановки после перезапуска.
     """
-    global _cache
     load_cache()
+    cache = _get_backend()
 
     print(f"\n[CACHE] 🌙 Запуск ночного обновления ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')})")
 
-    urls = list(_cache.keys())
-    updated = 0
-    deleted = 0
+    # Ключи обходятся в отсортированном порядке, чекпоинт — последний ключ,
+    # до которого (включительно) всё уже обработано
+    checkpoint = cache.get_meta("refresh_checkpoint") or ""
+    urls = sorted(k for k in cache.keys() if k > checkpoint)
+    if checkpoint:
+        print(f"[CACHE] ⏯ Продолжаю с {checkpoint} (осталось {len(urls)})")
 
+    queue: asyncio.Queue = asyncio.Queue()
     for url in urls:
-        # Удаляем старые записи
-        if time.time() - _cache[url]["timestamp"] > TTL:
-            print(f"[CACHE] ⏳ {url} — устарел, удаляю")
-            del _cache[url]
-            deleted += 1
-            continue
-
-        # Проверяем доступность
-        if not await is_working_url(url):
-            print(f"[CACHE] ❌ {url} — недоступен, удаляю из кэша")
-            del _cache[url]
-            deleted += 1
-            continue
-
-        # Обновляем данные
-        try:
-            google_res, vt_res, bl_res = await asyncio.gather(
-                check_google_safebrowsing(url),
-                check_virustotal(url),
-                check_blacklists(url),
-            )
-            results = {"google": google_res, "vt": vt_res, "blacklist": bl_res}
-            level, score, reasons = calculate_risk_score(results)
-
-            text = (
-                f"🔗 Проверка ссылки: {url}\n\n"
-                f"🧭 Google Safe Browsing: {google_res['status']}\n"
-                f"🧪 VirusTotal: {vt_res['status']}\n"
-                f"🚨 Blacklists: {bl_res['status']}\n\n"
-                f"⚠️ Уровень риска: *{level.upper()}* ({score} баллов)\n\n"
-                f"📋 Причины начисления:\n" +
-                "\n".join([f"• {r}" for r in reasons])
-            )
-
-            _cache[url] = {
-                "timestamp": time.time(),
-                "data": {"report": text, "results": results},
-            }
-            updated += 1
-            print(f"[CACHE] 🔁 {url} — обновлён ({score} баллов)")
-        except Exception as e:
-            print(f"[CACHE] ⚠️ Ошибка обновления {url}: {e}")
+        queue.put_nowait(url)
+
+    stats = {"updated": 0, "deleted": 0, "failed": 0, "skipped": 0, "done": 0}
+    # (ключ, новая запись или None для удаления, timestamp записи, которую пересчитывали)
+    pending = []
+    completed = set()
+    position = 0  # индекс первого ещё не завершённого ключа в urls
+    started = time.monotonic()
+
+    def flush():
+        """Записывает накопленную пачку и сдвигает чекпоинт"""
+        nonlocal position
+        writes = []
+        for url, new_entry, seen in pending:
+            # Пока шла перепроверка, запись могла обновить проверка пользователя — её не трогаем
+            current = cache.get(url)
+            if current is not None and current["timestamp"] > seen:
+                stats["skipped"] += 1
+            elif new_entry is None:
+                cache.delete(url)
+                stats["deleted"] += 1
+            else:
+                writes.append((url, new_entry))
+                stats["updated"] += 1
+        cache.set_many(writes)
+        pending.clear()
+
+        while position < len(urls) and urls[position] in completed:
+            completed.discard(urls[position])
+            position += 1
+        if position:
+            cache.set_meta("refresh_checkpoint", urls[position - 1])
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        print(
+            f"[CACHE] 📈 {stats['done']}/{len(urls)} "
+            f"({stats['done'] / elapsed:.1f} URL/с), обновлено {stats['updated']}, "
+            f"удалено {stats['deleted']}, пропущено {stats['skipped']}, ошибок {stats['failed']}"
+        )
+
+    async def worker():
+        while True:
+            try:
+                url = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            entry = cache.get(url)
+            try:
+                new_entry = await _refresh_one(url, entry) if entry else None
+                pending.append((url, new_entry, entry["timestamp"] if entry else 0.0))
+            except Exception as e:
+                print(f"[CACHE] ⚠️ Ошибка обновления {url}: {e}")
+                stats["failed"] += 1
+
+            completed.add(url)
+            stats["done"] += 1
+            if len(pending) >= REFRESH_BATCH_SIZE:
+                flush()
+
+    await asyncio.gather(*(worker() for _ in range(REFRESH_WORKERS)))
+    flush()
+    cache.set_meta("refresh_checkpoint", "")
 
-    save_cache()
-    print(f"[CACHE] ✅ Обновление завершено: обновлено {updated}, удалено {deleted}\n")
+    elapsed = time.monotonic() - started
+    print(
+        f"[CACHE] ✅ Обновление завершено за {elapsed:.0f} с: обновлено {stats['updated']}, "
+        f"удалено {stats['deleted']}, пропущено {stats['skipped']}, ошибок {stats['failed']}\n"
+    )
@@ -0,0 +1,583 @@
+import json
+import os
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Iterator, Optional
+
+import msgpack
+import zstandard
+
+
+class CacheBackend:
+    """
+    Интерфейс хранилища кэша.
+    Запись — словарь {"timestamp": float, "expires_at": float, "data": dict}
+    и необязательный "soft_expires_at": после него запись ещё отдаётся, но её пора перепроверить.
+    """
+
+    def get(self, key: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def set(self, key: str, entry: dict):
+        raise NotImplementedError
+
+    def set_many(self, items: Iterable[tuple[str, dict]]):
+        for key, entry in items:
+            self.set(key, entry)
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def keys(self) -> list[str]:
+        raise NotImplementedError
+
+    def items(self) -> Iterator[tuple[str, dict]]:
+        for key in self.keys():
+            entry = self.get(key)
+            if entry is not None:
+                yield key, entry
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        raise NotImplementedError
+
+    def compact(self, now: Optional[float] = None) -> int:
+        """Освобождает место под устаревшие записи. Возвращает число удалённых."""
+        return self.purge_expired(now)
+
+    def garbage_ratio(self) -> float:
+        """Доля места в хранилище, которую освободит compact()"""
+        return 0.0
+
+    def clear(self):
+        raise NotImplementedError
+
+    def get_meta(self, key: str) -> Optional[str]:
+        return None
+
+    def set_meta(self, key: str, value: str):
+        pass
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def close(self):
+        pass
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """Кэш в SQLite (WAL): запись по ключу, индекс по времени истечения"""
+
+    def __init__(self, path: str, table: str = "cache"):
+        self.path = path
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # Несколько воркеров пишут в один файл — ждём блокировку, а не падаем с "database is locked"
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, timestamp REAL NOT NULL, expires_at REAL NOT NULL, data TEXT NOT NULL, "
+            "soft_expires_at REAL)"
+        )
+        # Базы, созданные до появления мягкого срока
+        columns = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+        if "soft_expires_at" not in columns:
+            self._conn.execute(f"ALTER TABLE {table} ADD COLUMN soft_expires_at REAL")
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_expires_at ON {table} (expires_at)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _row(self, entry: dict) -> tuple:
+        expires_at = entry.get("expires_at", entry["timestamp"])
+        return (
+            entry["timestamp"],
+            expires_at,
+            json.dumps(entry["data"], ensure_ascii=False),
+            entry.get("soft_expires_at", expires_at),
+        )
+
+    @staticmethod
+    def _entry(timestamp: float, expires_at: float, data: str, soft_expires_at: Optional[float]) -> dict:
+        return {
+            "timestamp": timestamp,
+            "expires_at": expires_at,
+            "soft_expires_at": expires_at if soft_expires_at is None else soft_expires_at,
+            "data": json.loads(data),
+        }
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT timestamp, expires_at, data, soft_expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return self._entry(*row)
+
+    def set(self, key: str, entry: dict):
+        self.set_many([(key, entry)])
+
+    def set_many(self, items: Iterable[tuple[str, dict]]):
+        rows = [(key, *self._row(entry)) for key, entry in items]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    f"INSERT INTO {self.table} (key, timestamp, expires_at, data, soft_expires_at) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET timestamp = excluded.timestamp, "
+                    "expires_at = excluded.expires_at, data = excluded.data, soft_expires_at = excluded.soft_expires_at",
+                    rows,
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def keys(self) -> list[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute(f"SELECT key FROM {self.table}")]
+
+    def items(self) -> Iterator[tuple[str, dict]]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, timestamp, expires_at, data, soft_expires_at FROM {self.table}"
+            ).fetchall()
+        for key, *row in rows:
+            yield key, self._entry(*row)
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        with self._lock:
+            cur = self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (now,))
+        return cur.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (f"{self.table}:{key}",)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (f"{self.table}:{key}", value),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SQLiteLeaseTable:
+    """
+    Аренды ключей в общем SQLite-файле: какой процесс сейчас выполняет проверку.
+    Аренда истекает сама, если владелец упал, не освободив её.
+    """
+
+    def __init__(self, path: str, table: str = "leases"):
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def acquire(self, key: str, owner: str, ttl: float) -> bool:
+        """Берёт аренду, если она свободна или истекла. True — ключ наш."""
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                f"INSERT INTO {self.table} (key, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE expires_at < ?",
+                (key, owner, now + ttl, now),
+            )
+        return cur.rowcount > 0
+
+    def release(self, key: str, owner: str):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ? AND owner = ?", (key, owner))
+
+    def is_held(self, key: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT 1 FROM {self.table} WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()
+        return row is not None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class LogCacheBackend(CacheBackend):
+    """
+    Кэш в одном файле с дозаписью: каждая запись — кадр с заголовком фиксированной длины,
+    ключом и сжатым zstd телом в msgpack. В памяти хранится только индекс ключ -> смещение,
+    поэтому загрузка читает заголовки и не распаковывает тела.
+    Перезаписанные, удалённые и устаревшие кадры остаются в файле до compact().
+    Файл принадлежит одному процессу — для нескольких воркеров webhook используйте sqlite.
+    """
+
+    # Тип кадра, длина тела, жёсткий срок, длина ключа
+    HEADER = struct.Struct(">BIdH")
+    ENTRY, DELETE, META = 0, 1, 2
+
+    def __init__(self, path: str, level: int = 3):
+        self.path = path
+        self._lock = threading.Lock()
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+        # {ключ: (смещение тела, длина тела, жёсткий срок)}
+        self._index: dict[str, tuple[int, int, float]] = {}
+        self._meta: dict[str, str] = {}
+        self._size = 0
+        self._dead = 0  # байт в кадрах, которые уже не нужны
+        self._compact_lock = threading.Lock()  # compact() и clear() не идут одновременно
+        self._touched: Optional[set] = None  # ключи, изменённые во время compact()
+        self._file = open(path, "a+b")
+        self._load()
+
+    # ---------- формат кадра ----------
+
+    def _frame(self, kind: int, key: str, expires_at: float, body: bytes) -> bytes:
+        key_bytes = key.encode("utf-8")
+        return self.HEADER.pack(kind, len(body), expires_at, len(key_bytes)) + key_bytes + body
+
+    def _pack(self, entry: dict) -> bytes:
+        expires_at = entry.get("expires_at", entry["timestamp"])
+        row = [entry["timestamp"], entry.get("soft_expires_at", expires_at), entry["data"]]
+        return self._compressor.compress(msgpack.packb(row, use_bin_type=True))
+
+    def _unpack(self, body: bytes, expires_at: float) -> dict:
+        timestamp, soft_expires_at, data = msgpack.unpackb(self._decompressor.decompress(body), raw=False)
+        return {"timestamp": timestamp, "expires_at": expires_at, "soft_expires_at": soft_expires_at, "data": data}
+
+    def _frames(self, buf: bytes):
+        """Кадры из буфера: (тип, ключ, смещение тела, длина тела, срок, длина кадра)"""
+        pos, header = 0, self.HEADER.size
+        while pos + header <= len(buf):
+            kind, body_len, expires_at, key_len = self.HEADER.unpack_from(buf, pos)
+            start = pos + header + key_len
+            end = start + body_len
+            if end > len(buf):
+                break
+            key = buf[pos + header:start].decode("utf-8")
+            yield kind, key, start, body_len, expires_at, end - pos
+            pos = end
+
+    # ---------- загрузка и запись ----------
+
+    def _load(self):
+        self._file.seek(0)
+        buf = self._file.read()
+        size = 0
+        for kind, key, start, body_len, expires_at, frame_len in self._frames(buf):
+            size = start + body_len
+            self._forget(key, frame_len if kind == self.DELETE else 0)
+            if kind == self.ENTRY:
+                self._index[key] = (start, body_len, expires_at)
+            elif kind == self.META:
+                if key in self._meta:
+                    self._dead += self._frame_len(key, len(self._meta[key].encode("utf-8")))
+                self._meta[key] = buf[start:size].decode("utf-8")
+        if size < len(buf):
+            # Хвост от прерванной записи
+            print(f"[CACHE] ⚠️ {os.path.basename(self.path)}: обрезан неполный кадр ({len(buf) - size} байт)")
+            self._file.truncate(size)
+        self._size = size
+
+    def _forget(self, key: str, extra_dead: int = 0):
+        """Убирает ключ из индекса; его кадр становится мусором"""
+        if self._touched is not None:
+            self._touched.add(key)
+        old = self._index.pop(key, None)
+        if old is not None:
+            self._dead += self._frame_len(key, old[1])
+        self._dead += extra_dead
+
+    def _frame_len(self, key: str, body_len: int) -> int:
+        return self.HEADER.size + len(key.encode("utf-8")) + body_len
+
+    def _append(self, frames: list[tuple[int, str, float, bytes]]):
+        """Дописывает кадры в конец файла и обновляет индекс. Вызывается под блокировкой."""
+        chunks, pos = [], self._size
+        for kind, key, expires_at, body in frames:
+            frame = self._frame(kind, key, expires_at, body)
+            self._forget(key, len(frame) if kind == self.DELETE else 0)
+            if kind == self.ENTRY:
+                self._index[key] = (pos + len(frame) - len(body), len(body), expires_at)
+            chunks.append(frame)
+            pos += len(frame)
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(b"".join(chunks))
+        self._file.flush()
+        self._size = pos
+
+    def _read(self, offset: int, length: int) -> bytes:
+        self._file.seek(offset)
+        return self._file.read(length)
+
+    # ---------- интерфейс CacheBackend ----------
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            loc = self._index.get(key)
+            if loc is None:
+                return None
+            offset, length, expires_at = loc
+            return self._unpack(self._read(offset, length), expires_at)
+
+    def set(self, key: str, entry: dict):
+        self.set_many([(key, entry)])
+
+    def set_many(self, items: Iterable[tuple[str, dict]]):
+        frames = [
+            (self.ENTRY, key, entry.get("expires_at", entry["timestamp"]), self._pack(entry))
+            for key, entry in items
+        ]
+        if not frames:
+            return
+        with self._lock:
+            self._append(frames)
+
+    def delete(self, key: str):
+        with self._lock:
+            if key in self._index:
+                self._append([(self.DELETE, key, 0.0, b"")])
+
+    def keys(self) -> list[str]:
+        with self._lock:
+            return list(self._index)
+
+    def items(self) -> Iterator[tuple[str, dict]]:
+        for key in self.keys():
+            entry = self.get(key)
+            if entry is not None:
+                yield key, entry
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        """Убирает устаревшие записи из индекса; место в файле освободит compact()"""
+        now = time.time() if now is None else now
+        # Отбор идёт по копии, блокировка — только на копирование и удаление
+        with self._lock:
+            items = list(self._index.items())
+        expired = [(key, loc) for key, loc in items if loc[2] < now]
+        with self._lock:
+            return self._drop(expired)
+
+    def _drop(self, expired: list) -> int:
+        """Удаляет из индекса записи, если они не менялись с момента отбора. Вызывается под блокировкой."""
+        dropped = 0
+        for key, loc in expired:
+            if self._index.get(key) == loc:
+                self._forget(key)
+                dropped += 1
+        return dropped
+
+    def garbage_ratio(self) -> float:
+        with self._lock:
+            return self._dead / self._size if self._size else 0.0
+
+    def compact(self, now: Optional[float] = None) -> int:
+        """
+        Переписывает файл: остаются только актуальные кадры и метаданные.
+        Тела копируются как есть, без повторного сжатия. Основная блокировка берётся
+        только на снимок индекса и на подмену файла, и под ней обрабатываются лишь ключи,
+        изменённые во время копирования, — get/set не ждут переписывания всего файла.
+        """
+        now = time.time() if now is None else now
+        with self._compact_lock:
+            with self._lock:
+                snapshot = dict(self._index)
+                meta = dict(self._meta)
+                end = self._size
+                self._touched = set()
+            try:
+                return self._compact_from(snapshot, meta, end, now)
+            finally:
+                self._touched = None
+
+    def _compact_from(self, snapshot: dict, meta: dict, end: int, now: float) -> int:
+        # Копия актуальных кадров до отметки end; дозапись в конец файла этому не мешает
+        tmp_path = self.path + ".compact"
+        index, pos, live = {}, 0, 0
+        expired = []
+        with open(self.path, "rb") as src, open(tmp_path, "wb") as out:
+            for key, value in meta.items():
+                frame = self._frame(self.META, key, float("inf"), value.encode("utf-8"))
+                out.write(frame)
+                pos += len(frame)
+            for key, (offset, length, expires_at) in snapshot.items():
+                if expires_at < now:
+                    expired.append((key, (offset, length, expires_at)))
+                    continue
+                src.seek(offset)
+                frame = self._frame(self.ENTRY, key, expires_at, src.read(length))
+                out.write(frame)
+                index[key] = (pos + len(frame) - length, length, expires_at)
+                pos += len(frame)
+                live += len(frame)
+            out.flush()
+            os.fsync(out.fileno())
+
+        with self._lock:
+            # Записи, сделанные во время копирования, лежат после end — переносим их как есть.
+            # fsync не ждём: обычная дозапись его тоже не делает.
+            tail = self._read(end, self._size - end)
+            with open(tmp_path, "ab") as out:
+                out.write(tail)
+            shift = pos - end
+
+            purged = self._drop(expired) if expired else 0
+            for key in self._touched:
+                old = index.pop(key, None)
+                if old is not None:
+                    live -= self._frame_len(key, old[1])
+                current = self._index.get(key)
+                if current is not None:
+                    offset, length, expires_at = current
+                    index[key] = (offset + shift, length, expires_at)
+                    live += self._frame_len(key, length)
+            live += sum(self._frame_len(key, len(value.encode("utf-8"))) for key, value in self._meta.items())
+            self._swap(tmp_path, index, pos + len(tail), live)
+        return purged
+
+    def _swap(self, tmp_path: str, index: dict, size: int, live: int):
+        """Подменяет файл новым. Вызывается под блокировкой."""
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "a+b")
+        self._index, self._size = index, size
+        self._dead = max(0, size - live)
+
+    def clear(self):
+        with self._compact_lock, self._lock:
+            tmp_path = self.path + ".compact"
+            size = 0
+            with open(tmp_path, "wb") as out:
+                for key, value in self._meta.items():
+                    frame = self._frame(self.META, key, float("inf"), value.encode("utf-8"))
+                    out.write(frame)
+                    size += len(frame)
+            self._swap(tmp_path, {}, size, size)
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._meta.get(key)
+
+    def set_meta(self, key: str, value: str):
+        with self._lock:
+            if key in self._meta:
+                self._dead += self._frame_len(key, len(self._meta[key].encode("utf-8")))
+            self._meta[key] = value
+            frame = self._frame(self.META, key, float("inf"), value.encode("utf-8"))
+            self._file.seek(0, os.SEEK_END)
+            self._file.write(frame)
+            self._file.flush()
+            self._size += len(frame)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._index)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class LRUCacheBackend(CacheBackend):
+    """Ограниченный LRU-слой в памяти поверх основного хранилища"""
+
+    def __init__(self, backend: CacheBackend, maxsize: int = 1000):
+        self.backend = backend
+        self.maxsize = maxsize
+        self._front: OrderedDict[str, dict] = OrderedDict()
+        self.evictions = 0
+
+    def _remember(self, key: str, entry: dict):
+        self._front[key] = entry
+        self._front.move_to_end(key)
+        while len(self._front) > self.maxsize:
+            self._front.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self._front.get(key)
+        if entry is not None:
+            self._front.move_to_end(key)
+            return entry
+        entry = self.backend.get(key)
+        if entry is not None:
+            self._remember(key, entry)
+        return entry
+
+    def set(self, key: str, entry: dict):
+        self.backend.set(key, entry)
+        self._remember(key, entry)
+
+    def set_many(self, items: Iterable[tuple[str, dict]]):
+        items = list(items)
+        self.backend.set_many(items)
+        for key, entry in items:
+            self._remember(key, entry)
+
+    def delete(self, key: str):
+        self._front.pop(key, None)
+        self.backend.delete(key)
+
+    def keys(self) -> list[str]:
+        return self.backend.keys()
+
+    def items(self) -> Iterator[tuple[str, dict]]:
+        return self.backend.items()
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        for key in [k for k, e in self._front.items() if e.get("expires_at", 0) < now]:
+            del self._front[key]
+        return self.backend.purge_expired(now)
+
+    def compact(self, now: Optional[float] = None) -> int:
+        # Слой в памяти не трогаем: compact() может выполняться в отдельном потоке
+        return self.backend.compact(now)
+
+    def garbage_ratio(self) -> float:
+        return self.backend.garbage_ratio()
+
+    def clear(self):
+        self._front.clear()
+        self.backend.clear()
+
+    def get_meta(self, key: str) -> Optional[str]:
+        return self.backend.get_meta(key)
+
+    def set_meta(self, key: str, value: str):
+        self.backend.set_meta(key, value)
+
+    def __len__(self) -> int:
+        return len(self.backend)
+
+    def close(self):
+        self._front.clear()
+        self.backend.close()
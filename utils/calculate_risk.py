@@ -1,3 +1,8 @@
+def timed_out_providers(results: dict) -> list[str]:
+    """Провайдеры, не уложившиеся в бюджет проверки"""
+    return [key for key, res in results.items() if isinstance(res, dict) and res.get("status") == "timeout"]
+
+
 def calculate_risk_score(results: dict) -> tuple[str, int, list[str]]:
     """
     Расширенный подсчёт риска:
@@ -66,6 +71,10 @@ def calculate_risk_score(results: dict) -> tuple[str, int, list[str]]:
         score += 15
         reasons.append("🕵️ Подозрение на использование прокси или подозрительного хостинга")
 
+    # 9️⃣ Не все проверки успели ответить — оценка может быть занижена
+    if timed_out_providers(results):
+        reasons.append("⏱ Оценка неполная: часть проверок не успела ответить")
+
     # --- Ограничим максимум ---
     score = min(score, 100)
 
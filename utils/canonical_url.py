@@ -0,0 +1,79 @@
+import re
+from urllib.parse import parse_qsl, quote, urlencode, urlsplit
+
+import idna
+
+from services.link_analyzer import TRACKING_PARAMS
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+# Незарезервированные символы RFC 3986 — их %-кодирование ничего не меняет
+_UNRESERVED_ESCAPE = re.compile(r"%(2[DdEe]|3[0-9]|[46][1-9A-Fa-f]|[57][0-9Aa]|5[Ff]|7[Ee])")
+_ANY_ESCAPE = re.compile(r"%[0-9a-fA-F]{2}")
+
+
+def _is_tracking(name: str) -> bool:
+    """utm_ — префикс, остальные параметры сравниваются целиком"""
+    name = name.lower()
+    return any(name.startswith(tp) if tp.endswith("_") else name == tp for tp in TRACKING_PARAMS)
+
+
+def _normalize_host(host: str) -> str:
+    host = host.lower().rstrip(".")
+    if not host.isascii():
+        try:
+            host = idna.encode(host, uts46=True).decode()
+        except idna.IDNAError:
+            host = host.encode("idna").decode()
+    if host.startswith("www."):
+        host = host[4:]
+    return host
+
+
+def _normalize_escapes(value: str, safe: str) -> str:
+    """Раскодирует незарезервированные символы, остальное кодирует в верхнем регистре"""
+    value = _UNRESERVED_ESCAPE.sub(lambda m: chr(int(m.group(1), 16)), value)
+    value = quote(value, safe=safe + "%")
+    return _ANY_ESCAPE.sub(lambda m: m.group(0).upper(), value)
+
+
+def _normalize_path(path: str) -> str:
+    segments = []
+    for segment in path.split("/"):
+        if segment == "..":
+            if segments:
+                segments.pop()
+        elif segment not in ("", "."):
+            segments.append(segment)
+    return _normalize_escapes("/" + "/".join(segments), safe="/:@!$&'()*+,;=")
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Единый ключ для кэша, объединения запросов и поиска в чёрных списках:
+    регистр схемы и хоста, IDNA, www., порт по умолчанию, завершающий слэш,
+    %-кодирование, трекинговые параметры и фрагмент.
+    """
+    url = url.strip()
+    if "://" not in url:
+        url = f"http://{url}"
+
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = _normalize_host(parts.hostname or "")
+
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    port_part = f":{port}" if port and port != DEFAULT_PORTS.get(scheme) else ""
+
+    path = _normalize_path(parts.path)
+
+    params = [
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _is_tracking(name)
+    ]
+    query = urlencode(sorted(params), quote_via=quote)
+
+    return f"{scheme}://{host}{port_part}{path}{'?' + query if query else ''}"
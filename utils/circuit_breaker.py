@@ -0,0 +1,204 @@
+"""
+Автоматические выключатели (circuit breaker) для внешних сервисов.
+
+Выключатель считает ошибки и медленные ответы за последние BREAKER_WINDOW секунд.
+Когда их доля превышает порог, он размыкается: вызовы сразу завершаются
+CircuitOpenError и не ждут тайм-аута. По истечении паузы пропускается один пробный
+вызов (half-open): удачный замыкает выключатель, неудачный размыкает его снова
+на вдвое большую паузу.
+"""
+import functools
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from utils.metrics import Counter, Gauge
+
+BREAKER_WINDOW = float(os.getenv("BREAKER_WINDOW", 60))  # окно подсчёта, с
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", 5))  # меньше вызовов в окне — не судим
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", 0.5))  # доля неудач для размыкания
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", 30))  # первая пауза, с
+BREAKER_MAX_COOLDOWN = float(os.getenv("BREAKER_MAX_COOLDOWN", 300))
+BREAKER_SLOW_CALL = float(os.getenv("BREAKER_SLOW_CALL", 5))  # ответ дольше — тоже неудача, с
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+_breakers: dict[str, "CircuitBreaker"] = {}
+
+
+class CircuitOpenError(Exception):
+    """Сервис отключён выключателем — вызов не выполнялся"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name}: circuit open, retry in {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, slow_call: Optional[float] = BREAKER_SLOW_CALL):
+        self.name = name
+        self.slow_call = slow_call  # ответ дольше этого считается неудачей; None — не учитывать
+        self.state = CLOSED
+        self._calls: deque[tuple[float, bool]] = deque()  # (время, неудача)
+        self._opened_at = 0.0
+        self._cooldown = BREAKER_COOLDOWN
+        self._probe = False  # пробный вызов в полуоткрытом состоянии уже идёт
+        self.stats = {"short_circuited": 0, "opened": 0}
+
+    def _trim(self, now: float):
+        while self._calls and self._calls[0][0] < now - BREAKER_WINDOW:
+            self._calls.popleft()
+
+    def error_rate(self) -> float:
+        self._trim(time.monotonic())
+        if not self._calls:
+            return 0.0
+        return sum(failed for _, failed in self._calls) / len(self._calls)
+
+    def is_open(self) -> bool:
+        """Разомкнут и пауза ещё не прошла — вызывать бессмысленно"""
+        return self.retry_in() > 0
+
+    def retry_in(self) -> float:
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self._cooldown - time.monotonic())
+
+    def allow(self) -> bool:
+        """Можно ли выполнить вызов. В полуоткрытом состоянии пропускает только один пробный."""
+        if self.state == OPEN and self.retry_in() == 0:
+            self.state = HALF_OPEN
+            print(f"[BREAKER] 🔎 {self.name}: пробный вызов")
+        if self.state == HALF_OPEN:
+            if self._probe:
+                return False
+            self._probe = True
+            return True
+        return self.state == CLOSED
+
+    def record(self, failed: bool, elapsed: float = 0.0):
+        """Итог вызова: неудача — исключение, ответ с ошибкой или дольше slow_call"""
+        if self.slow_call is not None and elapsed > self.slow_call:
+            failed = True
+        now = time.monotonic()
+
+        if self.state == HALF_OPEN:
+            self._probe = False
+            if failed:
+                self._open(now, min(self._cooldown * 2, BREAKER_MAX_COOLDOWN))
+            else:
+                self.state = CLOSED
+                self._cooldown = BREAKER_COOLDOWN
+                self._calls.clear()
+                print(f"[BREAKER] ✅ {self.name}: сервис восстановился")
+            return
+
+        self._calls.append((now, failed))
+        self._trim(now)
+        if self.state == CLOSED and len(self._calls) >= BREAKER_MIN_CALLS and self.error_rate() >= BREAKER_ERROR_RATE:
+            self._open(now, BREAKER_COOLDOWN)
+
+    def _open(self, now: float, cooldown: float):
+        self.state = OPEN
+        self._opened_at = now
+        self._cooldown = cooldown
+        self.stats["opened"] += 1
+        print(f"[BREAKER] ⛔ {self.name}: отключён на {cooldown:.0f} с (неудач {self.error_rate():.0%})")
+
+    def reject(self) -> CircuitOpenError:
+        self.stats["short_circuited"] += 1
+        return CircuitOpenError(self.name, self.retry_in())
+
+    def release(self):
+        """Вызов отменили, не дождавшись итога: он не учитывается, пробный можно повторить"""
+        if self.state == HALF_OPEN:
+            self._probe = False
+
+    @asynccontextmanager
+    async def guard(self):
+        """Обёртка вызова: CircuitOpenError, если выключатель разомкнут, иначе учёт итога"""
+        if not self.allow():
+            raise self.reject()
+        started = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.record(True, time.monotonic() - started)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.record(False, time.monotonic() - started)
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "error_rate": round(self.error_rate(), 2),
+            "retry_in": round(self.retry_in(), 1),
+            **self.stats,
+        }
+
+
+def get_breaker(name: str, slow_call: Optional[float] = BREAKER_SLOW_CALL) -> CircuitBreaker:
+    """Выключатель сервиса; создаётся при первом обращении"""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name, slow_call)
+    return breaker
+
+
+def circuit(name: str, slow_call: Optional[float] = BREAKER_SLOW_CALL):
+    """
+    Декоратор для async-функций провайдеров. Неудача — исключение или ответ со status "error".
+    Отменённый вызов (не дождались) не учитывается.
+    """
+    breaker = get_breaker(name, slow_call)
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not breaker.allow():
+                raise breaker.reject()
+            started = time.monotonic()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception:
+                breaker.record(True, time.monotonic() - started)
+                raise
+            except BaseException:
+                breaker.release()
+                raise
+            failed = isinstance(result, dict) and result.get("status") == "error"
+            breaker.record(failed, time.monotonic() - started)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def get_states() -> dict[str, dict]:
+    """Состояние всех выключателей"""
+    return {name: breaker.snapshot() for name, breaker in _breakers.items()}
+
+
+Gauge(
+    "link_checker_circuit_state", "Состояние выключателя: 0 — замкнут, 1 — пробный вызов, 2 — разомкнут", ("service",)
+).set_function(
+    lambda: {(name,): STATE_VALUES[b.state] for name, b in _breakers.items()}
+)
+Gauge("link_checker_circuit_error_rate", "Доля неудачных вызовов за окно выключателя", ("service",)).set_function(
+    lambda: {(name,): b.error_rate() for name, b in _breakers.items()}
+)
+Counter(
+    "link_checker_circuit_short_circuits_total", "Вызовы, отклонённые разомкнутым выключателем", ("service",)
+).set_function(
+    lambda: {(name,): b.stats["short_circuited"] for name, b in _breakers.items()}
+)
+Counter("link_checker_circuit_opened_total", "Сколько раз выключатель размыкался", ("service",)).set_function(
+    lambda: {(name,): b.stats["opened"] for name, b in _breakers.items()}
+)
@@ -0,0 +1,79 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+
+from utils.metrics import Counter
+
+# Процессов для CPU-тяжёлой работы (разбор HTML). 0 — всё выполняется в event loop.
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+# Сколько задач может ждать пул одновременно; остальные ждут в очереди, не раздувая память
+CPU_MAX_PENDING = int(os.getenv("CPU_MAX_PENDING", CPU_WORKERS * 2))
+# Маленькие страницы быстрее разобрать на месте, чем передавать в другой процесс
+CPU_INLINE_BYTES = int(os.getenv("CPU_INLINE_BYTES", 32 * 1024))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_slots: Optional[asyncio.Semaphore] = None
+_stats = {"pool": 0, "inline": 0, "waited": 0}
+
+Counter("link_checker_cpu_tasks_total", "CPU-задачи: в пуле, в цикле, ожидали свободный слот", ("where",)).set_function(
+    lambda: {(name,): value for name, value in _stats.items()}
+)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: воркеры не наследуют event loop, потоки и сокеты родителя
+        _pool = ProcessPoolExecutor(max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def offloads(size: int) -> bool:
+    """Уйдёт ли задача с входом такого объёма в пул (иначе выполняется прямо в цикле)"""
+    return CPU_WORKERS > 0 and size >= CPU_INLINE_BYTES
+
+
+def count_inline():
+    """Учитывает работу, выполненную в цикле без run_cpu (например, потоковый разбор страницы)"""
+    _stats["inline"] += 1
+
+
+async def run_cpu(func: Callable, *args, size: int = 0):
+    """
+    Выполняет func(*args) в пуле процессов и возвращает результат.
+    Аргументы и результат должны сериализоваться pickle — передавайте байты, а не объекты.
+    size — объём входных данных: меньше CPU_INLINE_BYTES выполняется прямо в цикле.
+    """
+    global _slots, _pool
+    if not offloads(size):
+        _stats["inline"] += 1
+        return func(*args)
+
+    if _slots is None:
+        _slots = asyncio.Semaphore(CPU_MAX_PENDING)
+    if _slots.locked():
+        _stats["waited"] += 1
+
+    async with _slots:
+        try:
+            _stats["pool"] += 1
+            return await asyncio.get_running_loop().run_in_executor(_get_pool(), func, *args)
+        except BrokenProcessPool:
+            # Процесс пула упал (например, OOM) — пересоздадим пул при следующем вызове
+            print("[CPU] ⚠️ Пул процессов сломан, выполняю в цикле")
+            _pool = None
+            return func(*args)
+
+
+def shutdown_cpu_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def get_stats() -> dict:
+    return {"workers": CPU_WORKERS, "max_pending": CPU_MAX_PENDING, **_stats}
@@ -0,0 +1,55 @@
+import os
+from typing import Optional
+
+import aiohttp
+
+from services.dns_resolver import CachedResolver
+
+
+# Лимиты пула соединений
+CONNECTION_LIMIT = int(os.getenv("HTTP_CONNECTION_LIMIT", 100))
+CONNECTION_LIMIT_PER_HOST = int(os.getenv("HTTP_CONNECTION_LIMIT_PER_HOST", 10))
+KEEPALIVE_TIMEOUT = 30
+
+# Профили таймаутов
+API_TIMEOUT = aiohttp.ClientTimeout(total=15, connect=5)
+PAGE_TIMEOUT = aiohttp.ClientTimeout(total=10, connect=5)
+
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def _create_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=CONNECTION_LIMIT,
+        limit_per_host=CONNECTION_LIMIT_PER_HOST,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        # DNS кэшируется в общем резолвере с учётом TTL записей
+        resolver=CachedResolver(),
+        use_dns_cache=False,
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=API_TIMEOUT)
+
+
+async def start_http_client():
+    """Создаёт общий HTTP-клиент (вызывается в on_startup)"""
+    global _session
+    if _session is None or _session.closed:
+        _session = _create_session()
+        print("[HTTP] 🌐 Общий HTTP-клиент создан")
+
+
+async def close_http_client():
+    """Закрывает общий HTTP-клиент (вызывается в on_shutdown)"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+        print("[HTTP] 🔌 Общий HTTP-клиент закрыт")
+    _session = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Возвращает общий HTTP-клиент, создавая его при первом обращении"""
+    global _session
+    if _session is None or _session.closed:
+        _session = _create_session()
+    return _session
@@ -0,0 +1,223 @@
+import asyncio
+import functools
+import os
+import time
+from typing import Callable, Optional
+
+from aiohttp import web
+
+from utils.tracing import record_span
+
+# Порт, на котором отдаются метрики в формате Prometheus. 0 — не запускать.
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# Границы корзин гистограмм задержек, с
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30)
+
+_registry: list["_Metric"] = []
+_runner: Optional[web.AppRunner] = None
+
+
+# =========================
+#   ТИПЫ МЕТРИК
+# =========================
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        self._fn: Optional[Callable] = None
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def set_function(self, fn: Callable):
+        """Значение считается при каждом запросе метрик: fn() -> число или {кортеж меток: число}"""
+        self._fn = fn
+
+    def _samples(self):
+        values = self._values
+        if self._fn is not None:
+            try:
+                collected = self._fn()
+            except Exception as e:
+                print(f"[METRICS] ⚠️ Ошибка сбора {self.name}: {e}")
+                collected = {}
+            values = collected if isinstance(collected, dict) else {(): collected}
+        for key, value in values.items():
+            yield self.name, dict(zip(self.labels, key)), value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self._samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+        # {метки: [счётчики по корзинам..., сумма, количество]}
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def _samples(self):
+        for key, series in self._series.items():
+            labels = dict(zip(self.labels, key))
+            for bound, count in zip(self.buckets, series):
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, count
+            yield f"{self.name}_bucket", {**labels, "le": "+Inf"}, series[-1]
+            yield f"{self.name}_sum", labels, series[-2]
+            yield f"{self.name}_count", labels, series[-1]
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_metrics() -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# =========================
+#   ОБЩИЕ МЕТРИКИ
+# =========================
+
+PROVIDER_LATENCY = Histogram(
+    "link_checker_provider_seconds", "Время ответа провайдера проверки", ("provider",)
+)
+PROVIDER_CALLS = Counter(
+    "link_checker_provider_calls_total", "Вызовы провайдеров по итогу: ok, error, timeout", ("provider", "status")
+)
+PROVIDER_DEADLINE_MISSES = Counter(
+    "link_checker_provider_deadline_misses_total", "Провайдер не уложился в бюджет проверки", ("provider",)
+)
+REQUEST_LATENCY = Histogram(
+    "link_checker_request_seconds", "Обработка сообщения пользователя целиком", ("path",)
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "link_checker_requests_in_progress", "Сообщения, обрабатываемые прямо сейчас"
+)
+CACHE_OPERATIONS = Counter(
+    "link_checker_cache_operations_total", "Обращения к кэшу результатов: hit, stale, miss, expired, set", ("op",)
+)
+
+
+# =========================
+#   ИНСТРУМЕНТИРОВАНИЕ
+# =========================
+
+def instrument(provider: str):
+    """Декоратор для async-функций провайдеров: задержка, итог вызова и span трассировки"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started_at = time.time()
+            started = time.monotonic()
+            status = "ok"
+            try:
+                result = await func(*args, **kwargs)
+                if isinstance(result, dict) and result.get("status") == "error":
+                    status = "error"
+                return result
+            except asyncio.TimeoutError:
+                status = "timeout"
+                raise
+            except asyncio.CancelledError:
+                status = "cancelled"
+                raise
+            except Exception:
+                status = "error"
+                raise
+            finally:
+                elapsed = time.monotonic() - started
+                PROVIDER_LATENCY.observe(elapsed, provider=provider)
+                PROVIDER_CALLS.inc(provider=provider, status=status)
+                record_span(provider, started_at, elapsed, status)
+
+        return wrapper
+
+    return decorator
+
+
+# =========================
+#   HTTP-ЭНДПОИНТ
+# =========================
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(port_offset: int = 0):
+    """
+    Поднимает /metrics в процессе бота, если задан METRICS_PORT.
+    У каждого воркера свои счётчики, поэтому воркер N слушает METRICS_PORT + N.
+    """
+    global _runner
+    if not METRICS_PORT or _runner is not None:
+        return
+    port = METRICS_PORT + port_offset
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, METRICS_HOST, port).start()
+    print(f"[METRICS] 📈 Метрики доступны на http://{METRICS_HOST}:{port}/metrics")
+
+
+async def stop_metrics_server():
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
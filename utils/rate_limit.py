@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Асинхронный token bucket: rate токенов в секунду, не больше capacity в запасе.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self) -> float:
+        """Сколько токенов доступно прямо сейчас"""
+        self._refill()
+        return self._tokens
+
+    async def acquire(self, tokens: float = 1):
+        """Ждёт, пока в ведре наберётся нужное количество токенов, и забирает их"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Забирает токены, только если они есть прямо сейчас, не дожидаясь"""
+        self._refill()
+        if self._tokens < tokens:
+            return False
+        self._tokens -= tokens
+        return True
+
+    def release(self, tokens: float = 1):
+        """Возвращает неиспользованные токены: запрос отменили уже после acquire()"""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + tokens)
@@ -0,0 +1,299 @@
+import html
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from utils.calculate_risk import calculate_risk_score, timed_out_providers
+
+
+PROVIDER_NAMES = {
+    "google": "Google Safe Browsing",
+    "vt": "VirusTotal",
+    "blacklist": "Blacklists",
+    "infra": "Infrastructure",
+    "link_analysis": "Link Analysis",
+}
+
+PROVIDER_ICONS = {
+    "google": "🧭",
+    "vt": "🧪",
+    "blacklist": "🚨",
+    "infra": "🌐",
+    "link_analysis": "🔍",
+}
+
+
+def build_progress(url: str, done: dict) -> str:
+    """Промежуточное сообщение: какие проверки уже готовы, а какие ещё идут"""
+    lines = [f"🔗 <b>Проверка ссылки:</b> <code>{html.escape(url)}</code>\n"]
+    for key, name in PROVIDER_NAMES.items():
+        if key not in done:
+            lines.append(f"⏳ {name}: проверяется...")
+        else:
+            # У расширенных проверок нет общего статуса — достаточно отметки о готовности
+            lines.append(f"{PROVIDER_ICONS[key]} {name}: {done[key].get('status', 'готово')}")
+    lines.append(f"\n⏱ Готово {len(done)} из {len(PROVIDER_NAMES)}")
+    return "\n".join(lines)
+
+
+LEVEL_ICONS = {"низкий": "🟩", "средний": "🟨", "высокий": "🟥"}
+
+# Форматы вывода и языки. Интерфейс бота пока только на русском — остальные языки падают на него.
+FORMATS = ("html", "text", "summary", "json")
+DEFAULT_LOCALE = "ru"
+LOCALES = ("ru",)
+
+# Готовые тексты: {(url, updated_at, формат, язык): текст}
+RENDER_CACHE_SIZE = 1000
+_rendered: OrderedDict = OrderedDict()
+
+
+# =========================
+#   ЗАПИСЬ РЕЗУЛЬТАТА
+# =========================
+
+def _compact(key: str, res: dict) -> dict:
+    """Оставляет от ответа провайдера только то, что нужно для отчёта и оценки риска"""
+    details = res.get("details")
+    if key == "google" and isinstance(details, list):
+        # Из совпадений Google нужны только типы угроз
+        threats = {m.get("threatType", "UNKNOWN") if isinstance(m, dict) else m for m in details}
+        return {**res, "details": sorted(threats)}
+    if key == "vt" and res.get("status") == "submitted" and isinstance(details, dict) and "data" in details:
+        # Ответ на отправку целиком не нужен — достаточно id анализа
+        return {**res, "details": {"analysis_id": (details["data"] or {}).get("id")}}
+    return res
+
+
+@dataclass(frozen=True, slots=True)
+class CheckRecord:
+    """
+    Результат проверки ссылки — единственное, что хранится в кэше.
+    Отчёты в любом формате строятся из него по запросу.
+    """
+    url: str
+    results: dict
+    checked_at: float
+    updated_at: float = field(default=0.0)
+
+    @classmethod
+    def create(cls, url: str, results: dict) -> "CheckRecord":
+        now = time.time()
+        return cls(url=url, results=_normalize(results), checked_at=now, updated_at=now)
+
+    def with_result(self, key: str, res: dict) -> "CheckRecord":
+        """Новая запись с подменённым результатом одного провайдера"""
+        results = {**self.results, key: _compact(key, res)}
+        return CheckRecord(url=self.url, results=results, checked_at=self.checked_at, updated_at=time.time())
+
+    def to_dict(self) -> dict:
+        return {"url": self.url, "results": self.results, "checked_at": self.checked_at, "updated_at": self.updated_at}
+
+    @classmethod
+    def from_dict(cls, data: dict, url: Optional[str] = None, timestamp: float = 0.0) -> "CheckRecord":
+        """Из кэша. Старые записи ({"report", "results"}) без url и времени тоже читаются."""
+        checked_at = data.get("checked_at", timestamp)
+        return cls(
+            url=data.get("url") or url or "",
+            results=_normalize(data["results"]),
+            checked_at=checked_at,
+            updated_at=data.get("updated_at", checked_at),
+        )
+
+
+def _circuit_open(details) -> bool:
+    """Провайдер не вызывался: его выключатель был разомкнут (см. utils/circuit_breaker.py)"""
+    return isinstance(details, dict) and details.get("circuit") == "open"
+
+
+def _normalize(results: dict) -> dict:
+    """Все провайдеры на месте (недостающие — unknown), ответы ужаты"""
+    normalized = {}
+    for key in PROVIDER_NAMES:
+        res = results.get(key)
+        normalized[key] = _compact(key, res) if isinstance(res, dict) else {"status": "unknown", "details": None}
+    return normalized
+
+
+# =========================
+#   ОТРИСОВКА
+# =========================
+
+def render(record: CheckRecord, fmt: str = "html", locale: str = DEFAULT_LOCALE) -> str:
+    """Отчёт в нужном формате; готовый текст запоминается, пока запись не изменилась"""
+    if locale not in LOCALES:
+        locale = DEFAULT_LOCALE
+    key = (record.url, record.updated_at, fmt, locale)
+    text = _rendered.get(key)
+    if text is not None:
+        _rendered.move_to_end(key)
+        return text
+
+    if fmt == "html":
+        text = _render_html(record.url, record.results)
+    elif fmt == "text":
+        text = _render_text(record)
+    elif fmt == "summary":
+        text = _render_summary(record)
+    elif fmt == "json":
+        text = _render_json(record)
+    else:
+        raise ValueError(f"Неизвестный формат отчёта: {fmt}")
+
+    _rendered[key] = text
+    while len(_rendered) > RENDER_CACHE_SIZE:
+        _rendered.popitem(last=False)
+    return text
+
+
+def _render_text(record: CheckRecord) -> str:
+    """Короткий текстовый отчёт без разметки — для логов и пакетной проверки"""
+    results = record.results
+    level, score, reasons = calculate_risk_score(results)
+    lines = [
+        f"🔗 Проверка ссылки: {record.url}",
+        "",
+        *(f"{PROVIDER_ICONS[key]} {PROVIDER_NAMES[key]}: {results[key]['status']}" for key in ("google", "vt", "blacklist")),
+        "",
+        f"⚠️ Уровень риска: {level.upper()} ({score} баллов)",
+    ]
+    if reasons:
+        lines += ["", "📋 Причины начисления:", *(f"• {r}" for r in reasons)]
+    return "\n".join(lines)
+
+
+def _render_summary(record: CheckRecord) -> str:
+    """Одна строка: уровень, баллы и ссылка"""
+    level, score, _ = calculate_risk_score(record.results)
+    return f"{LEVEL_ICONS.get(level, '⬜')} {score:>3}/100  {record.url}"
+
+
+def _render_json(record: CheckRecord) -> str:
+    level, score, reasons = calculate_risk_score(record.results)
+    return json.dumps(
+        {**record.to_dict(), "level": level, "score": score, "reasons": reasons},
+        ensure_ascii=False,
+        default=str,
+    )
+
+
+def _render_html(url: str, results: dict) -> str:
+    """Формирует HTML-отчёт по результатам проверок"""
+    safe_url = html.escape(url)
+
+    google_res = results["google"]
+    vt_res = results["vt"]
+    bl_res = results["blacklist"]
+    infra = results["infra"]
+    link_info = results["link_analysis"]
+
+    # Если хоть один сервис не сработал — помечаем пользователю
+    unavailable = [
+        f"{name} (⛔ отключён после сбоев)" if _circuit_open(results[key].get("details")) else name
+        for key, name in PROVIDER_NAMES.items()
+        if results[key].get("status") == "error"
+    ]
+    if _circuit_open(results["infra"].get("ip_info")):
+        unavailable.append("ipapi.co (⛔ отключён после сбоев)")
+    if _circuit_open(results["infra"].get("whois")):
+        unavailable.append("RDAP/WHOIS (⛔ отключён после сбоев)")
+    timed_out = [PROVIDER_NAMES[key] for key in timed_out_providers(results)]
+
+    # 🔎 Подсчёт риска
+    level, score, reasons = calculate_risk_score(results)
+
+    # 🌈 Прогресс-бар риска
+    filled = int(score / 10)
+    bar = (
+        "🟩" * min(filled, 3)
+        + "🟨" * max(0, filled - 3 if filled <= 7 else 4)
+        + "🟥" * max(0, filled - 7)
+    ).ljust(10, "⬜")
+
+    # 🧾 Формируем отчёт
+    ssl_info = infra.get("ssl_info", {})
+    ip_info = infra.get("ip_info", {})
+    whois = infra.get("whois", {})
+
+
+
+    text = (
+        f"🔗 <b>Проверка ссылки:</b> <code>{safe_url}</code>\n\n"
+        f"🧭 Google Safe Browsing: {google_res['status']}\n"
+        f"🧪 VirusTotal: {vt_res['status']}\n"
+        f"🚨 Blacklists: {bl_res['status']}\n\n"
+        f"⚠️ <b>Уровень риска:</b> <b>{level.upper()}</b>\n"
+        f"📊 <b>Баллы:</b> {score}/100{' (неполная оценка)' if timed_out else ''}\n"
+        f"{bar}\n\n"
+    )
+
+    if unavailable:
+        text += f"⚠️ <b>Недоступны сервисы:</b> {', '.join(unavailable)}\n\n"
+
+    if timed_out:
+        text += f"⏱ <b>Не успели ответить:</b> {', '.join(timed_out)} — результат обновится в кэше\n\n"
+
+    if reasons:
+        text += "💡 <b>Причины начисления баллов:</b>\n"
+        for r in reasons:
+            text += f"• {r}\n"
+        text += "\n"
+
+    text += (
+        f"🌐 <b>Инфраструктура сайта:</b>\n"
+        f"🏠 Домен: <code>{infra.get('hostname', 'N/A')}</code>\n"
+        f"🔒 HTTPS: {'Да' if infra.get('is_https') else 'Нет'}\n"
+    )
+
+    # SSL
+    if ssl_info.get("valid"):
+        text += (
+            f"📜 Сертификат выдан: <b>{ssl_info.get('issued_by', 'N/A')}</b>\n"
+            f"📅 Действителен до: <code>{ssl_info.get('valid_to', 'N/A')}</code>\n"
+            f"🕐 Осталось дней: <code>{ssl_info.get('days_left', 'N/A')}</code>\n"
+        )
+    else:
+        text += f"⚠️ SSL: {ssl_info.get('error', 'Нет данных')}\n"
+
+    # IP и хостинг
+    text += (
+        f"\n🌍 <b>Хостинг:</b>\n"
+        f"🧩 IP: <code>{ip_info.get('ip', 'неизвестен')}</code>\n"
+        f"🏳️ Страна: {ip_info.get('country', 'Unknown')}\n"
+        f"🏢 Организация: {ip_info.get('org', 'Unknown')}\n"
+        f"🛰 ASN: {ip_info.get('asn', 'Unknown')}\n"
+        f"📦 CDN: {infra.get('cdn', 'Не определён')}\n"
+    )
+
+    if infra.get("proxy_suspect"):
+        text += "\n🚨 <b>Обнаружены признаки прокси или подозрительного хостинга</b>\n"
+    else:
+        text += "\n✅ Признаков прокси или подозрительного хостинга не найдено\n"
+
+    # WHOIS
+    text += (
+        f"\n📖 <b>Данные о домене:</b>\n"
+        f"🗓 Дата регистрации: {whois.get('created', 'Unknown')}\n"
+        f"🏢 Регистратор: {whois.get('registrar', 'Unknown')}\n"
+        f"📆 Возраст домена: {whois.get('age_days', 'N/A')} дней (~{whois.get('age_years', 0)} лет)\n"
+        f"🕐 Срок действия до: {whois.get('expires', 'Unknown')}\n"
+        f"🧭 Риск: {whois.get('freshness', 'N/A')} (риск: {whois.get('risk', 'N/A')})\n"
+    )
+
+    # Аналитика
+    text += "\n🔍 <b>Аналитика ссылки:</b>\n"
+    if link_info.get("masked_domain"):
+        text += f"{link_info['masked_domain']}\n"
+    if link_info.get("is_punycode"):
+        text += "⚠️ Домен использует <b>Punycode</b> (возможная подмена символов)\n"
+    text += f"🔁 Редиректов: {link_info.get('redirect_count', 0)}\n"
+    text += f"🪟 Iframe: {link_info.get('iframe_count', 0)}\n"
+    text += f"🔗 Внутренние ссылки: {link_info.get('internal_links', 0)}, внешние: {link_info.get('external_links', 0)}\n"
+    if link_info.get("tracking_params"):
+        text += f"📊 Трекинговые параметры: {', '.join(link_info['tracking_params'])}\n"
+    if link_info.get("risk_flags"):
+        text += f"⚠️ Подозрительные признаки: {', '.join(link_info['risk_flags'])}\n"
+
+    return text
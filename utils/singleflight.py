@@ -0,0 +1,92 @@
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+from utils.metrics import Counter, Gauge
+
+# Выполняющиеся проверки: {ключ кэша: задача}
+_inflight: dict[str, asyncio.Task] = {}
+
+_stats = {
+    "started": 0,    # сколько проверок реально запущено
+    "coalesced": 0,  # сколько запросов присоединились к уже идущей проверке
+    "shared": 0,     # сколько результатов получено от проверки в другом воркере
+}
+
+# Общий режим для нескольких воркеров: аренда ключа в общей базе и чтение результата из общего кэша
+LEASE_TTL = 60
+LEASE_POLL_INTERVAL = 0.5
+_leases = None
+_shared_lookup: Optional[Callable[[str, float], Optional[object]]] = None
+_owner = str(os.getpid())
+
+Gauge("link_checker_inflight_checks", "Проверки, выполняющиеся прямо сейчас").set_function(lambda: len(_inflight))
+Counter("link_checker_singleflight_total", "Запуски проверок и присоединения к идущим", ("result",)).set_function(
+    lambda: {(name,): value for name, value in _stats.items()}
+)
+
+
+async def run_once(key: str, factory: Callable[[], Awaitable]):
+    """
+    Запускает factory() один раз на ключ.
+    Параллельные вызовы с тем же ключом ждут ту же задачу и получают тот же результат.
+    """
+    task = _inflight.get(key)
+    if task is not None:
+        _stats["coalesced"] += 1
+        print(f"[SINGLEFLIGHT] 🔗 {key} — присоединились к текущей проверке")
+    else:
+        task = asyncio.ensure_future(factory() if _leases is None else _run_shared(key, factory))
+        _inflight[key] = task
+        _stats["started"] += 1
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+
+    # shield: отмена одного ожидающего не отменяет проверку для остальных
+    return await asyncio.shield(task)
+
+
+def configure_shared(leases, lookup: Callable[[str, float], Optional[object]]):
+    """
+    Включает объединение запросов между процессами.
+    leases — SQLiteLeaseTable в общем файле, lookup(key, since) — результат из общего кэша,
+    записанный не раньше since (старая запись — не ответ на текущую проверку).
+    """
+    global _leases, _shared_lookup, _owner
+    _leases = leases
+    _shared_lookup = lookup
+    # После fork у воркера свой pid
+    _owner = str(os.getpid())
+
+
+async def _run_shared(key: str, factory: Callable[[], Awaitable]):
+    """Проверку выполняет тот воркер, что взял аренду; остальные ждут её результат в общем кэше"""
+    since = time.time()
+    while True:
+        if _leases.acquire(key, _owner, LEASE_TTL):
+            try:
+                return await factory()
+            finally:
+                _leases.release(key, _owner)
+
+        await asyncio.sleep(LEASE_POLL_INTERVAL)
+        result = _shared_lookup(key, since)
+        if result is not None:
+            _stats["shared"] += 1
+            return result
+        # Аренда освобождена без результата или истекла — следующая итерация заберёт её себе
+
+
+def is_running(key: str) -> bool:
+    """Идёт ли сейчас проверка по ключу в этом процессе"""
+    return key in _inflight
+
+
+def inflight_count() -> int:
+    """Количество проверок, выполняющихся прямо сейчас"""
+    return len(_inflight)
+
+
+def get_stats() -> dict:
+    """Счётчики объединения запросов"""
+    return {**_stats, "inflight": len(_inflight)}
@@ -1,7 +1,11 @@
 import asyncio
 import datetime
+import os
+from typing import Callable
 
-from utils.cache import refresh_cache
+from utils.cache import compact_cache, refresh_cache
+
+CACHE_COMPACT_INTERVAL = int(os.getenv("CACHE_COMPACT_INTERVAL", 60 * 60))
 
 
 async def schedule_cache_refresh():
@@ -16,3 +20,28 @@ async def schedule_cache_refresh():
         await asyncio.sleep(seconds_until_midnight)
         print("[TASKS] 🕛 Обновление кэша в 00:00...")
         await refresh_cache()
+
+
+async def schedule_cache_compaction():
+    """Фоновая задача: раз в CACHE_COMPACT_INTERVAL убирает устаревшие записи и сжимает хранилище"""
+    while True:
+        await asyncio.sleep(CACHE_COMPACT_INTERVAL)
+        try:
+            purged = await compact_cache()
+            if purged:
+                print(f"[TASKS] 🧹 Из кэша удалено устаревших записей: {purged}")
+        except Exception as e:
+            print(f"[TASKS] ⚠️ Ошибка сжатия кэша: {e}")
+
+
+async def follow_file(path: str, reload: Callable[[], None], interval: float = 300):
+    """Фоновая задача: перечитывает файл, когда его обновил другой процесс"""
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    while True:
+        await asyncio.sleep(interval)
+        if not os.path.exists(path):
+            continue
+        current = os.path.getmtime(path)
+        if current != mtime:
+            mtime = current
+            reload()
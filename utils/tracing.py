@@ -0,0 +1,59 @@
+import contextvars
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Optional
+
+# Файл JSONL для span'ов трассировки. Пусто — трассировка выключена.
+TRACE_LOG = os.getenv("TRACE_LOG", "")
+
+# Идентификатор текущего запроса; наследуется задачами, созданными внутри него
+_trace_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("trace_id", default=None)
+_trace_file = None
+
+
+def _write(span: dict):
+    global _trace_file
+    if _trace_file is None:
+        _trace_file = open(TRACE_LOG, "a", encoding="utf-8", buffering=1)
+    _trace_file.write(json.dumps(span, ensure_ascii=False, default=str) + "\n")
+
+
+def record_span(name: str, started_at: float, duration: float, status: str = "ok", **attrs):
+    """Записывает один span, если трассировка включена и идёт запрос"""
+    trace_id = _trace_id.get()
+    if not TRACE_LOG or trace_id is None:
+        return
+    try:
+        _write({
+            "trace_id": trace_id,
+            "name": name,
+            "start": round(started_at, 6),
+            "duration": round(duration, 6),
+            "status": status,
+            **attrs,
+        })
+    except OSError as e:
+        print(f"[TRACE] ⚠️ Ошибка записи трассировки: {e}")
+
+
+@contextmanager
+def start_trace(name: str, **attrs):
+    """
+    Корневой span запроса. Возвращает словарь атрибутов — его можно дополнять внутри блока.
+    Все instrument-вызовы внутри блока попадают в тот же trace_id.
+    """
+    token = _trace_id.set(uuid.uuid4().hex)
+    started_at = time.time()
+    started = time.monotonic()
+    status = "ok"
+    try:
+        yield attrs
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        record_span(name, started_at, time.monotonic() - started, status, **attrs)
+        _trace_id.reset(token)
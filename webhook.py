@@ -0,0 +1,137 @@
+"""
+Запуск бота через webhook на aiohttp, в том числе несколькими процессами.
+
+    WEBHOOK_URL=https://bot.example.com WEB_WORKERS=4 python webhook.py
+
+Родительский процесс один раз регистрирует webhook в Telegram, открывает порт
+и запускает WEB_WORKERS воркеров (fork), которые принимают соединения с общего сокета.
+Кэш результатов общий (SQLite), одинаковые ссылки в разных воркерах проверяются
+один раз через аренду ключа. Для разработки остаётся polling: python bot.py
+"""
+import asyncio
+import os
+import signal
+import socket
+import sys
+
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from bot import bot, dp
+from services.virustotal import set_quota_share
+from utils.cache import CACHE_DB, peek_cache_entry, use_shared_storage
+from utils.cache_backends import SQLiteLeaseTable
+from utils.report import CheckRecord
+from utils.singleflight import configure_shared
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # публичный адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.getenv("WEB_PORT", 8080))
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", 1))
+
+
+async def register_webhook():
+    """Сообщает Telegram адрес webhook. Выполняется один раз, до запуска воркеров."""
+    await bot.set_webhook(
+        f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+        drop_pending_updates=True,
+    )
+    # Сессия бота привязана к текущему циклу — воркеры откроют свою
+    await bot.session.close()
+    print(f"[WEBHOOK] 🔗 Webhook установлен: {WEBHOOK_URL}{WEBHOOK_PATH}")
+
+
+def shared_lookup(cache_key: str, since: float):
+    """Результат, который другой воркер записал в общий кэш после since — начала ожидания"""
+    entry = peek_cache_entry(cache_key)
+    if entry is None or entry["timestamp"] < since:
+        return None
+    return CheckRecord.from_dict(entry["data"], url=cache_key, timestamp=entry["timestamp"])
+
+
+def open_socket() -> socket.socket:
+    """Общий слушающий сокет: воркеры наследуют его при fork и принимают соединения по очереди"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((WEB_HOST, WEB_PORT))
+    sock.listen(1024)
+    sock.setblocking(False)
+    return sock
+
+
+async def serve(sock: socket.socket, worker_id: int, workers: int = 1):
+    """Один воркер: aiohttp-приложение с обработчиком webhook на общем сокете"""
+    if workers > 1:
+        use_shared_storage()
+        configure_shared(SQLiteLeaseTable(CACHE_DB), shared_lookup)
+        set_quota_share(workers)
+    dp["worker_id"] = worker_id
+
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.SockSite(runner, sock).start()
+    print(f"[WEBHOOK] ✅ Воркер {worker_id} (pid {os.getpid()}) слушает {WEB_HOST}:{WEB_PORT}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+
+
+def run_workers(sock: socket.socket):
+    """Запускает воркеры и ждёт их завершения; SIGTERM/SIGINT передаётся всем"""
+    children = []
+    for worker_id in range(WEB_WORKERS):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                asyncio.run(serve(sock, worker_id, WEB_WORKERS))
+            except Exception as e:
+                print(f"[WEBHOOK] ❌ Воркер {worker_id} упал: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        children.append(pid)
+
+    def forward(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+
+    for pid in children:
+        os.waitpid(pid, 0)
+
+
+def main():
+    if not WEBHOOK_URL:
+        sys.exit("WEBHOOK_URL не задан. Для локального запуска используйте python bot.py")
+
+    asyncio.run(register_webhook())
+    sock = open_socket()
+
+    if WEB_WORKERS <= 1 or not hasattr(os, "fork"):
+        asyncio.run(serve(sock, 0))
+    else:
+        run_workers(sock)
+
+
+if __name__ == "__main__":
+    main()